@@ -1,10 +1,6 @@
 import streamlit as st
-import requests
-import geopandas as gpd
-import tempfile
-import os
 from shapely.geometry import Point
-from pyproj import Transformer
+from afecciones import geometrias, parcelas, recursos, red
 
 # === REDIRECCIÓN INMEDIATA AL PRINCIPIO DEL SCRIPT ===
 if st.session_state.get("_redirect") == "carm":
@@ -14,45 +10,12 @@ elif st.session_state.get("_redirect") == "jccm":
 
 # ===================== CONFIGURACIÓN =====================
 st.set_page_config(page_title="Afecciones CARM · JCCM", layout="centered")
-st.image("https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/logos.jpg", width=280)
+st.image(recursos.logo_ui(), width=280)
 st.title("Informe básico de Afecciones al medio")
 st.markdown("---")
 
-BASE_URL_CLM = "https://raw.githubusercontent.com/iberiaforestal/CATASTRO_JCCM/master/CATASTRO/"
 PROVINCIAS = ["ALBACETE", "CIUDAD REAL", "CUENCA", "GUADALAJARA", "TOLEDO"]
 
-# ===================== FUNCIÓN CARGAR SHAPEFILE CLM (MEJORADA CON LOGS) =====================
-@st.cache_data(ttl=3600)
-def cargar_parcelario_clm(provincia: str, municipio: str):
-    base = f"{BASE_URL_CLM}{provincia}/{municipio.upper()}/PARCELA"
-    st.info(f"Intentando cargar parcelario de {municipio.upper()} ({provincia})...")  # Log temporal
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        exts = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
-        paths = {}
-        for ext in exts:
-            url = base + ext
-            try:
-                r = requests.get(url, timeout=60)  # Timeout más largo
-                if r.status_code == 404:
-                    st.error(f"Archivo no encontrado: {url} (404 - Verifica si el shapefile está subido)")
-                    return None
-                r.raise_for_status()
-                path = os.path.join(tmpdir, "PARCELA" + ext)
-                with open(path, "wb") as f:
-                    f.write(r.content)
-                paths[ext] = path
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error descargando {url}: {str(e)}")
-                return None
-        try:
-            gdf = gpd.read_file(paths[".shp"]).to_crs(epsg=25830)
-            st.success(f"Parcelario cargado correctamente ({len(gdf)} parcelas)")
-            return gdf
-        except Exception as e:
-            st.error(f"Error leyendo shapefile: {str(e)}")
-            return None
-
 # ===================== INICIO =====================
 comunidad = st.selectbox("Comunidad Autónoma", ["Región de Murcia", "Castilla-La Mancha"])
 
@@ -60,11 +23,15 @@ provincia = None
 if comunidad == "Castilla-La Mancha":
     provincia = st.selectbox("Provincia", PROVINCIAS)
 
-modo = st.radio("Modo de selección", ["Por polígono y parcela", "Por coordenadas"], horizontal=True)
+modo = st.radio(
+    "Modo de selección", ["Por polígono y parcela", "Por coordenadas", "Por geometría del proyecto"], horizontal=True
+)
 
 # ===================== VARIABLES QUE SE PASARÁN =====================
 x = y = poligono = parcela = municipio_final = None
+finca = []
 gdf_parcela = None
+geometria_wkb = None
 
 if modo == "Por polígono y parcela":
     # ------------------- MURCIA -------------------
@@ -86,7 +53,7 @@ if modo == "Por polígono y parcela":
         with st.spinner(f"Cargando municipios de {provincia}..."):
             api_url = f"https://api.github.com/repos/iberiaforestal/CATASTRO_JCCM/contents/CATASTRO/{provincia}"
             try:
-                response = requests.get(api_url, timeout=15)
+                response = red.get(api_url)
                 response.raise_for_status()
                 items = response.json()
                 municipios = sorted([item["name"] for item in items if item["type"] == "dir"], key=str.lower)
@@ -103,33 +70,42 @@ if modo == "Por polígono y parcela":
     # Cargar parcelario y seleccionar polígono/parcela
     if municipio:
         with st.spinner("Cargando parcelario (puede tardar unos segundos)..."):
-            if comunidad == "Región de Murcia":
-                # Código de Murcia sin cambios (funciona perfecto)
-                url_shp = f"https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/CATASTRO/{municipio_final}.shp"
-                try:
-                    gdf = gpd.read_file(url_shp).to_crs(epsg=25830)
-                except:
-                    st.error("Error cargando parcelario de Murcia")
-                    st.stop()
-            else:
-                gdf = cargar_parcelario_clm(provincia, municipio_final)  # Tu función mejorada con logs
+            # Misma caché que las páginas del informe: allí ya no se vuelve a descargar
+            try:
+                if comunidad == "Región de Murcia":
+                    gdf = parcelas.parcelario("carm", municipio_final)
+                else:
+                    gdf = parcelas.parcelario("jccm", municipio_final, provincia=provincia)
+            except parcelas.ParcelarioNoDisponible:
+                gdf = None
         if gdf is not None and len(gdf) > 0:
-            poligono = st.selectbox("Polígono", sorted(gdf["MASA"].unique()))
-            parcela = st.selectbox("Parcela", sorted(gdf[gdf["MASA"] == poligono]["PARCELA"].unique()))
-       
-            seleccion = gdf[(gdf["MASA"] == poligono) & (gdf["PARCELA"] == parcela)]
-            if not seleccion.empty:
-                centroide = seleccion.geometry.centroid.iloc[0]
-                x, y = round(centroide.x, 2), round(centroide.y, 2)
-                gdf_parcela = seleccion
-                st.success(f"Parcela seleccionada → X: {x:,} | Y: {y:,}".replace(",", "."))
-            else:
-                st.error("No se pudo seleccionar la parcela. Verifica los datos.")
+            # Una finca puede tener varias parcelas, incluso de polígonos distintos
+            poligonos = st.multiselect("Polígonos", sorted(gdf["MASA"].unique()))
+            opciones = sorted(
+                (masa, parcela) for masa, parcela in zip(gdf["MASA"], gdf["PARCELA"]) if masa in poligonos
+            )
+            finca = st.multiselect(
+                "Parcelas de la finca", list(dict.fromkeys(opciones)),
+                format_func=lambda par: f"Pol {par[0]} · Parcela {par[1]}" if len(poligonos) > 1 else str(par[1]),
+            )
+
+            if finca:
+                seleccion, geometria = parcelas.geometria_finca(gdf, finca, 0, 0)
+                if seleccion is not None:
+                    centroide = geometria.centroid
+                    x, y = round(centroide.x, 2), round(centroide.y, 2)
+                    gdf_parcela = seleccion
+                    poligono, parcela = parcelas.etiqueta_finca(finca)
+                    st.success(
+                        f"{len(seleccion)} parcela(s) seleccionada(s) → X: {x:,} | Y: {y:,}".replace(",", ".")
+                    )
+                else:
+                    st.error("No se pudo seleccionar la parcela. Verifica los datos.")
         else:
             st.error("No se pudo cargar el parcelario. Verifica que PARCELA.shp esté subido en el repo GitHub para este municipio.")
 
 # ===================== BÚSQUEDA POR COORDENADAS =====================
-else:
+elif modo == "Por coordenadas":
     col1, col2 = st.columns(2)
     with col1:
         x = st.number_input("X (ETRS89 UTM 30N)", value=660000.0, format="%.2f")
@@ -148,27 +124,29 @@ else:
                             "SANTOMERA","SAN_JAVIER","SAN_PEDRO_DEL_PINATAR","TORRE_PACHECO","TOTANA","ULEA",
                             "VILLANUEVA_DEL_RIO_SEGURA","YECLA"]:
                     try:
-                        url = f"https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/CATASTRO/{mun}.shp"
-                        gdf_temp = gpd.read_file(url).to_crs(epsg=25830)
-                        if gdf_temp.contains(punto).any():
-                            fila = gdf_temp[gdf_temp.contains(punto)].iloc[0]
-                            municipio_final = mun
-                            poligono = fila["MASA"]
-                            parcela = fila["PARCELA"]
-                            encontrado = True
-                            break
-                    except:
+                        gdf_temp = parcelas.parcelario("carm", mun)
+                    except parcelas.ParcelarioNoDisponible:
                         continue
+                    if gdf_temp.contains(punto).any():
+                        fila = gdf_temp[gdf_temp.contains(punto)].iloc[0]
+                        municipio_final = mun
+                        poligono = fila["MASA"]
+                        parcela = fila["PARCELA"]
+                        encontrado = True
+                        break
         else:  # Castilla-La Mancha
             with st.spinner(f"Buscando en la provincia de {provincia}..."):
                 api_url = f"https://api.github.com/repos/iberiaforestal/CATASTRO_JCCM/contents/CATASTRO/{provincia}"
                 try:
-                    items = requests.get(api_url, timeout=15).json()
+                    items = red.get(api_url).json()
                     for item in items:
                         if item["type"] == "dir":
                             mun = item["name"]
-                            gdf_temp = cargar_parcelario_clm(provincia, mun)
-                            if gdf_temp is not None and gdf_temp.contains(punto).any():
+                            try:
+                                gdf_temp = parcelas.parcelario("jccm", mun, provincia=provincia)
+                            except parcelas.ParcelarioNoDisponible:
+                                continue
+                            if gdf_temp.contains(punto).any():
                                 fila = gdf_temp[gdf_temp.contains(punto)].iloc[0]
                                 municipio_final = mun
                                 poligono = fila["MASA"]
@@ -192,20 +170,52 @@ else:
         else:
             st.error("No se encontró ninguna parcela en esas coordenadas")
 
+# ===================== GEOMETRÍA APORTADA (HUELLA DEL PROYECTO) =====================
+else:
+    municipio_final = st.text_input("Municipio / emplazamiento del proyecto")
+    origen = st.radio("Origen de la geometría", ["Subir fichero", "Pegar coordenadas"], horizontal=True)
+    geometria = None
+    try:
+        if origen == "Subir fichero":
+            fichero = st.file_uploader(
+                "Polígono del proyecto (GeoJSON, KML/KMZ, GeoPackage o shapefile comprimido en .zip)",
+                type=[ext.lstrip(".") for ext in geometrias.EXTENSIONES],
+            )
+            if fichero is not None:
+                with st.spinner("Validando la geometría..."):
+                    geometria = geometrias.leer_fichero(fichero, fichero.name)
+        else:
+            texto = st.text_area(
+                "GeoJSON, WKT o un vértice «X Y» por línea (ETRS89 UTM 30N o lon/lat WGS84)", height=150
+            )
+            if texto.strip():
+                geometria = geometrias.leer_texto(texto)
+    except ValueError as e:
+        st.error(str(e))
+
+    if geometria is not None:
+        x, y = geometrias.punto_referencia(geometria)
+        geometria_wkb = geometrias.a_sesion(geometria)
+        poligono, parcela = "-", "Geometría aportada"
+        st.success(f"Geometría válida ({geometria.area / 10000:.2f} ha) → X: {x:,} | Y: {y:,}".replace(",", "."))
+        if not municipio_final:
+            st.info("Indica el municipio o emplazamiento para el informe.")
+
 # ===================== BOTÓN FINAL QUE REDIRIGE =====================
 st.markdown("---")
 
 # Detectamos si tenemos datos (ya sea por selección manual o por coordenadas)
-datos_listos = (x and y and poligono and parcela) or st.session_state.get("found_x")
+datos_listos = (x and y and poligono and parcela and municipio_final) or st.session_state.get("found_x")
 
 if datos_listos:
     # Si vinieron por coordenadas, usamos esos datos
-    if st.session_state.get("found_x"):
+    if st.session_state.get("found_x") and geometria_wkb is None:
         x = st.session_state.found_x
         y = st.session_state.found_y
         poligono = st.session_state.found_poligono
         parcela = st.session_state.found_parcela
         municipio_final = st.session_state.found_municipio
+        finca = [(poligono, parcela)]
 
     col1, col2, col3 = st.columns([1,1,1])
     with col2:
@@ -218,6 +228,8 @@ if datos_listos:
                     "municipio": municipio_final,
                     "poligono": poligono,
                     "parcela": parcela,
+                    "parcelas_finca": finca,
+                    "geometria_wkb": geometria_wkb,
                     "x": x,
                     "y": y
                 })
@@ -232,6 +244,8 @@ if datos_listos:
                     "municipio": municipio_final,
                     "poligono": poligono,
                     "parcela": parcela,
+                    "parcelas_finca": finca,
+                    "geometria_wkb": geometria_wkb,
                     "x": x,
                     "y": y
                 })
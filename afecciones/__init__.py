@@ -0,0 +1 @@
+"""Motor de consulta de afecciones compartido por las páginas CARM y JCCM."""
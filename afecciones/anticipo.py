@@ -0,0 +1,87 @@
+"""
+Cálculo anticipado del informe mientras el solicitante rellena el formulario.
+
+La parcela y las coordenadas se conocen en cuanto se abre la página del
+informe: las consultas de las capas, el mapa de localización y las leyendas
+del mapa web se lanzan entonces en segundo plano y sus futuros se guardan en
+la sesión (st.session_state), ligados a la geometría. Al pulsar «Generar
+informe», las etapas usan esos futuros (afecciones.informe_pdf.etapas_informe)
+y solo queda montar el PDF.
+
+Los cálculos van a un pool de pocos hilos compartido por todas las sesiones,
+para que las páginas abiertas sin llegar a pedir el informe no saturen los
+servicios. Si al pedir el informe un cálculo ni siquiera ha empezado, se
+cancela y se hace en ese momento. Esos hilos no tienen sesión de Streamlit:
+cada futuro devuelve (resultado, avisos) y los avisos se muestran al usar el
+resultado (afecciones.avisos).
+
+Con la cola de informes activa (afecciones.cola) no se anticipa nada: el
+informe lo genera otro proceso, que no vería estos resultados.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from afecciones import avisos, cola, red
+from afecciones.cache import hash_geometria
+from afecciones.capas import consultar_afecciones
+from afecciones.informe_pdf import generar_imagen_estatica_mapa
+from afecciones.mapas import precargar_leyendas
+
+HILOS = int(os.environ.get("AFECCIONES_ANTICIPO_HILOS", 4))
+
+_ejecutor = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix="anticipo")
+
+
+def _clave(geom, x, y):
+    return f"{hash_geometria(geom)}|{x}|{y}"
+
+
+def _con_avisos(funcion, *args, **kwargs):
+    with avisos.recogidos() as lista:
+        resultado = funcion(*args, **kwargs)
+    return resultado, lista
+
+
+def lanzar(sesion, geom, x, y):
+    """
+    Lanza (una vez por sesión y geometría) las consultas de las capas, el mapa
+    de localización y las leyendas. `sesion`: st.session_state. Con la cola
+    activa no lanza nada y devuelve {}.
+    """
+    if cola.ACTIVA:
+        return {}
+    clave = _clave(geom, x, y)
+    anterior = sesion.get("anticipo")
+    if anterior is not None and anterior["clave"] == clave:
+        return anterior["futuros"]
+    if anterior is not None:
+        for futuro in anterior["futuros"].values():
+            futuro.cancel()
+
+    plazo = red.Plazo()
+    progreso = []
+    futuros = {
+        "afecciones": _ejecutor.submit(
+            _con_avisos, consultar_afecciones, geom, plazo=plazo, al_terminar=lambda *capa: progreso.append(capa)
+        ),
+        "mapa_localizacion": _ejecutor.submit(_con_avisos, generar_imagen_estatica_mapa, x, y, plazo=plazo),
+        "leyendas": _ejecutor.submit(_con_avisos, precargar_leyendas, plazo),
+    }
+    sesion["anticipo"] = {"clave": clave, "futuros": futuros, "progreso": progreso}
+    return futuros
+
+
+def futuros(sesion, geom, x, y):
+    """Futuros anticipados para esta geometría ({etapa: Future de (resultado, avisos)}) o {} si no hay."""
+    anterior = sesion.get("anticipo")
+    if anterior is None or anterior["clave"] != _clave(geom, x, y):
+        return {}
+    return anterior["futuros"]
+
+
+def progreso(sesion, geom, x, y):
+    """Capas ya terminadas del cálculo anticipado [(clave, resultado, segundos)]; [] si no hay."""
+    anterior = sesion.get("anticipo")
+    if anterior is None or anterior["clave"] != _clave(geom, x, y):
+        return []
+    return anterior["progreso"]
@@ -0,0 +1,202 @@
+"""
+Archivo local de informes generados, direccionado por contenido.
+
+Cada informe se guarda con el hash de todo lo que lo determina: la página
+(carm / jccm), la geometría de la parcela, su localización, los datos del
+solicitante, la versión de cada capa en la parcela, la versión de la
+plantilla y la fecha del informe, que va impresa en la página 1. Las
+versiones de las capas se conocen sin red (capas.versiones_locales), así que
+una solicitud idéntica del mismo día se busca antes de consultar nada y
+devuelve el PDF archivado sin volver a generarlo.
+
+Los PDF van en ARCHIVO_DIR y sus metadatos en una tabla SQLite; al superar
+la cuota se borran los informes usados hace más tiempo.
+
+    python -m afecciones.archivo listar --municipio CARTAGENA
+    python -m afecciones.archivo extraer <clave> -o informe.pdf
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from afecciones.cache import CACHE_DIR, hash_geometria
+
+ARCHIVO_DIR = os.path.join(CACHE_DIR, "archivo")
+ARCHIVO_DB = os.path.join(ARCHIVO_DIR, "archivo.sqlite")
+ARCHIVO_CUOTA = int(os.environ.get("AFECCIONES_ARCHIVO_CUOTA_MB", 500)) * 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def clave(ambito, solicitante, localizacion, geom, versiones, version_plantilla, fecha):
+    """Hash (sha256) de las entradas del informe. `versiones`: {capa: versión}; `fecha`: la impresa."""
+    contenido = json.dumps(
+        [ambito, hash_geometria(geom), solicitante, localizacion, versiones, version_plantilla, fecha],
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def archivable(datos):
+    """Solo se archivan informes completos: sin capas indeterminadas (caídas o sin respuesta a tiempo)."""
+    return not any(
+        isinstance(valor, str) and valor.startswith("Indeterminado") for valor in datos.values()
+    )
+
+
+def _ruta(clave_informe):
+    return os.path.join(ARCHIVO_DIR, clave_informe[:2], f"{clave_informe}.pdf")
+
+
+def _conectar():
+    os.makedirs(ARCHIVO_DIR, exist_ok=True)
+    conn = sqlite3.connect(ARCHIVO_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS informes (
+            clave TEXT PRIMARY KEY,
+            ambito TEXT NOT NULL,
+            municipio TEXT,
+            poligono TEXT,
+            parcela TEXT,
+            solicitante TEXT,
+            dni TEXT,
+            fecha_informe TEXT,
+            tamano INTEGER NOT NULL,
+            creado REAL NOT NULL,
+            usado REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def leer(clave_informe):
+    """Bytes del PDF archivado o None si no existe."""
+    try:
+        with open(_ruta(clave_informe), "rb") as f:
+            contenido = f.read()
+    except OSError:
+        return None
+    try:
+        conn = _conectar()
+        try:
+            with conn:
+                conn.execute("UPDATE informes SET usado = ? WHERE clave = ?", (time.time(), clave_informe))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+    return contenido
+
+
+def guardar(clave_informe, contenido, ambito, datos):
+    """Archiva el PDF con sus metadatos y aplica la cuota."""
+    ruta = _ruta(clave_informe)
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+
+        conn = _conectar()
+        try:
+            with conn:
+                ahora = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO informes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        clave_informe, ambito,
+                        str(datos.get("municipio", "")), str(datos.get("polígono", "")),
+                        str(datos.get("parcela", "")),
+                        f"{datos.get('nombre', '')} {datos.get('apellidos', '')}".strip(),
+                        datos.get("dni", ""), datos.get("fecha_informe", ""),
+                        len(contenido), ahora, ahora,
+                    ),
+                )
+            _aplicar_cuota(conn)
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        # El archivo es opcional: el informe ya se ha entregado
+        pass
+
+
+def _aplicar_cuota(conn):
+    """Borra los informes usados hace más tiempo hasta quedar al 90 % de la cuota."""
+    with _lock:
+        total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM informes").fetchone()[0]
+        if total <= ARCHIVO_CUOTA:
+            return
+        for clave_informe, tamano in conn.execute(
+            "SELECT clave, tamano FROM informes ORDER BY usado"
+        ).fetchall():
+            if total <= ARCHIVO_CUOTA * 0.9:
+                break
+            try:
+                os.remove(_ruta(clave_informe))
+            except OSError:
+                pass
+            with conn:
+                conn.execute("DELETE FROM informes WHERE clave = ?", (clave_informe,))
+            total -= tamano
+
+
+def listar(municipio=None, dni=None, limite=50):
+    """Metadatos de los informes archivados, del más reciente al más antiguo."""
+    condiciones, parametros = [], []
+    if municipio:
+        condiciones.append("municipio = ?")
+        parametros.append(municipio)
+    if dni:
+        condiciones.append("dni = ?")
+        parametros.append(dni)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    conn = _conectar()
+    try:
+        conn.row_factory = sqlite3.Row
+        filas = conn.execute(
+            f"SELECT * FROM informes {donde} ORDER BY creado DESC LIMIT ?", (*parametros, limite)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(fila) for fila in filas]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el archivo local de informes.")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    p_listar = ordenes.add_parser("listar", help="informes archivados, del más reciente al más antiguo")
+    p_listar.add_argument("--municipio")
+    p_listar.add_argument("--dni")
+    p_listar.add_argument("--limite", type=int, default=50)
+    p_extraer = ordenes.add_parser("extraer", help="copia el PDF de un informe archivado")
+    p_extraer.add_argument("clave")
+    p_extraer.add_argument("-o", "--salida", help="fichero de salida (por defecto, <clave>.pdf)")
+    args = parser.parse_args(argv)
+
+    if args.orden == "listar":
+        for fila in listar(args.municipio, args.dni, args.limite):
+            creado = time.strftime("%Y-%m-%d %H:%M", time.localtime(fila["creado"]))
+            print(
+                f"{fila['clave']}  {creado}  {fila['ambito']}  {fila['municipio']} "
+                f"{fila['poligono']}/{fila['parcela']}  {fila['solicitante']} ({fila['dni']})  "
+                f"{fila['tamano'] // 1024} KB"
+            )
+    else:
+        contenido = leer(args.clave)
+        if contenido is None:
+            sys.exit(f"No hay ningún informe archivado con la clave {args.clave}")
+        salida = args.salida or f"{args.clave}.pdf"
+        with open(salida, "wb") as f:
+            f.write(contenido)
+        print(salida)
+
+
+if __name__ == "__main__":
+    main()
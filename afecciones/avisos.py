@@ -0,0 +1,45 @@
+"""
+Avisos de Streamlit (st.error, st.warning...) que pueden emitirse fuera de
+una sesión.
+
+Un cálculo que va a un hilo sin ScriptRunContext (el cálculo anticipado de
+afecciones.anticipo) perdería sus avisos: dentro de `recogidos()` se guardan
+en una lista, que viaja con el resultado y se muestra con `mostrar()` cuando
+el hilo del informe lo usa.
+"""
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+_local = threading.local()
+
+
+def actual():
+    """Lista en la que se recogen los avisos de este hilo (None si se muestran directamente)."""
+    return getattr(_local, "avisos", None)
+
+
+def avisar(nivel, texto):
+    """st.<nivel>(texto), o se guarda si el hilo está recogiendo sus avisos."""
+    lista = actual()
+    if lista is not None:
+        lista.append((nivel, texto))
+    else:
+        getattr(st, nivel)(texto)
+
+
+@contextmanager
+def recogidos(lista=None):
+    """Recoge los avisos de este hilo en `lista` (una nueva si no se da) mientras dura el bloque."""
+    anterior = actual()
+    _local.avisos = [] if lista is None else lista
+    try:
+        yield _local.avisos
+    finally:
+        _local.avisos = anterior
+
+
+def mostrar(lista):
+    for nivel, texto in lista:
+        getattr(st, nivel)(texto)
@@ -0,0 +1,152 @@
+"""Caché persistente de resultados de afecciones.
+
+Cada resultado se guarda por (hash de la geometría, capa, versión de la capa).
+La versión es el ETag / Last-Modified que devuelve el servidor o, si no lo
+envía, el hash del contenido descargado (la capa completa o las celdas que
+cubren la parcela): cuando la capa cambia, la versión cambia y las entradas
+antiguas dejan de usarse y se borran.
+
+También guarda la extensión de cada capa, para descartar sin descargarla
+las capas que no pueden tocar la parcela, y el registro de capas que no
+respondieron dentro del plazo de un informe.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import shapely
+
+# Directorio de cachés en disco (compartido por todas las sesiones del servidor)
+CACHE_DIR = os.environ.get("AFECCIONES_CACHE_DIR", ".cache_afecciones")
+RESULTADOS_DB = os.path.join(CACHE_DIR, "resultados.sqlite")
+# Las entradas de versiones que ya nadie consulta se purgan pasado este tiempo
+RESULTADOS_TTL = 30 * 86400
+
+
+def hash_geometria(geom):
+    """Hash estable de una geometría (normalizada para que el orden de vértices no influya)."""
+    return hashlib.sha256(shapely.normalize(geom).wkb).hexdigest()
+
+
+def _conectar():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(RESULTADOS_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS resultados (
+            geom TEXT NOT NULL,
+            capa TEXT NOT NULL,
+            version TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            creado REAL NOT NULL,
+            PRIMARY KEY (geom, capa, version)
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS tiempos_agotados (
+            momento REAL NOT NULL,
+            capa TEXT NOT NULL,
+            plazo REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS extensiones (
+            capa TEXT PRIMARY KEY,
+            minx REAL, miny REAL, maxx REAL, maxy REAL,
+            creado REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def leer_resultado(geom_hash, capa, version):
+    """Devuelve el resultado guardado o None si no existe para esa versión de la capa."""
+    try:
+        conn = _conectar()
+        try:
+            fila = conn.execute(
+                "SELECT resultado FROM resultados WHERE geom = ? AND capa = ? AND version = ?",
+                (geom_hash, capa, version),
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    if fila is None:
+        return None
+    resultado = json.loads(fila[0])
+    if resultado.get("filas") is not None:
+        resultado["filas"] = [tuple(f) for f in resultado["filas"]]
+    return resultado
+
+
+def guardar_resultado(geom_hash, capa, version, resultado):
+    """Guarda el resultado, elimina las versiones anteriores de esa geometría y capa y purga las caducadas."""
+    try:
+        conn = _conectar()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM resultados WHERE geom = ? AND capa = ? AND version != ?",
+                    (geom_hash, capa, version),
+                )
+                conn.execute("DELETE FROM resultados WHERE creado < ?", (time.time() - RESULTADOS_TTL,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)",
+                    (geom_hash, capa, version, json.dumps(resultado, ensure_ascii=False), time.time()),
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # La caché es opcional: si el disco falla, el informe se genera igualmente
+        pass
+
+
+def leer_extension(capa, max_edad):
+    """Extensión (minx, miny, maxx, maxy) guardada para la capa, o None si no existe o ha caducado."""
+    try:
+        conn = _conectar()
+        try:
+            fila = conn.execute(
+                "SELECT minx, miny, maxx, maxy FROM extensiones WHERE capa = ? AND creado >= ?",
+                (capa, time.time() - max_edad),
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return tuple(fila) if fila else None
+
+
+def guardar_extension(capa, extension):
+    try:
+        conn = _conectar()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extensiones VALUES (?, ?, ?, ?, ?, ?)",
+                    (capa, *extension, time.time()),
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def registrar_tiempos_agotados(capas, plazo):
+    """Anota las capas que no respondieron dentro del plazo del informe (monitorización)."""
+    try:
+        conn = _conectar()
+        try:
+            with conn:
+                ahora = time.time()
+                conn.executemany(
+                    "INSERT INTO tiempos_agotados VALUES (?, ?, ?)",
+                    [(ahora, capa, plazo) for capa in capas],
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
@@ -0,0 +1,503 @@
+"""Catálogo de capas WFS de afecciones y consulta espacial contra la parcela."""
+import hashlib
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+import shapely
+import streamlit as st
+from pyproj import Transformer
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from afecciones import avisos, red, rejilla, teselas
+from afecciones.indice import indice
+from afecciones.cache import (
+    guardar_extension,
+    guardar_resultado,
+    hash_geometria,
+    leer_extension,
+    leer_resultado,
+    registrar_tiempos_agotados,
+)
+
+logger = logging.getLogger(__name__)
+
+# Hilos compartidos por todas las sesiones para consultar las capas en paralelo
+_ejecutor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="afecciones")
+
+GEOSERVER_CARM = "https://mapas-gis-inter.carm.es/geoserver"
+
+
+def _url_wfs(espacio, capa):
+    return (
+        f"{GEOSERVER_CARM}/{espacio}/wfs?service=WFS&version=1.1.0&request=GetFeature"
+        f"&typeName={espacio}:{capa}&outputFormat=application/json"
+    )
+
+
+# === CATÁLOGO DE CAPAS (en el orden en que se muestran las afecciones) ===
+# clave_datos: clave en el diccionario `datos` que recibe generar_pdf
+# campos_tabla: columnas que se extraen para las tablas del PDF
+CAPAS = {
+    "flora": {
+        "nombre": "FLORA", "clave_datos": "afección flora", "campo_nombre": "tipo",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "planes_recuperacion_flora2014",
+        "campos_tabla": ["tipo", "nombre"],
+    },
+    "garbancillo": {
+        "nombre": "GARBANCILLO", "clave_datos": "afección garbancillo", "campo_nombre": "tipo",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "plan_recuperacion_garbancillo",
+        "campos_tabla": ["tipo", "nombre"],
+    },
+    "malvasia": {
+        "nombre": "MALVASIA", "clave_datos": "afección malvasia", "campo_nombre": "clasificac",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "plan_recuperacion_malvasia",
+        "campos_tabla": ["clasificac", "nombre"],
+    },
+    "fartet": {
+        "nombre": "FARTET", "clave_datos": "afección fartet", "campo_nombre": "clasificac",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "plan_recuperacion_fartet",
+        "campos_tabla": ["clasificac", "nombre"],
+    },
+    "nutria": {
+        "nombre": "NUTRIA", "clave_datos": "afección nutria", "campo_nombre": "tipo_de_ar",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "plan_recuperacion_nutria",
+        "campos_tabla": ["tipo_de_ar", "nombre"],
+    },
+    "perdicera": {
+        "nombre": "ÁGUILA PERDICERA", "clave_datos": "afección perdicera", "campo_nombre": "zona",
+        "espacio": "SIG_ZOR_PLANIGEST_CARM", "tipo": "plan_recuperacion_perdicera",
+        "campos_tabla": ["zona", "nombre"],
+    },
+    "tortuga": {
+        "nombre": "TORTUGA MORA", "clave_datos": "afección tortuga", "campo_nombre": "cat_desc",
+        "espacio": "SIG_DES_BIOTA_CARM", "tipo": "tortuga_distribucion_2001",
+        "campos_tabla": ["cat_id", "cat_desc"],
+    },
+    "uso_suelo": {
+        "nombre": "PLANEAMIENTO", "clave_datos": "afección uso_suelo", "campo_nombre": "Clasificacion",
+        "espacio": "SIT_USU_PLA_URB_CARM", "tipo": "plu_ze_37_mun_uso_suelo",
+        "campos_tabla": ["Uso_Especifico", "Clasificacion"],
+    },
+    "esteparias": {
+        "nombre": "ESTEPARIAS", "clave_datos": "afección esteparias", "campo_nombre": "nombre",
+        "espacio": "SIG_DES_BIOTA_CARM", "tipo": "esteparias_ceea_2019_10x10",
+        "campos_tabla": ["cuad_10km", "especie", "nombre"],
+    },
+    "enp": {
+        "nombre": "ENP", "clave_datos": "afección ENP", "campo_nombre": "nombre",
+        "espacio": "SIG_LUP_SITES_CARM", "tipo": "ENP",
+        "campos_tabla": ["nombre", "figura"],
+    },
+    "zepa": {
+        "nombre": "ZEPA", "clave_datos": "afección ZEPA", "campo_nombre": "site_name",
+        "espacio": "SIG_LUP_SITES_CARM", "tipo": "ZEPA",
+        "campos_tabla": ["site_code", "site_name"],
+    },
+    "lic": {
+        "nombre": "LIC", "clave_datos": "afección LIC", "campo_nombre": "site_name",
+        "espacio": "SIG_LUP_SITES_CARM", "tipo": "LIC-ZEC",
+        "campos_tabla": ["site_code", "site_name"],
+    },
+    "vp": {
+        "nombre": "VP", "clave_datos": "afección VP", "campo_nombre": "vp_nb",
+        "espacio": "PFO_ZOR_DMVP_CARM", "tipo": "VP_CARM",
+        "campos_tabla": ["vp_cod", "vp_nb", "vp_mun", "vp_sit_leg", "vp_anch_lg"],
+    },
+    "tm": {
+        "nombre": "TM", "clave_datos": "Afección TM", "campo_nombre": "nameunit",
+        "espacio": "MAP_UAD_DIVISION-ADMINISTRATIVA_CARM", "tipo": "recintos_municipales_inspire_carm_etrs89",
+        "campos_tabla": None,
+    },
+    "mup": {
+        "nombre": "MUP", "clave_datos": "afección MUP",
+        "espacio": "PFO_ZOR_DMVP_CARM", "tipo": "MONTES",
+        "campos_mup": ["id_monte:ID", "nombremont:Nombre", "municipio:Municipio", "propiedad:Propiedad"],
+        "campos_tabla": None,
+    },
+}
+for _capa in CAPAS.values():
+    _capa["url"] = _url_wfs(_capa["espacio"], _capa["tipo"])
+
+# Margen (m) al comparar la envolvente de la parcela con la extensión de la capa
+MARGEN_EXTENSION = 50
+EXTENSION_TTL = 604800  # 7 días, igual que la descarga de las capas
+
+# Consultas WFS filtradas por bbox con caché por celdas (0 = descargar capas completas)
+TESELAS_WFS = os.environ.get("AFECCIONES_WFS_TESELAS", "1") != "0"
+
+
+# === FUNCIÓN DESCARGA CON CACHÉ ===
+@st.cache_data(show_spinner=False, ttl=604800)  # 7 días
+def _descargar_capa(url, _plazo=None):
+    """(contenido, versión) de la capa. Los fallos se propagan para no quedar en caché."""
+    response = red.get(url, plazo=_plazo)
+    response.raise_for_status()
+    version = (
+        response.headers.get("ETag")
+        or response.headers.get("Last-Modified")
+        or hashlib.sha1(response.content).hexdigest()
+    )
+    return response.content, version
+
+
+def descargar_capa(url, plazo=None):
+    """(contenido, versión) de la capa o None si el servicio no responde (a tiempo)."""
+    try:
+        return _descargar_capa(url, _plazo=plazo)
+    except Exception:
+        if not hasattr(st, "_wfs_warnings"):
+            st._wfs_warnings = set()
+        warning_key = url.split('/')[-1]
+        if warning_key not in st._wfs_warnings:
+            avisos.avisar("warning", f"Servicio no disponible: {warning_key}")
+            st._wfs_warnings.add(warning_key)
+        return None
+
+
+def _descargar_geojson(url, plazo=None):
+    descarga = descargar_capa(url, plazo)
+    if descarga is None:
+        return None
+    return BytesIO(descarga[0])
+
+
+# === EXTENSIÓN DE LAS CAPAS ===
+@st.cache_data(show_spinner=False, ttl=EXTENSION_TTL)
+def _extensiones_capabilities(espacio, _plazo=None):
+    """{typeName: (minx, miny, maxx, maxy) en EPSG:25830} según el GetCapabilities del espacio."""
+    url = f"{GEOSERVER_CARM}/{espacio}/wfs?service=WFS&version=1.1.0&request=GetCapabilities"
+    response = red.get(url, plazo=_plazo)
+    response.raise_for_status()
+    raiz = ET.fromstring(response.content)
+
+    ns = {"wfs": "http://www.opengis.net/wfs", "ows": "http://www.opengis.net/ows"}
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:25830", always_xy=True)
+    extensiones = {}
+    for feature_type in raiz.iter(f"{{{ns['wfs']}}}FeatureType"):
+        nombre = feature_type.findtext("wfs:Name", namespaces=ns)
+        esquina_inf = feature_type.findtext("ows:WGS84BoundingBox/ows:LowerCorner", namespaces=ns)
+        esquina_sup = feature_type.findtext("ows:WGS84BoundingBox/ows:UpperCorner", namespaces=ns)
+        if not nombre or not esquina_inf or not esquina_sup:
+            continue
+        try:
+            min_lon, min_lat = map(float, esquina_inf.split())
+            max_lon, max_lat = map(float, esquina_sup.split())
+            extensiones[nombre] = transformer.transform_bounds(min_lon, min_lat, max_lon, max_lat)
+        except ValueError:
+            continue
+    return extensiones
+
+
+def extension_capa(clave, plazo=None):
+    """
+    Extensión (EPSG:25830) de una capa o None si no se conoce.
+
+    Se usa primero la calculada con total_bounds en una descarga anterior
+    (exacta) y, si no hay, la anunciada en el GetCapabilities del servicio.
+    """
+    extension = leer_extension(clave, EXTENSION_TTL)
+    if extension is not None:
+        return extension
+    capa = CAPAS[clave]
+    try:
+        extensiones = _extensiones_capabilities(capa["espacio"], _plazo=plazo)
+    except Exception:
+        return None
+    return extensiones.get(f"{capa['espacio']}:{capa['tipo']}") or extensiones.get(capa["tipo"])
+
+
+def _fuera_de_extension(geom, extension):
+    minx, miny, maxx, maxy = geom.bounds
+    ext_minx, ext_miny, ext_maxx, ext_maxy = extension
+    return (
+        maxx < ext_minx - MARGEN_EXTENSION or minx > ext_maxx + MARGEN_EXTENSION
+        or maxy < ext_miny - MARGEN_EXTENSION or miny > ext_maxy + MARGEN_EXTENSION
+    )
+
+
+def _texto_afeccion(seleccion, nombre_afeccion, campo_nombre=None, campos_mup=None):
+    if seleccion.empty:
+        return f"No afecta a {nombre_afeccion}"
+
+    # --- MODO MUP: campos personalizados ---
+    if campos_mup:
+        info = []
+        for _, row in seleccion.iterrows():
+            valores = [str(row.get(c.split(':')[0], "Desconocido")) for c in campos_mup]
+            etiquetas = [c.split(':')[1] if ':' in c else c.split(':')[0] for c in campos_mup]
+            info.append("\n".join(f"{etiquetas[i]}: {valores[i]}" for i in range(len(campos_mup))))
+        return f"Dentro de {nombre_afeccion}:\n" + "\n\n".join(info)
+
+    # --- MODO NORMAL: solo nombres ---
+    nombres = ', '.join(seleccion[campo_nombre].dropna().unique())
+    return f"Dentro de {nombre_afeccion}: {nombres}"
+
+
+# === CONSULTA DE LAS CAPAS ===
+def _resultado_capa(clave, seleccion):
+    capa = CAPAS[clave]
+    texto = _texto_afeccion(seleccion, capa["nombre"], capa.get("campo_nombre"), capa.get("campos_mup"))
+    filas = None
+    if capa["campos_tabla"]:
+        filas = [
+            tuple(str(props.get(campo, "N/A")) for campo in capa["campos_tabla"])
+            for _, props in seleccion.iterrows()
+        ]
+    return {"texto": texto, "filas": filas}
+
+
+def descargar_piezas(clave, bounds, plazo=None):
+    """
+    ({pieza: GeoJSON en bytes}, versión) de la capa para la envolvente, o None
+    si falla. Por defecto solo se descargan las celdas de la rejilla que la
+    cubren; con AFECCIONES_WFS_TESELAS=0, la capa completa.
+    """
+    url = CAPAS[clave]["url"]
+    if TESELAS_WFS:
+        return teselas.descargar(clave, url, bounds, plazo)
+    descarga = descargar_capa(url, plazo)
+    if descarga is None:
+        return None
+    return {"completa": descarga[0]}, descarga[1]
+
+
+def _preparar_capa(geom, clave, geom_hash, plazo=None):
+    """
+    Primera fase de la consulta de una capa. Devuelve (resultado, versión):
+    el resultado si ya se conoce (fuera de extensión, caché o fallo) o None si
+    la capa queda cargada en el índice combinado, pendiente de la consulta.
+    """
+    capa = CAPAS[clave]
+    nombre = capa["nombre"]
+
+    # Consulta por coordenadas: si el punto cae en una celda de la rejilla
+    # precalculada que está entera dentro o fuera de la capa, no hace falta más
+    if geom.geom_type == "Point":
+        seleccion = rejilla.consultar_punto(clave, geom)
+        if seleccion is not None:
+            return _resultado_capa(clave, seleccion), None
+
+    # La parcela cae fuera de la extensión de la capa: no puede afectar y no se descarga
+    extension = extension_capa(clave, plazo)
+    if extension is not None and _fuera_de_extension(geom, extension):
+        return {"texto": f"No afecta a {nombre}", "filas": [] if capa["campos_tabla"] else None}, None
+
+    descarga = descargar_piezas(clave, geom.bounds, plazo)
+    if descarga is None:
+        if plazo is not None and plazo.agotado():
+            return _resultado_tiempo_agotado(clave), None
+        return {"texto": f"Indeterminado: {nombre} (servicio no disponible)", "filas": None}, None
+    piezas, version = descarga
+
+    resultado = leer_resultado(geom_hash, clave, version)
+    if resultado is not None:
+        return resultado, version
+
+    try:
+        indice.actualizar_capa(clave, piezas)
+    except Exception:
+        return {"texto": f"Indeterminado: {nombre} (error de datos)", "filas": None}, None
+    if not TESELAS_WFS and indice.limites(clave) is not None:
+        guardar_extension(clave, indice.limites(clave))
+    return None, version
+
+
+def versiones_locales(geom):
+    """
+    {clave: versión} de todas las capas para la geometría, con lo que ya está
+    en disco o en memoria (sin red), o None si de alguna no se sabe. Sigue los
+    mismos pasos que _preparar_capa: rejilla (puntos), extensión y celdas.
+    """
+    if not TESELAS_WFS:
+        return None
+    versiones = {}
+    for clave in CAPAS:
+        if geom.geom_type == "Point" and rejilla.consultar_punto(clave, geom) is not None:
+            versiones[clave] = f"rejilla {rejilla.version(clave)}"
+            continue
+        # Con plazo agotado, extension_capa solo responde desde sus cachés
+        extension = extension_capa(clave, red.Plazo(0))
+        if extension is not None and _fuera_de_extension(geom, extension):
+            versiones[clave] = "fuera"
+            continue
+        version = teselas.version_local(clave, geom.bounds)
+        if version is None:
+            return None
+        versiones[clave] = version
+    return versiones
+
+
+def _resolver_pendientes(geom, geom_hash, pendientes):
+    """Una sola consulta al índice combinado para todas las capas pendientes {clave: versión}."""
+    resultados = {}
+    selecciones = indice.query(geom, claves=set(pendientes))
+    for clave, version in pendientes.items():
+        try:
+            resultado = _resultado_capa(clave, selecciones[clave])
+        except Exception:
+            resultados[clave] = {"texto": f"Indeterminado: {CAPAS[clave]['nombre']} (error de datos)", "filas": None}
+            continue
+        guardar_resultado(geom_hash, clave, version, resultado)
+        resultados[clave] = resultado
+    return resultados
+
+
+def consultar_capa(geom, clave, geom_hash=None, plazo=None):
+    """
+    Resultado de una capa del catálogo para la geometría:
+    {"texto": línea de afección, "filas": filas para la tabla del PDF (o None)}.
+
+    Si la parcela ya se consultó contra la misma versión de la capa, el
+    resultado sale de la caché persistente sin intersecar la capa.
+    """
+    if geom_hash is None:
+        geom_hash = hash_geometria(geom)
+    resultado, version = _preparar_capa(geom, clave, geom_hash, plazo)
+    if resultado is None:
+        resultado = _resolver_pendientes(geom, geom_hash, {clave: version})[clave]
+    return resultado
+
+
+def _cargar_locales(bounds, claves):
+    """Carga en el índice las celdas de las capas que ya están en disco (sin red)."""
+    if TESELAS_WFS:
+        for clave in claves:
+            piezas = teselas.piezas_locales(clave, bounds)
+            if piezas:
+                try:
+                    indice.actualizar_capa(clave, piezas)
+                except Exception:
+                    logger.warning("Teselas en disco no válidas para %s", clave)
+
+
+def elementos_cercanos(bounds, claves):
+    """
+    {clave: GeoDataFrame} con los elementos de las capas que tocan la envolvente
+    `bounds`, solo con lo que ya está cacheado en disco o en el índice (sin red).
+    """
+    _cargar_locales(bounds, claves)
+    return indice.query(shapely.box(*bounds), claves=set(claves))
+
+
+def campo_etiqueta(clave):
+    """Atributo que da nombre a los elementos de la capa (None si no tiene)."""
+    capa = CAPAS[clave]
+    if capa.get("campo_nombre"):
+        return capa["campo_nombre"]
+    if capa.get("campos_mup"):
+        return capa["campos_mup"][1].split(":")[0]
+    return None
+
+
+def afecta(resultado):
+    return not resultado["texto"].startswith(("No afecta", "Indeterminado"))
+
+
+def desglose_por_parcela(geoms, resultados):
+    """
+    Afecciones de cada parcela de una finca consultada como unión: por cada
+    geometría, {clave: [nombres de los elementos]}. Solo se miran las capas que
+    afectan a la finca, con los elementos ya cargados para su consulta (sin
+    red), y una sola consulta masiva al índice para todas las parcelas.
+    """
+    geoms = list(geoms)
+    claves = [clave for clave, resultado in resultados.items() if afecta(resultado)]
+    desglose = [{} for _ in geoms]
+    if not geoms or not claves:
+        return desglose
+    _cargar_locales(shapely.total_bounds(geoms), claves)
+
+    for clave, (en_geoms, filas) in indice.pares(geoms, claves=set(claves)).items():
+        bloque = indice.bloque(clave)
+        campo = campo_etiqueta(clave)
+        if campo in bloque.columns:
+            nombres = bloque[campo].astype(str).to_numpy()[filas]
+        else:
+            nombres = [CAPAS[clave]["nombre"]] * len(filas)
+        for i, nombre in zip(en_geoms, nombres):
+            if nombre not in desglose[i].setdefault(clave, []):
+                desglose[i][clave].append(nombre)
+    return desglose
+
+
+def _resultado_tiempo_agotado(clave):
+    return {"texto": f"Indeterminado: {CAPAS[clave]['nombre']} (tiempo agotado)", "filas": None}
+
+
+def consultar_afecciones(geom, plazo=None, al_terminar=None):
+    """
+    Consulta todas las capas del catálogo; devuelve {clave: resultado} en el
+    orden de CAPAS. Las descargas van en paralelo y las capas que no están en
+    la caché de resultados se resuelven con consultas al índice combinado,
+    una por cada grupo de capas que terminan de descargarse a la vez.
+
+    Con `plazo`, las capas que no terminan a tiempo se dan como
+    «Indeterminado (tiempo agotado)» y se registran para monitorización.
+    `al_terminar(clave, resultado, segundos)` se llama en cuanto se conoce
+    el resultado de cada capa (para mostrarlo sin esperar a las demás).
+    """
+    geom_hash = hash_geometria(geom)
+    ctx = get_script_run_ctx(suppress_warning=True)  # None en los cálculos anticipados
+    recogidos = avisos.actual()  # y sus avisos se recogen para mostrarlos después
+    inicio = time.perf_counter()
+
+    def tarea(clave):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            if recogidos is None:
+                return _preparar_capa(geom, clave, geom_hash, plazo)
+            with avisos.recogidos(recogidos):
+                return _preparar_capa(geom, clave, geom_hash, plazo)
+        finally:
+            # El hilo vuelve al pool compartido: que no quede ligado a esta sesión
+            add_script_run_ctx(threading.current_thread(), None)
+
+    def terminadas(nuevos):
+        resultados.update(nuevos)
+        if al_terminar is not None:
+            for clave, resultado in nuevos.items():
+                al_terminar(clave, resultado, time.perf_counter() - inicio)
+
+    futuros = {_ejecutor.submit(tarea, clave): clave for clave in CAPAS}
+    resultados = {}
+    restantes = set(futuros)
+    while restantes:
+        hechos, restantes = wait(
+            restantes, timeout=plazo.restante() if plazo is not None else None, return_when=FIRST_COMPLETED
+        )
+        if not hechos:
+            break  # plazo agotado
+        nuevos = {}
+        pendientes = {}
+        for futuro in hechos:
+            clave = futuros[futuro]
+            if futuro.exception() is not None:
+                nuevos[clave] = {"texto": f"Indeterminado: {CAPAS[clave]['nombre']} (error de datos)", "filas": None}
+                continue
+            nuevos[clave], version = futuro.result()
+            if nuevos[clave] is None:
+                del nuevos[clave]
+                pendientes[clave] = version
+        # Capas sin resultado en caché que han terminado juntas: una única consulta al índice combinado
+        if pendientes:
+            nuevos.update(_resolver_pendientes(geom, geom_hash, pendientes))
+        terminadas(nuevos)
+
+    for futuro in restantes:
+        futuro.cancel()  # si sigue en marcha, su resultado se descarta
+    terminadas({futuros[futuro]: _resultado_tiempo_agotado(futuros[futuro]) for futuro in restantes})
+
+    agotadas = capas_tiempo_agotado(resultados)
+    if agotadas:
+        logger.warning("Capas sin respuesta en %.0f s: %s", plazo.segundos, ", ".join(agotadas))
+        registrar_tiempos_agotados(agotadas, plazo.segundos)
+    return {clave: resultados[clave] for clave in CAPAS}
+
+
+def capas_tiempo_agotado(resultados):
+    return [clave for clave, resultado in resultados.items() if resultado["texto"].endswith("(tiempo agotado)")]
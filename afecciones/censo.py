@@ -0,0 +1,177 @@
+"""
+Censo de afecciones de un municipio completo.
+
+Cruza todas las parcelas del parcelario catastral con todas las capas de
+afección: las capas se cargan una vez (celdas que cubren el municipio) en el
+índice combinado y las parcelas se consultan por bloques, cada bloque con una
+sola consulta masiva al árbol para todas las capas. El área de solape solo se
+calcula con una intersección exacta para las parcelas que cruzan el borde de
+un elemento; si la parcela está dentro, el solape es su área.
+
+    python -m afecciones.censo CARTAGENA --salida censo_cartagena.parquet
+    python -m afecciones.censo TOLEDO --ambito jccm --provincia TOLEDO --salida censo.csv
+    python -m afecciones.censo MURCIA --parcelario murcia.shp --capas enp zepa lic
+
+La tabla tiene una fila por (parcela, elemento afectado). Parquet necesita
+pyarrow; cualquier otra extensión se escribe como CSV.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from afecciones import parcelas
+from afecciones.capas import CAPAS, _fuera_de_extension, campo_etiqueta, descargar_piezas, extension_capa
+from afecciones.indice import indice
+
+logger = logging.getLogger(__name__)
+
+# Parcelas por bloque: acota la memoria de los pares y de las intersecciones
+TAMANO_BLOQUE = int(os.environ.get("AFECCIONES_CENSO_BLOQUE", 5000))
+
+COLUMNAS = [
+    "municipio", "poligono", "parcela", "refcat", "capa", "nombre_capa", "elemento", "nombre",
+    "area_parcela_m2", "area_solape_m2", "porcentaje",
+]
+
+
+def cargar_capas(claves, bounds):
+    """
+    Carga en el índice las capas que cubren la envolvente; devuelve las que se
+    pudieron cargar. Las que no llegan al municipio (según su extensión, como
+    en consultar_afecciones) no se descargan.
+    """
+    def cargar(clave):
+        extension = extension_capa(clave)
+        if extension is not None and _fuera_de_extension(shapely.box(*bounds), extension):
+            logger.info("Capa %s fuera del municipio; no se descarga", clave)
+            return None
+        descarga = descargar_piezas(clave, bounds)
+        if descarga is None:
+            logger.warning("Capa %s no disponible; se omite del censo", clave)
+            return None
+        indice.actualizar_capa(clave, descarga[0])
+        return clave
+
+    with ThreadPoolExecutor(max_workers=8) as ejecutor:
+        return [clave for clave in ejecutor.map(cargar, claves) if clave is not None]
+
+
+def cruzar(gdf, municipio, claves, tamano_bloque=TAMANO_BLOQUE):
+    """Tabla parcela -> elemento afectado para las capas ya cargadas en el índice."""
+    geometrias = gdf.geometry.to_numpy()
+    areas = shapely.area(geometrias)
+    masas = gdf["MASA"].astype(str).to_numpy()
+    numeros = gdf["PARCELA"].astype(str).to_numpy()
+    refcat = gdf["REFCAT"].astype(str).to_numpy() if "REFCAT" in gdf.columns else np.full(len(gdf), "")
+
+    # Geometrías de cada capa (el índice las da ya preparadas para las pruebas de contención)
+    bloques = {}
+    for clave in claves:
+        bloque = indice.bloque(clave)
+        if bloque is None or bloque.empty:
+            continue
+        geoms_capa = bloque.geometry.to_numpy()
+        campo = campo_etiqueta(clave)
+        nombres = (
+            bloque[campo].astype(str).to_numpy() if campo in bloque.columns else np.full(len(bloque), "")
+        )
+        bloques[clave] = (geoms_capa, bloque.index.to_numpy(), nombres)
+
+    partes = []
+    for inicio in range(0, len(geometrias), tamano_bloque):
+        fin = min(inicio + tamano_bloque, len(geometrias))
+        pares = indice.pares(geometrias[inicio:fin], claves=set(bloques))
+        for clave, (en_bloque, filas) in pares.items():
+            if len(en_bloque) == 0:
+                continue
+            geoms_capa, ids, nombres = bloques[clave]
+            p = en_bloque + inicio
+            elementos = geoms_capa[filas]
+
+            # Solape = área de la parcela si está dentro del elemento; si no, intersección exacta
+            solape = areas[p].copy()
+            borde = ~shapely.covers(elementos, geometrias[p])
+            if borde.any():
+                solape[borde] = shapely.area(
+                    shapely.intersection(geometrias[p[borde]], elementos[borde])
+                )
+            porcentaje = np.divide(100 * solape, areas[p], out=np.zeros_like(solape), where=areas[p] > 0)
+            partes.append(pd.DataFrame({
+                "municipio": municipio,
+                "poligono": masas[p],
+                "parcela": numeros[p],
+                "refcat": refcat[p],
+                "capa": clave,
+                "nombre_capa": CAPAS[clave]["nombre"],
+                "elemento": ids[filas],
+                "nombre": nombres[filas],
+                "area_parcela_m2": areas[p].round(1),
+                "area_solape_m2": solape.round(1),
+                "porcentaje": porcentaje.round(2),
+            }))
+        logger.info("%d / %d parcelas", fin, len(geometrias))
+
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS)
+    return pd.concat(partes, ignore_index=True)[COLUMNAS]
+
+
+def censo(ambito, municipio, provincia=None, claves=None, parcelario=None, tamano_bloque=TAMANO_BLOQUE):
+    """Censo de afecciones del municipio (DataFrame). `parcelario`: shapefile local en lugar de la descarga."""
+    if ambito == "jccm" and not provincia and not parcelario:
+        raise ValueError("En Castilla-La Mancha hace falta la provincia para descargar el parcelario")
+    if parcelario:
+        gdf = gpd.read_file(parcelario).to_crs(epsg=25830)
+    else:
+        gdf = parcelas.cargar_parcelario(ambito, municipio, provincia=provincia)
+    if gdf is None or gdf.empty:
+        raise ValueError(f"No se pudo cargar el parcelario de {municipio}")
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+
+    claves = cargar_capas(list(claves or CAPAS), tuple(gdf.total_bounds))
+    return cruzar(gdf, municipio, claves, tamano_bloque)
+
+
+def guardar(tabla, salida):
+    if salida.lower().endswith(".parquet"):
+        try:
+            tabla.to_parquet(salida, index=False)
+        except ImportError as e:
+            raise SystemExit(f"Para escribir Parquet hace falta pyarrow ({e}); usa una salida .csv") from e
+    else:
+        tabla.to_csv(salida, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Censo de afecciones de todas las parcelas de un municipio.")
+    parser.add_argument("municipio")
+    parser.add_argument("--ambito", choices=["carm", "jccm"], default="carm")
+    parser.add_argument("--provincia", help="provincia (Castilla-La Mancha)")
+    parser.add_argument("--capas", nargs="*", help="claves de CAPAS (por defecto, todas)")
+    parser.add_argument("--parcelario", help="shapefile local del parcelario (si no, se descarga)")
+    parser.add_argument("--salida", required=True, help="fichero .parquet o .csv")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="parcelas por bloque")
+    args = parser.parse_args(argv)
+    if args.ambito == "jccm" and not args.provincia and not args.parcelario:
+        parser.error("con --ambito jccm hace falta --provincia (o --parcelario)")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    inicio = time.perf_counter()
+    tabla = censo(args.ambito, args.municipio, args.provincia, args.capas, args.parcelario, args.bloque)
+    guardar(tabla, args.salida)
+    logger.info(
+        "%d afecciones en %d parcelas -> %s (%.0f s)",
+        len(tabla), tabla[["poligono", "parcela"]].drop_duplicates().shape[0], args.salida,
+        time.perf_counter() - inicio,
+    )
+
+
+if __name__ == "__main__":
+    main()
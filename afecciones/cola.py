@@ -0,0 +1,315 @@
+"""
+Cola persistente de informes (SQLite) y procesos que los generan.
+
+Con AFECCIONES_COLA=1, las páginas no generan el informe en el hilo del
+script: lo encolan (ámbito, datos del solicitante, localización, X/Y y
+geometría de la parcela) y consultan su estado cada pocos segundos. Los
+trabajos sobreviven a recargas de la página, desconexiones y reinicios del
+servidor; los generan procesos aparte, tantos como núcleos se quieran usar:
+
+    python -m afecciones.cola trabajar --procesos 4
+    python -m afecciones.cola estado
+
+Control de admisión: con AFECCIONES_COLA_MAX trabajos sin terminar, encolar
+lanza ColaLlena y la página pide volver a intentarlo más tarde. Un trabajo
+que falla se reintenta (con espera creciente) hasta AFECCIONES_COLA_INTENTOS
+veces. El proceso que genera un trabajo lo renueva cada LATIDO segundos; uno
+que lleva más de AFECCIONES_COLA_ABANDONO segundos sin renovarse se da por
+abandonado (proceso caído) y vuelve a la cola. Los trabajos terminados se
+borran pasado AFECCIONES_COLA_TTL.
+
+El id del trabajo va también en la URL de la página (?trabajo=<id>), para
+recuperarlo tras recargarla (afecciones.progreso.pagina_trabajo).
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import shapely
+
+from afecciones.cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+ACTIVA = os.environ.get("AFECCIONES_COLA", "0") == "1"
+COLA_DB = os.path.join(CACHE_DIR, "cola.sqlite")
+MAX_SIN_TERMINAR = int(os.environ.get("AFECCIONES_COLA_MAX", 100))
+MAX_INTENTOS = int(os.environ.get("AFECCIONES_COLA_INTENTOS", 3))
+ABANDONO = float(os.environ.get("AFECCIONES_COLA_ABANDONO", 600))
+TTL = float(os.environ.get("AFECCIONES_COLA_TTL", 86400))
+# Segundos entre consultas de un proceso con la cola vacía
+ESPERA = 1.0
+# Segundos entre renovaciones del trabajo en curso (muy por debajo de ABANDONO)
+LATIDO = min(30.0, ABANDONO / 4)
+
+
+class ColaLlena(RuntimeError):
+    """Demasiados informes sin terminar: la solicitud no se admite."""
+
+
+def _conectar():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(COLA_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS trabajos (
+            id TEXT PRIMARY KEY,
+            estado TEXT NOT NULL,
+            ambito TEXT NOT NULL,
+            entrada TEXT NOT NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            disponible REAL NOT NULL,
+            creado REAL NOT NULL,
+            actualizado REAL NOT NULL,
+            error TEXT,
+            pdf BLOB,
+            salida TEXT
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, disponible)")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# === LADO DE LA PÁGINA ===
+def encolar(ambito, solicitante, localizacion, x, y, geom, parcela_gdf=None):
+    """
+    Encola un informe y devuelve su id. `localizacion`: (municipio, polígono,
+    parcela) del informe; `parcela_gdf`: parcelas de la finca (para el
+    desglose si son varias). Lanza ColaLlena si no se admite.
+    """
+    entrada = {
+        "solicitante": solicitante,
+        "localizacion": [str(valor) for valor in localizacion],
+        "x": x, "y": y,
+        "geom": shapely.to_wkb(geom, hex=True),
+        "parcelas": parcela_gdf.to_json() if parcela_gdf is not None and len(parcela_gdf) > 1 else None,
+    }
+    trabajo_id = uuid.uuid4().hex
+    ahora = time.time()
+    conn = _conectar()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        sin_terminar = conn.execute(
+            "SELECT COUNT(*) FROM trabajos WHERE estado IN ('pendiente', 'en_curso')"
+        ).fetchone()[0]
+        if sin_terminar >= MAX_SIN_TERMINAR:
+            conn.execute("ROLLBACK")
+            raise ColaLlena(
+                f"Hay {sin_terminar} informes en espera. Vuelve a intentarlo dentro de unos minutos."
+            )
+        conn.execute(
+            "INSERT INTO trabajos (id, estado, ambito, entrada, disponible, creado, actualizado) "
+            "VALUES (?, 'pendiente', ?, ?, ?, ?, ?)",
+            (trabajo_id, ambito, json.dumps(entrada, ensure_ascii=False, default=str), ahora, ahora, ahora),
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return trabajo_id
+
+
+def estado(trabajo_id):
+    """
+    Estado del trabajo: {"estado", "intentos", "error", "posicion" (en la cola,
+    si está pendiente)} y, si está hecho, "pdf" y "salida" (afecciones, mapa
+    web, capas agotadas y tiempos). None si no existe.
+    """
+    conn = _conectar()
+    try:
+        fila = conn.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+        if fila is None:
+            return None
+        resultado = {"estado": fila["estado"], "intentos": fila["intentos"], "error": fila["error"]}
+        if fila["estado"] == "pendiente":
+            resultado["posicion"] = conn.execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado = 'pendiente' AND creado <= ?", (fila["creado"],)
+            ).fetchone()[0]
+        if fila["estado"] == "hecho":
+            resultado["pdf"] = bytes(fila["pdf"])
+            resultado["salida"] = json.loads(fila["salida"])
+        return resultado
+    finally:
+        conn.close()
+
+
+# === LADO DE LOS PROCESOS ===
+def _tomar(conn):
+    """Marca como en curso el trabajo pendiente más antiguo que esté disponible y lo devuelve (o None)."""
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Trabajos que nadie renueva (su proceso se cayó): otra vez a la cola, si les quedan intentos
+        conn.execute(
+            "UPDATE trabajos SET estado = CASE WHEN intentos >= ? THEN 'error' ELSE 'pendiente' END, "
+            "error = 'Proceso interrumpido', disponible = ?, actualizado = ? "
+            "WHERE estado = 'en_curso' AND actualizado < ?",
+            (MAX_INTENTOS, ahora, ahora, ahora - ABANDONO),
+        )
+        conn.execute(
+            "DELETE FROM trabajos WHERE estado IN ('hecho', 'error') AND actualizado < ?", (ahora - TTL,)
+        )
+        fila = conn.execute(
+            "SELECT * FROM trabajos WHERE estado = 'pendiente' AND disponible <= ? ORDER BY creado LIMIT 1",
+            (ahora,),
+        ).fetchone()
+        if fila is not None:
+            conn.execute(
+                "UPDATE trabajos SET estado = 'en_curso', intentos = intentos + 1, actualizado = ? WHERE id = ?",
+                (ahora, fila["id"]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return fila
+
+
+def generar(ambito, entrada):
+    """Genera el informe de un trabajo: (pdf, salida) con las mismas etapas que la página."""
+    import geopandas as gpd
+
+    from afecciones import etapas, red
+    from afecciones.capas import capas_tiempo_agotado
+    from afecciones.informe_pdf import etapas_informe, transformar_coordenadas
+
+    x, y = entrada["x"], entrada["y"]
+    geom = shapely.from_wkb(bytes.fromhex(entrada["geom"]))
+    parcela_gdf = None
+    if entrada.get("parcelas"):
+        parcela_gdf = gpd.GeoDataFrame.from_features(json.loads(entrada["parcelas"]), crs="EPSG:25830")
+    lon, lat = transformar_coordenadas(x, y)
+    if lon is None:
+        raise ValueError(f"Coordenadas fuera de rango: {x}, {y}")
+
+    ejecucion = etapas.ejecutar(etapas_informe(
+        entrada["solicitante"], x, y, lon, lat, tuple(entrada["localizacion"]), geom, parcela_gdf, ambito,
+        red.Plazo(),
+    ))
+    hechas, errores = ejecucion["resultados"], ejecucion["errores"]
+    if "pdf" not in hechas:
+        raise errores.get("pdf") or RuntimeError("No se generó el PDF")
+    mapa_html, afecciones = hechas.get("mapa_web", (None, []))
+    salida = {
+        "afecciones": afecciones or [r["texto"] for r in hechas["afecciones"].values()],
+        "mapa_html": mapa_html,
+        "agotadas": capas_tiempo_agotado(hechas["afecciones"]),
+        "tiempos": etapas.resumen(ejecucion["tiempos"], ejecucion["total"]),
+    }
+    return hechas["pdf"], salida
+
+
+def _latido(trabajo_id, parar):
+    """Renueva el trabajo mientras se genera, para que no se dé por abandonado."""
+    conn = _conectar()
+    try:
+        while not parar.wait(LATIDO):
+            conn.execute(
+                "UPDATE trabajos SET actualizado = ? WHERE id = ? AND estado = 'en_curso'",
+                (time.time(), trabajo_id),
+            )
+    except sqlite3.Error as e:
+        logger.warning("Trabajo %s: no se pudo renovar (%s)", trabajo_id, e)
+    finally:
+        conn.close()
+
+
+def procesar_siguiente(conn):
+    """Genera el siguiente trabajo de la cola; devuelve False si no había ninguno."""
+    fila = _tomar(conn)
+    if fila is None:
+        return False
+    trabajo_id, intentos = fila["id"], fila["intentos"] + 1
+    parar = threading.Event()
+    latido = threading.Thread(target=_latido, args=(trabajo_id, parar), daemon=True)
+    latido.start()
+    try:
+        pdf, salida = generar(fila["ambito"], json.loads(fila["entrada"]))
+    except Exception as e:
+        logger.warning("Trabajo %s, intento %d: %s", trabajo_id, intentos, e)
+        if intentos >= MAX_INTENTOS:
+            conn.execute(
+                "UPDATE trabajos SET estado = 'error', error = ?, actualizado = ? WHERE id = ?",
+                (str(e), time.time(), trabajo_id),
+            )
+        else:
+            # Reintento con espera creciente: 10 s, 20 s, 40 s...
+            conn.execute(
+                "UPDATE trabajos SET estado = 'pendiente', error = ?, disponible = ?, actualizado = ? WHERE id = ?",
+                (str(e), time.time() + 10 * 2 ** (intentos - 1), time.time(), trabajo_id),
+            )
+        return True
+    finally:
+        parar.set()
+        latido.join()
+    conn.execute(
+        "UPDATE trabajos SET estado = 'hecho', error = NULL, pdf = ?, salida = ?, actualizado = ? WHERE id = ?",
+        (pdf, json.dumps(salida, ensure_ascii=False), time.time(), trabajo_id),
+    )
+    logger.info("Trabajo %s hecho (%s)", trabajo_id, salida["tiempos"])
+    return True
+
+
+def _bucle():
+    # Fuera de una sesión, Streamlit avisa en cada llamada a st.*: no aporta nada aquí
+    from streamlit import logger as st_logger
+
+    st_logger.set_log_level("error")
+    logging.basicConfig(level=logging.INFO, format=f"[{os.getpid()}] %(message)s")
+    conn = _conectar()
+    while True:
+        try:
+            if not procesar_siguiente(conn):
+                time.sleep(ESPERA)
+        except sqlite3.Error as e:
+            logger.warning("Cola no disponible: %s", e)
+            time.sleep(ESPERA)
+
+
+def trabajar(procesos=None):
+    """Lanza `procesos` procesos (por defecto, uno por CPU) que atienden la cola hasta que se interrumpen."""
+    contexto = multiprocessing.get_context("spawn")
+    hijos = [contexto.Process(target=_bucle, daemon=True) for _ in range(procesos or os.cpu_count() or 1)]
+    for hijo in hijos:
+        hijo.start()
+    logger.info("%d procesos atendiendo %s", len(hijos), COLA_DB)
+    try:
+        for hijo in hijos:
+            hijo.join()
+    except KeyboardInterrupt:
+        pass
+
+
+def resumen():
+    """{estado: número de trabajos}."""
+    conn = _conectar()
+    try:
+        return dict(conn.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cola persistente de informes de afecciones.")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    p_trabajar = ordenes.add_parser("trabajar", help="genera los informes encolados")
+    p_trabajar.add_argument("--procesos", type=int, default=None, help="procesos en paralelo (por defecto, uno por CPU)")
+    ordenes.add_parser("estado", help="número de trabajos en cada estado")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.orden == "trabajar":
+        trabajar(args.procesos)
+    else:
+        for nombre, numero in sorted(resumen().items()):
+            print(f"{nombre}: {numero}")
+
+
+if __name__ == "__main__":
+    main()
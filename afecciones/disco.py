@@ -0,0 +1,92 @@
+"""
+Caché de ficheros en disco con caducidad y cuota.
+
+Cada entrada es un fichero con nombre sha1(clave). La fecha de modificación
+marca cuándo se descargó (caducidad) y la de acceso, que se actualiza
+explícitamente en cada lectura, cuándo se usó por última vez: al superar la
+cuota se borran primero las entradas usadas hace más tiempo (LRU).
+"""
+import hashlib
+import os
+import threading
+import time
+
+
+class CacheDisco:
+    # Cada cuántas escrituras se comprueba la cuota (recorrer el directorio cuesta)
+    COMPROBAR_CADA = 50
+
+    def __init__(self, directorio, ttl, cuota, extension=""):
+        self.directorio = directorio
+        self.ttl = ttl
+        self.cuota = cuota
+        self.extension = extension
+        self._lock = threading.Lock()
+        self._escrituras = 0
+
+    def ruta(self, clave):
+        """Ruta del fichero de la entrada (puede no existir)."""
+        nombre = hashlib.sha1(clave.encode()).hexdigest()
+        return os.path.join(self.directorio, nombre[:2], nombre + self.extension)
+
+    def leer(self, clave):
+        """Contenido (bytes) de la entrada o None si no existe o ha caducado."""
+        ruta = self.ruta(clave)
+        try:
+            modificado = os.path.getmtime(ruta)
+            if time.time() - modificado >= self.ttl:
+                return None
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+            os.utime(ruta, (time.time(), modificado))  # uso reciente, sin tocar la caducidad
+            return contenido
+        except OSError:
+            return None
+
+    def guardar(self, clave, contenido):
+        ruta = self.ruta(clave)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except OSError:
+            return  # la caché es opcional
+        with self._lock:
+            self._escrituras += 1
+            comprobar = self._escrituras % self.COMPROBAR_CADA == 1
+        if comprobar:
+            self.purgar()
+
+    def purgar(self):
+        """Borra las entradas caducadas y, si se supera la cuota, las menos usadas hasta quedar al 90 %."""
+        entradas = []
+        ahora = time.time()
+        for raiz, _, ficheros in os.walk(self.directorio):
+            for fichero in ficheros:
+                ruta = os.path.join(raiz, fichero)
+                try:
+                    datos = os.stat(ruta)
+                except OSError:
+                    continue
+                if ahora - datos.st_mtime >= self.ttl:
+                    self._borrar(ruta)
+                else:
+                    entradas.append((datos.st_atime, datos.st_size, ruta))
+
+        total = sum(tamano for _, tamano, _ in entradas)
+        if total <= self.cuota:
+            return
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.cuota * 0.9:
+                break
+            self._borrar(ruta)
+            total -= tamano
+
+    @staticmethod
+    def _borrar(ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
@@ -0,0 +1,116 @@
+"""
+Planificador de etapas con dependencias para generar un informe.
+
+Cada etapa es una función y la lista de etapas de las que depende; recibe
+sus resultados como argumentos con el nombre de la etapa. Las etapas sin
+dependencias pendientes se lanzan en hilos en cuanto se puede, de modo que
+lo independiente (mapa de localización, consultas de las capas, leyendas
+del mapa web) se solapa y el PDF se monta en cuanto tiene sus entradas.
+
+    resultado = etapas.ejecutar({
+        "afecciones": (lambda: consultar_afecciones(geom), []),
+        "localizacion": (lambda: imagen_localizacion(lon, lat), []),
+        "pdf": (lambda afecciones, localizacion: ..., ["afecciones", "localizacion"]),
+    })
+    resultado["resultados"]["pdf"], resultado["tiempos"], resultado["errores"]
+
+Si una etapa lanza una excepción, las que dependen de ella no se ejecutan y
+quedan también en "errores". Los hilos heredan el contexto de la sesión de
+Streamlit, así que los avisos (st.warning, st.error) de cada etapa se ven.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def _contexto_streamlit():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+
+def _medir(contexto, funcion, argumentos):
+    if contexto is not None:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+        add_script_run_ctx(threading.current_thread(), contexto)
+    inicio = time.perf_counter()
+    try:
+        return funcion(**argumentos), time.perf_counter() - inicio
+    finally:
+        if contexto is not None:
+            # El hilo vuelve al pool: que no quede ligado a esta sesión
+            add_script_run_ctx(threading.current_thread(), None)
+
+
+def ejecutar(etapas, max_hilos=None, al_esperar=None, intervalo=0.2):
+    """
+    Ejecuta {nombre: (función, [dependencias])} respetando las dependencias.
+    Devuelve {"resultados", "tiempos" (s por etapa), "errores" (excepción
+    por etapa) y "total" (s)}. `al_esperar(resultados)` se llama en el hilo
+    que ejecuta (el del script de Streamlit) cada `intervalo` s mientras
+    hay etapas en marcha, y una vez más al terminar: sirve para ir mostrando
+    el progreso.
+    """
+    for nombre, (_, dependencias) in etapas.items():
+        desconocidas = [d for d in dependencias if d not in etapas]
+        if desconocidas:
+            raise ValueError(f"La etapa {nombre} depende de etapas inexistentes: {', '.join(desconocidas)}")
+
+    contexto = _contexto_streamlit()
+    inicio = time.perf_counter()
+    pendientes = dict(etapas)
+    resultados, tiempos, errores = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=max_hilos or len(etapas) or 1) as ejecutor:
+        en_curso = {}
+        while pendientes or en_curso:
+            cambios = True
+            while cambios:
+                cambios = False
+                for nombre, (funcion, dependencias) in list(pendientes.items()):
+                    fallidas = [d for d in dependencias if d in errores]
+                    if fallidas:
+                        errores[nombre] = RuntimeError(f"No se ejecutó: falló {', '.join(fallidas)}")
+                        del pendientes[nombre]
+                        cambios = True
+                    elif all(d in resultados for d in dependencias):
+                        argumentos = {d: resultados[d] for d in dependencias}
+                        en_curso[ejecutor.submit(_medir, contexto, funcion, argumentos)] = nombre
+                        del pendientes[nombre]
+            if not en_curso:
+                if pendientes:
+                    raise ValueError(f"Dependencias circulares entre las etapas: {', '.join(pendientes)}")
+                break
+
+            hechos, _ = wait(
+                en_curso, timeout=intervalo if al_esperar is not None else None, return_when=FIRST_COMPLETED
+            )
+            for futuro in hechos:
+                nombre = en_curso.pop(futuro)
+                try:
+                    resultados[nombre], tiempos[nombre] = futuro.result()
+                except Exception as e:
+                    logger.warning("Etapa %s: %s", nombre, e)
+                    errores[nombre] = e
+            if al_esperar is not None and en_curso:
+                al_esperar(resultados)
+
+    if al_esperar is not None:
+        al_esperar(resultados)
+    total = time.perf_counter() - inicio
+    logger.info("Etapas: %s", resumen(tiempos, total))
+    return {"resultados": resultados, "tiempos": tiempos, "errores": errores, "total": total}
+
+
+def resumen(tiempos, total=None):
+    """Texto con el tiempo de cada etapa: "afecciones 3.2 s · localizacion 0.8 s · total 3.4 s"."""
+    partes = [f"{nombre} {segundos:.1f} s" for nombre, segundos in sorted(tiempos.items(), key=lambda t: -t[1])]
+    if total is not None:
+        partes.append(f"total {total:.1f} s")
+    return " · ".join(partes)
@@ -0,0 +1,165 @@
+"""
+Geometrías aportadas por el solicitante (huella de un proyecto) en lugar de
+una parcela catastral: fichero subido (GeoJSON, KML, GPKG o shapefile en
+.zip) o texto pegado (GeoJSON, WKT o lista de vértices).
+
+El fichero se copia a disco por trozos, sin tenerlo entero en memoria, y se
+lee por lotes de elementos. Cada lote se valida y se repara, se queda con
+las partes poligonales, se reproyecta a EPSG:25830 y se simplifica, y se
+une con lo leído antes: la memoria depende del tamaño del lote y de la
+geometría final, no del tamaño del fichero.
+"""
+import json
+import os
+import tempfile
+
+import geopandas as gpd
+import pyogrio
+import shapely
+
+MAX_MB = int(os.environ.get("AFECCIONES_GEOMETRIA_MAX_MB", 50))
+# Tolerancia de simplificación (m) y vértices máximos de la geometría de consulta
+SIMPLIFICACION_M = float(os.environ.get("AFECCIONES_GEOMETRIA_SIMPLIFICACION_M", 1.0))
+MAX_VERTICES = int(os.environ.get("AFECCIONES_GEOMETRIA_MAX_VERTICES", 20000))
+MAX_HECTAREAS = float(os.environ.get("AFECCIONES_GEOMETRIA_MAX_HA", 100000))
+LOTE_ELEMENTOS = 5000
+TROZO = 1024 * 1024
+
+EXTENSIONES = (".geojson", ".json", ".kml", ".kmz", ".gpkg", ".zip")
+
+
+def _crs_por_defecto(geoms):
+    """Sin CRS declarado: grados si las coordenadas caben en lon/lat; si no, UTM 30N."""
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geoms)
+    if -180 <= xmin <= xmax <= 180 and -90 <= ymin <= ymax <= 90:
+        return "EPSG:4326"
+    return "EPSG:25830"
+
+
+def _poligonal(geoms):
+    """Repara las geometrías y se queda con sus partes poligonales (array de Polygon)."""
+    geoms = shapely.make_valid(geoms[~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)])
+    partes = shapely.get_parts(geoms)
+    # make_valid puede devolver colecciones con líneas o puntos sueltos
+    partes = shapely.get_parts(partes)
+    return partes[shapely.get_type_id(partes) == 3]
+
+
+def _preparar_lote(geoms, crs):
+    poligonos = _poligonal(geoms)
+    if len(poligonos) == 0:
+        return None
+    serie = gpd.GeoSeries(poligonos, crs=crs or _crs_por_defecto(poligonos)).to_crs(epsg=25830)
+    return shapely.simplify(serie.to_numpy(), SIMPLIFICACION_M, preserve_topology=True)
+
+
+def _finalizar(partes):
+    if not partes:
+        raise ValueError("La geometría no contiene ningún polígono (se admiten polígonos y multipolígonos)")
+    geometria = shapely.make_valid(shapely.union_all(partes))
+    geometria = shapely.simplify(geometria, SIMPLIFICACION_M, preserve_topology=True)
+    if geometria.is_empty or geometria.area == 0:
+        raise ValueError("La geometría está vacía o no tiene superficie")
+    if geometria.area / 10000 > MAX_HECTAREAS:
+        raise ValueError(f"La geometría supera el máximo de {MAX_HECTAREAS:,.0f} ha".replace(",", "."))
+    if shapely.get_num_coordinates(geometria) > MAX_VERTICES:
+        raise ValueError(f"La geometría tiene demasiados vértices incluso simplificada (máximo {MAX_VERTICES})")
+    return geometria
+
+
+def _ruta_lectura(ruta, nombre):
+    extension = os.path.splitext(nombre.lower())[1]
+    if extension == ".zip":
+        # Shapefile comprimido: GDAL lo lee del .zip sin descomprimirlo
+        return f"/vsizip/{ruta}"
+    if extension == ".kmz":
+        return f"/vsizip/{ruta}/doc.kml"
+    return ruta
+
+
+def leer_fichero(fichero, nombre):
+    """
+    Geometría de consulta (EPSG:25830) de un fichero subido (objeto con
+    read(), p. ej. el de st.file_uploader). ValueError con el motivo si no vale.
+    """
+    if not nombre.lower().endswith(EXTENSIONES):
+        raise ValueError(f"Formato no admitido; usa {', '.join(EXTENSIONES)}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ruta = os.path.join(tmpdir, "geometria" + os.path.splitext(nombre.lower())[1])
+        copiado = 0
+        with open(ruta, "wb") as f:
+            while True:
+                trozo = fichero.read(TROZO)
+                if not trozo:
+                    break
+                copiado += len(trozo)
+                if copiado > MAX_MB * 1024 * 1024:
+                    raise ValueError(f"El fichero supera el máximo de {MAX_MB} MB")
+                f.write(trozo)
+
+        ruta_lectura = _ruta_lectura(ruta, nombre)
+        try:
+            info = pyogrio.read_info(ruta_lectura)
+        except Exception as e:
+            raise ValueError(f"No se pudo leer el fichero: {e}") from e
+        partes = []
+        for inicio in range(0, max(info["features"], 0), LOTE_ELEMENTOS):
+            lote = gpd.read_file(
+                ruta_lectura, columns=[], skip_features=inicio, max_features=LOTE_ELEMENTOS
+            )
+            preparadas = _preparar_lote(lote.geometry.to_numpy(), lote.crs)
+            if preparadas is not None:
+                # Se une lote a lote para no acumular todos los polígonos
+                partes = [shapely.union_all([*partes, *preparadas])]
+        return _finalizar(partes)
+
+
+def leer_texto(texto):
+    """
+    Geometría de consulta (EPSG:25830) de un texto pegado: GeoJSON, WKT o
+    vértices "x y" (o "x;y") uno por línea. Sin CRS: lon/lat si lo parece, si no UTM 30N.
+    """
+    texto = texto.strip()
+    if not texto:
+        raise ValueError("No se ha indicado ninguna geometría")
+    try:
+        if texto.startswith("{"):
+            objeto = json.loads(texto)
+            if objeto.get("type") == "FeatureCollection":
+                geoms = gpd.GeoDataFrame.from_features(objeto).geometry.to_numpy()
+            elif objeto.get("type") == "Feature":
+                geoms = gpd.GeoDataFrame.from_features([objeto]).geometry.to_numpy()
+            else:
+                geoms = shapely.from_geojson([json.dumps(objeto)])
+        elif texto[0].isalpha():
+            geoms = shapely.from_wkt([texto])
+        else:
+            vertices = [
+                tuple(float(v.replace(",", ".")) for v in linea.replace(";", " ").split()[:2])
+                for linea in texto.splitlines() if linea.strip()
+            ]
+            if len(vertices) < 3:
+                raise ValueError("Hacen falta al menos tres vértices")
+            geoms = shapely.polygons([vertices])
+    except Exception as e:
+        raise ValueError(f"No se pudo interpretar la geometría: {e}") from e
+    preparadas = _preparar_lote(geoms, None)
+    return _finalizar([] if preparadas is None else list(preparadas))
+
+
+def punto_referencia(geometria):
+    """X/Y (redondeadas) de un punto interior de la geometría, para el mapa y el informe."""
+    punto = geometria.representative_point()
+    return round(punto.x, 2), round(punto.y, 2)
+
+
+def desde_sesion(wkb_hex):
+    """(GeoDataFrame para el mapa, geometría de consulta) guardados por el lanzador."""
+    geometria = shapely.from_wkb(bytes.fromhex(wkb_hex))
+    return gpd.GeoDataFrame(geometry=[geometria], crs="EPSG:25830"), geometria
+
+
+def a_sesion(geometria):
+    """WKB (hex) de la geometría para pasarla a la página del informe por session_state."""
+    return shapely.to_wkb(geometria, hex=True)
+
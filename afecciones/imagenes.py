@@ -0,0 +1,77 @@
+"""
+Imágenes del PDF en memoria.
+
+Los mapas se reducen a la resolución de impresión y se comprimen (JPEG para
+el mapa de teselas, PNG con paleta para el mapa temático, de colores planos).
+Se incrustan en el PDF sin pasar por disco registrándolos directamente en
+`pdf.images`, la caché de imágenes de FPDF: `pdf.image(nombre, ...)`
+encuentra la imagen ya registrada y no intenta abrir ningún fichero.
+"""
+import zlib
+from io import BytesIO
+
+from PIL import Image
+
+# Resolución de impresión de los mapas del PDF
+IMPRESION_DPI = 150
+
+
+def reducir(imagen, ancho_mm, dpi=IMPRESION_DPI):
+    """La imagen reducida (nunca ampliada) al ancho en píxeles que ocupará impresa."""
+    ancho = round(ancho_mm / 25.4 * dpi)
+    if imagen.width <= ancho:
+        return imagen
+    return imagen.resize((ancho, round(imagen.height * ancho / imagen.width)), Image.LANCZOS)
+
+
+def a_jpeg(imagen, ancho_mm, calidad=85):
+    buffer = BytesIO()
+    reducir(imagen.convert("RGB"), ancho_mm).save(buffer, format="JPEG", quality=calidad, optimize=True)
+    return buffer.getvalue()
+
+
+def a_paleta(imagen, ancho_mm, colores=64):
+    buffer = BytesIO()
+    reducida = reducir(imagen.convert("RGB"), ancho_mm)
+    reducida.quantize(colores).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def preparar(contenido):
+    """Diccionario de imagen en el formato interno de FPDF (_parsejpg / _parsepng)."""
+    imagen = Image.open(BytesIO(contenido))
+    if imagen.format == "JPEG" and imagen.mode in ("RGB", "L"):
+        # El JPEG se incrusta tal cual
+        return {
+            "w": imagen.width, "h": imagen.height, "bpc": 8, "f": "DCTDecode", "data": contenido,
+            "cs": "DeviceRGB" if imagen.mode == "RGB" else "DeviceGray",
+        }
+    info = {"w": imagen.width, "h": imagen.height, "bpc": 8, "f": "FlateDecode"}
+    if imagen.mode == "P":
+        info["cs"] = "Indexed"
+        info["pal"] = bytes(imagen.getpalette())
+    elif imagen.mode == "L":
+        info["cs"] = "DeviceGray"
+    else:
+        imagen = imagen.convert("RGB")  # sin canal alfa (FPDF 1.7 no lo admite)
+        info["cs"] = "DeviceRGB"
+    info["data"] = zlib.compress(imagen.tobytes())
+    return info
+
+
+def registrar(pdf, nombre, contenido=None, info=None):
+    """
+    Registra la imagen en el PDF con ese nombre, una sola vez: a partir de sus
+    bytes (JPEG o PNG) o de la `info` ya preparada con preparar().
+    """
+    if nombre not in pdf.images:
+        # Copia: FPDF borra los datos de la imagen del diccionario al escribir el PDF
+        info = dict(info) if info is not None else preparar(contenido)
+        info["i"] = len(pdf.images) + 1
+        pdf.images[nombre] = info
+
+
+def imagen(pdf, nombre, contenido, x=None, y=None, w=0, h=0):
+    """Como pdf.image, pero con la imagen en memoria."""
+    registrar(pdf, nombre, contenido)
+    pdf.image(nombre, x=x, y=y, w=w, h=h)
@@ -0,0 +1,180 @@
+"""
+Índice espacial combinado de las capas de afección cacheadas.
+
+Cada capa aporta un bloque (sus elementos deduplicados por ID de WFS) con sus
+geometrías ya preparadas; sobre los bloques de todas las capas hay un único
+STRtree, así que una consulta con la geometría de la parcela recorre un solo
+árbol para todas las capas y filtra los candidatos con una pasada vectorizada
+de intersección exacta.
+
+Cuando llegan piezas nuevas de una capa (celdas de la rejilla o la capa
+completa) solo se rehace el bloque de esa capa; el árbol combinado se
+reconstruye en la siguiente consulta sobre las geometrías ya preparadas de
+todos los bloques, sin volver a leerlas. Cada capa guarda como mucho MAX_PIEZAS piezas: se descartan
+las usadas hace más tiempo, nunca las usadas en los últimos RETENCION
+segundos (pueden estar a mitad de una consulta), así que la memoria no crece
+con la vida del proceso.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+MAX_PIEZAS = int(os.environ.get("AFECCIONES_INDICE_MAX_PIEZAS", 128))
+RETENCION = float(os.environ.get("AFECCIONES_INDICE_RETENCION", 300))
+
+
+def _id_elemento(elemento):
+    return elemento.get("id") or hashlib.sha1(json.dumps(elemento, sort_keys=True).encode()).hexdigest()
+
+
+def _bloque(capa):
+    """Bloque y geometrías preparadas de una capa; no se modifican una vez creados."""
+    elementos = {}
+    for por_id in capa["elementos"].values():
+        for id_elemento, elemento in por_id.items():
+            elementos.setdefault(id_elemento, elemento)
+    if elementos:
+        gdf = gpd.GeoDataFrame.from_features(list(elementos.values()), crs="EPSG:25830")
+        gdf.index = list(elementos.keys())
+    else:
+        gdf = gpd.GeoDataFrame(geometry=[], crs="EPSG:25830")
+    geometrias = gdf.geometry.to_numpy()
+    # Preparadas aquí, bajo el lock: las consultas de los hilos no las modifican
+    shapely.prepare(geometrias)
+    return {"gdf": gdf, "geometrias": geometrias}
+
+
+def _combinado(bloques):
+    """
+    Árbol único sobre los bloques {clave: bloque}: para cada elemento, la capa
+    (posición en "claves") y la fila de su bloque. Inmutable una vez creado.
+    """
+    claves = list(bloques)
+    partes = [bloques[clave]["geometrias"] for clave in claves]
+    geometrias = np.concatenate(partes) if partes else np.empty(0, dtype=object)
+    capa = np.repeat(np.arange(len(claves)), [len(parte) for parte in partes])
+    fila = np.concatenate([np.arange(len(parte)) for parte in partes]) if partes else np.empty(0, dtype=int)
+    return {
+        "claves": claves,
+        "bloques": [bloques[clave] for clave in claves],
+        "geometrias": geometrias,
+        "capa": capa,
+        "fila": fila,
+        "arbol": STRtree(geometrias),
+    }
+
+
+class IndiceAfecciones:
+    """Índice de capas. Seguro para hilos: las consultas usan una instantánea inmutable del árbol combinado."""
+
+    def __init__(self, max_piezas=MAX_PIEZAS, retencion=RETENCION):
+        self.max_piezas = max_piezas
+        self.retencion = retencion
+        self._lock = threading.Lock()
+        # clave -> {"piezas": {pieza: (hash, último uso)} de más antigua a más reciente,
+        #           "elementos": {pieza: {id: elemento}}, "bloque": ver _bloque}
+        self._capas = {}
+        self._combinado = None  # ver _combinado; None si hay que rehacerlo
+
+    def actualizar_capa(self, clave, piezas):
+        """
+        Incorpora las piezas de una capa ({pieza: GeoJSON en bytes}; las celdas de
+        la rejilla o la capa completa). Solo se leen las piezas nuevas o cambiadas,
+        solo se rehace el bloque de esa capa; el árbol combinado se reconstruye
+        en la siguiente consulta.
+        """
+        hashes = {pieza: hashlib.sha1(contenido).hexdigest() for pieza, contenido in piezas.items()}
+        ahora = time.monotonic()
+        with self._lock:
+            capa = self._capas.setdefault(clave, {"piezas": OrderedDict(), "elementos": {}, "bloque": None})
+            cambiadas = [pieza for pieza, h in hashes.items() if capa["piezas"].get(pieza, (None,))[0] != h]
+            for pieza in cambiadas:
+                features = json.loads(piezas[pieza]).get("features", [])
+                capa["elementos"][pieza] = {_id_elemento(f): f for f in features}
+            for pieza, h in hashes.items():
+                capa["piezas"][pieza] = (h, ahora)
+                capa["piezas"].move_to_end(pieza)
+
+            descartadas = 0
+            while len(capa["piezas"]) > self.max_piezas:
+                pieza, (_, usada) = next(iter(capa["piezas"].items()))
+                if usada > ahora - self.retencion:
+                    break
+                del capa["piezas"][pieza]
+                del capa["elementos"][pieza]
+                descartadas += 1
+
+            if cambiadas or descartadas or capa["bloque"] is None:
+                capa["bloque"] = _bloque(capa)
+                # El árbol combinado se rehace en la siguiente consulta, una vez
+                # aunque hayan llegado varias capas seguidas
+                self._combinado = None
+
+    def _instantanea(self):
+        with self._lock:
+            if self._combinado is None:
+                self._combinado = _combinado({clave: capa["bloque"] for clave, capa in self._capas.items()})
+            return self._combinado
+
+    def limites(self, clave):
+        """total_bounds del bloque de la capa (o None si está vacío o no cargado)."""
+        gdf = self.bloque(clave)
+        if gdf is None or gdf.empty:
+            return None
+        return tuple(float(v) for v in gdf.total_bounds)
+
+    def bloque(self, clave):
+        """GeoDataFrame con los elementos cargados de la capa (None si no está cargada)."""
+        with self._lock:
+            capa = self._capas.get(clave)
+            return capa["bloque"]["gdf"] if capa is not None and capa["bloque"] else None
+
+    @staticmethod
+    def _capas_pedidas(combinado, claves):
+        return [n for n, clave in enumerate(combinado["claves"]) if claves is None or clave in claves]
+
+    def pares(self, geoms, claves=None):
+        """
+        Consulta masiva: {clave: (posiciones en `geoms`, filas del bloque de la
+        capa)} con todos los pares geometría-elemento que se intersecan, para
+        todas las capas cargadas (o solo las de `claves`), con un solo recorrido
+        del árbol combinado.
+        """
+        geoms = np.asarray(geoms)
+        combinado = self._instantanea()
+        # Candidatos por envolvente y prueba exacta con los elementos (ya preparados)
+        en_geoms, elementos = combinado["arbol"].query(geoms)
+        exactos = shapely.intersects(combinado["geometrias"][elementos], geoms[en_geoms])
+        en_geoms, elementos = en_geoms[exactos], elementos[exactos]
+        capas, filas = combinado["capa"][elementos], combinado["fila"][elementos]
+        return {
+            combinado["claves"][n]: (en_geoms[capas == n], filas[capas == n])
+            for n in self._capas_pedidas(combinado, claves)
+        }
+
+    def query(self, geom, claves=None):
+        """
+        {clave: GeoDataFrame con los elementos de la capa que intersecan `geom`}
+        para las capas cargadas (o solo las de `claves`), con una sola consulta
+        al árbol combinado.
+        """
+        combinado = self._instantanea()
+        candidatos = combinado["arbol"].query(geom)
+        candidatos = candidatos[shapely.intersects(combinado["geometrias"][candidatos], geom)]
+        capas, filas = combinado["capa"][candidatos], combinado["fila"][candidatos]
+        return {
+            combinado["claves"][n]: combinado["bloques"][n]["gdf"].iloc[np.sort(filas[capas == n])]
+            for n in self._capas_pedidas(combinado, claves)
+        }
+
+
+# Índice compartido por todas las sesiones del proceso
+indice = IndiceAfecciones()
@@ -0,0 +1,1352 @@
+"""
+Generación del informe PDF de afecciones, común a las páginas de la Región de
+Murcia y de Castilla-La Mancha y al generador por lotes (afecciones.lote).
+
+Funciona también sin interfaz: los avisos de Streamlit (st.error, st.warning)
+no muestran nada fuera de una sesión.
+"""
+import os
+import textwrap
+from datetime import datetime
+
+import geopandas as gpd
+import streamlit as st
+from fpdf import FPDF
+from pyproj import Transformer
+
+from afecciones import archivo, avisos, imagenes, paginas_pdf, recursos, red, secciones_pdf
+from afecciones.capas import (
+    CAPAS, _descargar_geojson, capas_tiempo_agotado, consultar_afecciones, desglose_por_parcela,
+    versiones_locales,
+)
+from afecciones.mapas import crear_mapa, imagen_localizacion, imagen_tematica, precargar_leyendas
+
+
+# Función para transformar coordenadas de ETRS89 a WGS84
+def transformar_coordenadas(x, y):
+    try:
+        x, y = float(x), float(y)
+        if not (500000 <= x <= 800000 and 4000000 <= y <= 4800000):
+            avisos.avisar("error", "Coordenadas fuera del rango esperado para ETRS89 UTM Zona 30")
+            return None, None
+        transformer = Transformer.from_crs("EPSG:25830", "EPSG:4326", always_xy=True)
+        lon, lat = transformer.transform(x, y)
+        return lon, lat
+    except ValueError:
+        avisos.avisar("error", "Coordenadas inválidas. Asegúrate de ingresar valores numéricos.")
+        return None, None
+
+# Función para generar la imagen estática del mapa usando py-staticmaps
+def generar_imagen_estatica_mapa(x, y, zoom=16, size=(800, 600), plazo=None):
+    lon, lat = transformar_coordenadas(x, y)
+    if lon is None or lat is None:
+        return None
+    if plazo is not None and plazo.agotado():
+        return None
+    
+    try:
+        return imagen_localizacion(lon, lat, zoom=zoom, size=size, plazo=plazo)
+    except Exception as e:
+        avisos.avisar("error", f"Error al generar la imagen estática del mapa: {str(e)}")
+        return None
+
+# Mapa de la parcela con ENP, ZEPA, LIC, MUP y VP, dibujado desde las capas cacheadas (sin red)
+def generar_imagen_tematica(geom):
+    try:
+        return imagen_tematica(geom)
+    except Exception as e:
+        st.warning(f"No se pudo generar el mapa de afecciones: {str(e)}")
+        return None
+
+# Clase personalizada para el PDF con encabezado y pie de página
+class CustomPDF(FPDF):
+    def __init__(self, logo_path):
+        super().__init__()
+        self.logo_path = logo_path
+
+    def header(self):
+        logo = recursos.logo(self.logo_path) if self.logo_path else None
+        if logo:
+            try:
+                # --- ÁREA IMPRIMIBLE (SIN MÁRGENES) ---
+                available_width = self.w - self.l_margin - self.r_margin  # ¡CORRECTO!
+
+                max_logo_height = 25  # Altura fija
+
+                # Logo decodificado una vez por proceso (caché de recursos)
+                ratio = logo["ratio"]
+
+                # Escalar al ancho disponible
+                target_width = available_width
+                target_height = target_width / ratio
+
+                if target_height > max_logo_height:
+                    target_height = max_logo_height
+                    target_width = target_height * ratio
+
+                # --- CENTRAR DENTRO DEL ÁREA IMPRIMIBLE ---
+                x = self.l_margin + (available_width - target_width) / 2
+                y = 5
+
+                imagenes.registrar(self, "logo", info=logo["info"])
+                self.image("logo", x=x, y=y, w=target_width, h=target_height)
+                self.set_y(y + target_height + 3)
+
+            except Exception as e:
+                st.warning(f"Error al cargar logo: {e}")
+                self.set_y(30)
+        else:
+            self.set_y(30)
+
+    def footer(self):
+        if self.page_no() > 0:
+            self.set_y(-15)
+            self.set_draw_color(0, 0, 255)
+            self.set_line_width(0.5)
+            page_width = self.w - 2 * self.l_margin
+            self.line(self.l_margin, self.get_y(), self.l_margin + page_width, self.get_y())
+            
+            self.set_y(-15)
+            self.set_font("Arial", "", 9)
+            self.set_text_color(0, 0, 0)
+            self.cell(0, 10, f"Página {self.page_no()}", align="R")
+
+# Función para generar el PDF con los datos de la solicitud
+def hay_espacio_suficiente(pdf, altura_necesaria, margen_inferior=20):
+    """
+    Verifica si hay suficiente espacio en la página actual.
+    margen_inferior: espacio mínimo que debe quedar debajo
+    """
+    espacio_disponible = pdf.h - pdf.get_y() - margen_inferior
+    return espacio_disponible >= altura_necesaria
+
+def generar_pdf(datos, x, y, query_geom, ambito, plazo=None, mapas=None):
+    """
+    Genera el informe de la parcela (`query_geom`) y devuelve (PDF en bytes,
+    capas que dieron error al consultarlas), sin escribir en disco. `ambito`
+    es la página que lo pide: "carm" o "jccm". `mapas`: imágenes ya
+    renderizadas {"localizacion", "tematica"}; si no se dan, se generan aquí.
+    """
+    logo_path = recursos.LOGO_PATH
+
+    if not os.path.exists(logo_path):
+        st.error("FALTA EL ARCHIVO: 'logos.jpg' en la raíz del proyecto.")
+        st.markdown(
+            "Descárgalo aquí: [logos.jpg](https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/logos.jpg)"
+        )
+        logo_path = None
+
+    # === URLs DE LAS CAPAS (CATÁLOGO COMÚN) ===
+    urls = {clave: capa["url"] for clave, capa in CAPAS.items()}
+    vp_url = urls.get('vp')
+    zepa_url = urls.get('zepa')
+    lic_url = urls.get('lic')
+    enp_url = urls.get('enp')
+    esteparias_url = urls.get('esteparias')
+    uso_suelo_url = urls.get('uso_suelo')
+    tortuga_url = urls.get('tortuga')
+    perdicera_url = urls.get('perdicera')
+    nutria_url = urls.get('nutria')
+    fartet_url = urls.get('fartet')
+    malvasia_url = urls.get('malvasia')
+    garbancillo_url = urls.get('garbancillo')
+    flora_url = urls.get('flora')
+    
+    # Crear instancia de la clase personalizada
+    pdf = CustomPDF(logo_path)
+    pdf.set_margins(left=15, top=15, right=15)
+    pdf.add_page()
+
+    # TÍTULO GRANDE SOLO EN LA PRIMERA PÁGINA
+    pdf.set_font("Arial", "B", 16)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 12, "Informe preliminar de Afecciones Forestales", ln=True, align="C")
+    pdf.ln(10)
+
+    azul_rgb = (141, 179, 226)
+
+    campos_orden = [
+        ("Fecha informe", datos.get("fecha_informe", "").strip()),
+        ("Nombre", datos.get("nombre", "").strip()),
+        ("Apellidos", datos.get("apellidos", "").strip()),
+        ("DNI", datos.get("dni", "").strip()),
+        ("Dirección", datos.get("dirección", "").strip()),
+        ("Teléfono", datos.get("teléfono", "").strip()),
+        ("Email", datos.get("email", "").strip()),
+    ]
+
+    def seccion_titulo(texto):
+        pdf.set_fill_color(*azul_rgb)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Arial", "B", 13)
+        pdf.cell(0, 10, texto, ln=True, fill=True)
+        pdf.ln(2)
+
+    def campo_orden(pdf, titulo, valor):
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(50, 7, f"{titulo}:", ln=0)
+        pdf.set_font("Arial", "", 12)
+        
+        valor = valor.strip() if valor else "No especificado"
+        wrapped_text = textwrap.wrap(valor, width=60)
+        if not wrapped_text:
+            wrapped_text = ["No especificado"]
+        
+        for line in wrapped_text:
+            pdf.cell(0, 7, line, ln=1)
+
+    seccion_titulo("1. Datos del solicitante")
+    for titulo, valor in campos_orden:
+        campo_orden(pdf, titulo, valor)
+
+    objeto = datos.get("objeto de la solicitud", "").strip()
+    pdf.ln(2)
+    pdf.set_font("Arial", "B", 11)
+    pdf.cell(0, 7, "Objeto de la solicitud:", ln=True)
+    pdf.set_font("Arial", "", 11)
+    wrapped_objeto = textwrap.wrap(objeto if objeto else "No especificado", width=60)
+    for line in wrapped_objeto:
+        pdf.cell(0, 7, line, ln=1)
+        
+    seccion_titulo("2. Localización")
+    for campo in ["municipio", "polígono", "parcela"]:
+        valor = datos.get(campo, "").strip()
+        campo_orden(pdf, campo.capitalize(), valor if valor else "No disponible")
+
+    pdf.set_font("Arial", "B", 11)
+    pdf.cell(0, 10, f"Coordenadas ETRS89: X = {x}, Y = {y}", ln=True)
+
+    if mapas is None:
+        mapas = {
+            "localizacion": generar_imagen_estatica_mapa(x, y, plazo=plazo),
+            "tematica": generar_imagen_tematica(query_geom),
+        }
+    imagen_mapa = mapas.get("localizacion")
+    imagen_tematica = mapas.get("tematica")
+    mapas_pdf = []
+    if imagen_mapa:
+        mapas_pdf.append(("Mapa de localización", "mapa_localizacion", imagen_mapa))
+    if imagen_tematica:
+        mapas_pdf.append(("Afecciones del entorno", "mapa_afecciones", imagen_tematica))
+
+    if mapas_pdf:
+        # Los dos mapas (localización y afecciones) uno junto al otro, desde memoria
+        epw = pdf.w - 2 * pdf.l_margin
+        pdf.ln(5)
+        image_width = epw * (0.48 if len(mapas_pdf) > 1 else 0.5)
+        hueco = (epw - image_width * len(mapas_pdf)) / (len(mapas_pdf) + 1)
+        pdf.set_font("Arial", "B", 11)
+        y_titulo = pdf.get_y()
+        for n, (titulo, nombre_imagen, contenido) in enumerate(mapas_pdf):
+            x_mapa = pdf.l_margin + hueco + n * (image_width + hueco)
+            pdf.set_xy(x_mapa, y_titulo)
+            pdf.cell(image_width, 7, f"{titulo}:", align="C")
+            imagenes.imagen(pdf, nombre_imagen, contenido, x=x_mapa, y=y_titulo + 7, w=image_width)
+        pdf.set_y(y_titulo + 7 + image_width * 3 / 4 + 2)  # mapas en proporción 4:3
+    else:
+        pdf.set_font("Arial", "", 11)
+        pdf.cell(0, 7, "No se pudo generar el mapa de localización.", ln=True)
+
+    # === PÁGINAS 2..N: SOLO DEPENDEN DE LA PARCELA Y DE LAS AFECCIONES ===
+    # Si ya se generaron para esta parcela, se copian tal cual y solo se dibuja la página 1
+    clave_cuerpo = paginas_pdf.clave(ambito, datos, query_geom, secciones_pdf.VERSION_PLANTILLA)
+    if paginas_pdf.reutilizar(clave_cuerpo, pdf):
+        # Solo se guardan las páginas de informes sin capas con error
+        return pdf.output(dest='S').encode('latin1'), []
+
+    pdf.add_page()
+    # Si la página 1 se desbordó (dirección u objeto muy largos), la página en
+    # la que empieza el cuerpo lleva datos del solicitante: no se guarda
+    primera_cuerpo = pdf.page
+    pdf.ln(10)
+    seccion_titulo("3. Afecciones detectadas")
+
+    afecciones_keys = ["Afección TM"]
+    vp_key = "afección VP"
+    mup_key = "afección MUP"
+    zepa_key = "afección ZEPA"
+    lic_key = "afección LIC"
+    enp_key = "afección ENP"
+    esteparias_key = "afección ESTEPARIAS"
+    uso_suelo_key = "Afección PLANEAMIENTO"
+    tortuga_key = "Afección PLAN RECUPERACION TORTUGA MORA"
+    perdicera_key = "Afección PLAN RECUPERACION ÁGUILA PERDICERA"
+    nutria_key = "Afección PLAN RECUPERACION NUTRIA"
+    fartet_key = "Afección PLAN RECUPERACION FARTET"
+    malvasia_key = "Afección PLAN RECUPERACION MALVASIA"
+    garbancillo_key = "Afección PLAN RECUPERACION GARBANCILLO"
+    flora_key = "Afección PLAN RECUPERACION FLORA"
+        
+# === PROCESAR TODAS LAS CAPAS (VP, ZEPA, LIC, ENP) ===
+    filas_afecciones = datos.get("filas_afecciones", {})
+    capas_con_error = []  # si alguna capa falla, las páginas no se guardan para reutilizarlas
+
+    def procesar_capa(url, key, valor_inicial, campos, detectado_list):
+        valor = datos.get(key, "").strip()
+        if valor.startswith("Indeterminado"):
+            return valor  # servicio caído o sin respuesta dentro del plazo: no se reintenta
+        if valor and not valor.startswith("No afecta") and not valor.startswith("Error"):
+            # Filas ya obtenidas al consultar las afecciones (o leídas de la caché)
+            if filas_afecciones.get(key) is not None:
+                detectado_list.extend(filas_afecciones[key])
+                return "" if detectado_list else valor_inicial
+            try:
+                data = _descargar_geojson(url, plazo)
+                if data is None:
+                    capas_con_error.append(key)
+                    return "Error al consultar"
+                gdf = gpd.read_file(data)
+                seleccion = gdf[gdf.intersects(query_geom)]
+                if not seleccion.empty:
+                    for _, props in seleccion.iterrows():
+                        fila = tuple(props.get(campo, "N/A") for campo in campos)
+                        detectado_list.append(fila)
+                    return ""
+                return valor_inicial
+            except Exception as e:
+                st.error(f"Error al procesar {key}: {e}")
+                capas_con_error.append(key)
+                return "Error al consultar"
+        return valor_inicial if not detectado_list else ""
+
+    # === VP ===
+    vp_detectado = []
+    vp_valor = procesar_capa(
+        vp_url, "afección VP", "No afecta a ninguna Vía Pecuaria",
+        ["vp_cod", "vp_nb", "vp_mun", "vp_sit_leg", "vp_anch_lg"],
+        vp_detectado
+    )
+
+    # === ZEPA ===
+    zepa_detectado = []
+    zepa_valor = procesar_capa(
+        zepa_url, "afección ZEPA", "No afecta a ninguna Zona de especial protección para las aves",
+        ["site_code", "site_name"],
+        zepa_detectado
+    )
+
+    # === LIC ===
+    lic_detectado = []
+    lic_valor = procesar_capa(
+        lic_url, "afección LIC", "No afecta a ningún Lugar de Interés Comunitario",
+        ["site_code", "site_name"],
+        lic_detectado
+    )
+
+    # === ENP ===
+    enp_detectado = []
+    enp_valor = procesar_capa(
+        enp_url, "afección ENP", "No afecta a ningún Espacio Natural Protegido",
+        ["nombre", "figura"],
+        enp_detectado
+    )
+
+    # === ESTEPARIAS ===
+    esteparias_detectado = []
+    esteparias_valor = procesar_capa(
+        esteparias_url, "afección esteparias", "No afecta a zona de distribución de aves esteparias",
+        ["cuad_10km", "especie", "nombre"],
+        esteparias_detectado
+    )
+
+    # === USO DEL SUELO ===
+    uso_suelo_detectado = []
+    uso_suelo_valor = procesar_capa(
+        uso_suelo_url, "afección uso_suelo", "No afecta a ningún uso del suelo protegido",
+        ["Uso_Especifico", "Clasificacion"],
+        uso_suelo_detectado
+    )
+    
+    # === TORTUGA MORA ===
+    tortuga_detectado = []
+    tortuga_valor = procesar_capa(
+        tortuga_url, "afección tortuga", "No afecta al Plan de Recuperación de la tortuga mora",
+        ["cat_id", "cat_desc"],
+        tortuga_detectado
+    )
+
+    # === AGUILA PERDICERA ===
+    perdicera_detectado = []
+    perdicera_valor = procesar_capa(
+        perdicera_url, "afección perdicera", "No afecta al Plan de Recuperación del águila perdicera",
+        ["zona", "nombre"],
+        perdicera_detectado
+    )
+
+    # === NUTRIA ===
+    nutria_detectado = []
+    nutria_valor = procesar_capa(
+        nutria_url, "afección nutria", "No afecta al Plan de Recuperación de la nutria",
+        ["tipo_de_ar", "nombre"],
+        nutria_detectado
+    )    
+
+    # === FARTET ===
+    fartet_detectado = []
+    fartet_valor = procesar_capa(
+        fartet_url, "afección fartet", "No afecta al Plan de Recuperación del fartet",
+        ["clasificac", "nombre"],
+        fartet_detectado
+    )
+
+    # === MALVASIA ===
+    malvasia_detectado = []
+    malvasia_valor = procesar_capa(
+        malvasia_url, "afección malvasia", "No afecta al Plan de Recuperación de la malvasia",
+        ["clasificac", "nombre"],
+        malvasia_detectado
+    )
+
+    # === GARBANCILLO ===
+    garbancillo_detectado = []
+    garbancillo_valor = procesar_capa(
+        garbancillo_url, "afección garbancillo", "No afecta al Plan de Recuperación del garbancillo",
+        ["tipo", "nombre"],
+        garbancillo_detectado
+    )
+
+    # === FLORA ===
+    flora_detectado = []
+    flora_valor = procesar_capa(
+        flora_url, "afección flora", "No afecta al Plan de Recuperación de flora",
+        ["tipo", "nombre"],
+        flora_detectado
+    )
+
+    # === MUP (ya funciona bien, lo dejamos igual) ===
+    mup_valor = datos.get("afección MUP", "").strip()
+    mup_detectado = []
+    if mup_valor and not mup_valor.startswith(("No afecta", "Error", "Indeterminado")):
+        entries = mup_valor.replace("Dentro de MUP:\n", "").split("\n\n")
+        for entry in entries:
+            lines = entry.split("\n")
+            if lines:
+                mup_detectado.append((
+                    lines[0].replace("ID: ", "").strip() if len(lines) > 0 else "N/A",
+                    lines[1].replace("Nombre: ", "").strip() if len(lines) > 1 else "N/A",
+                    lines[2].replace("Municipio: ", "").strip() if len(lines) > 2 else "N/A",
+                    lines[3].replace("Propiedad: ", "").strip() if len(lines) > 3 else "N/A"
+                ))
+        mup_valor = ""
+
+    # Procesar otras afecciones como texto
+    otras_afecciones = []
+    for key in afecciones_keys:
+        valor = datos.get(key, "").strip()
+        key_corregido = key  # ← SIN .replace()
+    
+        if valor and not valor.startswith("Error"):
+            otras_afecciones.append((key_corregido, valor))
+        else:
+            otras_afecciones.append((key_corregido, valor if valor else "No afecta"))
+
+    # Solo incluir MUP, VP, ZEPA, LIC, ENP, ESTEPARIAS, PLANEAMIENTO, TORTUGA, PERDICERA, NUTRIA, FARTET, MALVASIA, GARBANCILLO, FLORA en "otras afecciones" si NO tienen detecciones
+    if not flora_detectado:
+        otras_afecciones.append(("Afección a flora", flora_valor if flora_valor else "No afecta a Plan de Recuperación de flora"))
+    if not garbancillo_detectado:
+        otras_afecciones.append(("Afección a garbancillo", garbancillo_valor if garbancillo_valor else "No afecta a Plan de Recuperación del garbancillo"))
+    if not malvasia_detectado:
+        otras_afecciones.append(("Afección a malvasia", malvasia_valor if malvasia_valor else "No afecta a Plan de Recuperación de la malvasia"))
+    if not fartet_detectado:
+        otras_afecciones.append(("Afección a fartet", fartet_valor if fartet_valor else "No afecta a Plan de Recuperación del fartet"))
+    if not nutria_detectado:
+        otras_afecciones.append(("Afección a nutria", nutria_valor if nutria_valor else "No afecta a Plan de Recuperación de la nutria"))
+    if not perdicera_detectado:
+        otras_afecciones.append(("Afección a águila perdicera", perdicera_valor if perdicera_valor else "No afecta a Plan de Recuperación águila perdicera"))
+    if not tortuga_detectado:
+        otras_afecciones.append(("Afección a tortuga mora", tortuga_valor if tortuga_valor else "No afecta a Plan de Recuperación tortuga mora"))
+    if not uso_suelo_detectado:
+        otras_afecciones.append(("Afección Uso del Suelo", uso_suelo_valor if uso_suelo_valor else "No afecta a ningún uso del suelo protegido"))
+    if not esteparias_detectado:
+        otras_afecciones.append(("Afección Esteparias", esteparias_valor if esteparias_valor else "No se encuentra en zona de distribución de aves esteparias"))
+    if not enp_detectado:
+        otras_afecciones.append(("Afección ENP", enp_valor if enp_valor else "No se encuentra en ningún ENP"))
+    if not lic_detectado:
+        otras_afecciones.append(("Afección LIC", lic_valor if lic_valor else "No afecta a ningún LIC"))
+    if not zepa_detectado:
+        otras_afecciones.append(("Afección ZEPA", zepa_valor if zepa_valor else "No afecta a ninguna ZEPA"))
+    if not vp_detectado:
+        otras_afecciones.append(("Afección VP", vp_valor if vp_valor else "No afecta a ninguna VP"))
+    if not mup_detectado:
+        otras_afecciones.append(("Afección MUP", mup_valor if mup_valor else "No afecta a ningún MUP"))
+
+    # Mostrar otras afecciones con títulos en negrita    
+    if otras_afecciones:
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 8, "Otras afecciones:", ln=True)
+        pdf.ln(2)
+
+        line_height = 6
+        label_width = 55
+        text_width = pdf.w - 2 * pdf.l_margin - label_width
+
+        for titulo, valor in otras_afecciones:
+            if valor:
+                x = pdf.get_x()
+                y = pdf.get_y()
+
+                # Título
+                pdf.set_xy(x, y)
+                pdf.set_font("Arial", "B", 11)
+                pdf.cell(label_width, line_height, f"{titulo}:", border=0)
+
+                # Valor
+                pdf.set_xy(x + label_width, y)
+                pdf.set_font("Arial", "", 11)
+                pdf.multi_cell(text_width, line_height, valor, border=0)
+
+                pdf.ln(line_height)  # Avanzar solo lo necesario
+        pdf.ln(2)
+
+    # === TABLA USO DEL SUELO ===    
+    if uso_suelo_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(uso_suelo_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+            
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Planeamiento Urbano (PGOU):", ln=True)
+        pdf.ln(2)
+        col_w_uso = 50
+        col_w_clas = pdf.w - 2 * pdf.l_margin - col_w_uso
+        row_height = 5
+        pdf.set_font("Arial", "B", 11)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_uso, row_height, "Uso", border=1, fill=True)
+        pdf.cell(col_w_clas, row_height, "Clasificación", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for Uso_Especifico, Clasificacion in uso_suelo_detectado:
+            uso_lines = pdf.multi_cell(col_w_uso, 5, str(Uso_Especifico), split_only=True)
+            clas_lines = pdf.multi_cell(col_w_clas, 5, str(Clasificacion), split_only=True)
+            row_h = max(row_height, len(uso_lines) * 5, len(clas_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_uso, row_h)
+            pdf.rect(x + col_w_uso, y, col_w_clas, row_h)
+            uso_h = len(uso_lines) * 5
+            y_uso = y + (row_h - uso_h) / 2
+            pdf.set_xy(x, y_uso)
+            pdf.multi_cell(col_w_uso, 5, str(Uso_Especifico), align="L")
+            clas_h = len(clas_lines) * 5
+            y_clas = y + (row_h - clas_h) / 2
+            pdf.set_xy(x + col_w_uso, y_clas)
+            pdf.multi_cell(col_w_clas, 5, str(Clasificacion), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+        
+    # === TABLA VP ===
+    if vp_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(vp_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a Vías Pecuarias (VP):", ln=True)
+        pdf.ln(2)
+
+        # Configurar la tabla para VP
+        col_widths = [30, 50, 40, 40, 30]  # Anchos: Código, Nombre, Municipio, Situación Legal, Ancho Legal
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_widths[0], row_height, "Código", border=1, fill=True)
+        pdf.cell(col_widths[1], row_height, "Nombre", border=1, fill=True)
+        pdf.cell(col_widths[2], row_height, "Municipio", border=1, fill=True)
+        pdf.cell(col_widths[3], row_height, "Situación Legal", border=1, fill=True)
+        pdf.cell(col_widths[4], row_height, "Ancho Legal", border=1, fill=True)
+        pdf.ln()
+
+        # Agregar filas a la tabla
+        pdf.set_font("Arial", "", 10)
+
+        for codigo_vp, nombre, municipio, situacion_legal, ancho_legal in vp_detectado:
+
+            line_height = 5  # altura base de una línea
+
+            # Obtener altura necesaria para columnas multilínea
+            nombre_lines = pdf.multi_cell(col_widths[1], line_height, str(nombre), split_only=True)
+            if not nombre_lines:
+                nombre_lines = [""]  # evitar None
+            nombre_height = len(nombre_lines) * line_height
+
+            # Situación legal
+            sit_leg_lines = pdf.multi_cell(col_widths[3], line_height, str(situacion_legal), split_only=True)
+            if not sit_leg_lines:
+                sit_leg_lines = [""]  # evitar None
+            sit_leg_height = len(sit_leg_lines) * line_height
+
+            # Altura real de la fila
+            row_h = max(row_height, nombre_height, sit_leg_height)    
+
+            # Guardar posición actual
+            x = pdf.get_x()
+            y = pdf.get_y()
+
+            # --- 1) DIBUJAR LA FILA (EL MARCO COMPLETO) ---
+            pdf.rect(x, y, col_widths[0], row_h)
+            pdf.rect(x + col_widths[0], y, col_widths[1], row_h)
+            pdf.rect(x + col_widths[0] + col_widths[1], y, col_widths[2], row_h)
+            pdf.rect(x + col_widths[0] + col_widths[1] + col_widths[2], y, col_widths[3], row_h)
+            pdf.rect(x + col_widths[0] + col_widths[1] + col_widths[2] + col_widths[3], y, col_widths[4], row_h)
+
+            # --- 2) ESCRIBIR EL TEXTO DENTRO DE LAS CELDAS ---
+            # Código
+            pdf.set_xy(x, y)
+            pdf.multi_cell(col_widths[0], line_height, str(codigo_vp), align="L")
+
+            # Nombre (multilínea)
+            pdf.set_xy(x + col_widths[0], y)
+            pdf.multi_cell(col_widths[1], line_height, str(nombre), align="L")
+
+            # Municipio
+            pdf.set_xy(x + col_widths[0] + col_widths[1], y)
+            pdf.multi_cell(col_widths[2], line_height, str(municipio), align="L")
+
+            # Situación legal (multilínea)
+            pdf.set_xy(x + col_widths[0] + col_widths[1] + col_widths[2], y)
+            pdf.multi_cell(col_widths[3], line_height, str(situacion_legal), align="L")
+
+            # Ancho legal
+            pdf.set_xy(x + col_widths[0] + col_widths[1] + col_widths[2] + col_widths[3], y)
+            pdf.multi_cell(col_widths[4], line_height, str(ancho_legal), align="L")
+
+            # Mover a la siguiente fila
+            pdf.set_xy(x, y + row_h)
+
+        pdf.ln(5)  # Espacio adicional después de la tabla
+
+    # === TABLA MUP === 
+    if mup_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(mup_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a Montes (MUP):", ln=True)
+        pdf.ln(2)
+
+        # Configurar la tabla para MUP
+        line_height = 5
+        col_widths = [30, 80, 40, 40]
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        
+        # Cabecera
+        pdf.cell(col_widths[0], 5, "ID", border=1, fill=True)
+        pdf.cell(col_widths[1], 5, "Nombre", border=1, fill=True)
+        pdf.cell(col_widths[2], 5, "Municipio", border=1, fill=True)
+        pdf.cell(col_widths[3], 5, "Propiedad", border=1, fill=True)
+        pdf.ln()
+
+        # Filas
+        pdf.set_font("Arial", "", 10)
+        for id_monte, nombre, municipio, propiedad in mup_detectado:
+            # Calcular líneas necesarias por columna
+            id_lines = pdf.multi_cell(col_widths[0], line_height, str(id_monte), split_only=True) or [""]
+            nombre_lines = pdf.multi_cell(col_widths[1], line_height, str(nombre), split_only=True) or [""]
+            mun_lines = pdf.multi_cell(col_widths[2], line_height, str(municipio), split_only=True) or [""]
+            prop_lines = pdf.multi_cell(col_widths[3], line_height, str(propiedad), split_only=True) or [""]
+
+            # Altura de fila = máximo de líneas * line_height
+            row_h = max(
+                5,
+                len(id_lines) * line_height,
+                len(nombre_lines) * line_height,
+                len(mun_lines) * line_height,
+                len(prop_lines) * line_height
+            )
+
+            # Guardar posición
+            x = pdf.get_x()
+            y = pdf.get_y()
+
+            # Dibujar bordes de celdas
+            pdf.rect(x, y, col_widths[0], row_h)
+            pdf.rect(x + col_widths[0], y, col_widths[1], row_h)
+            pdf.rect(x + col_widths[0] + col_widths[1], y, col_widths[2], row_h)
+            pdf.rect(x + col_widths[0] + col_widths[1] + col_widths[2], y, col_widths[3], row_h)
+
+            # Escribir contenido centrado verticalmente
+            # ID
+            id_h = len(id_lines) * line_height
+            pdf.set_xy(x, y + (row_h - id_h) / 2)
+            pdf.multi_cell(col_widths[0], line_height, str(id_monte), align="L")
+
+            # Nombre
+            nombre_h = len(nombre_lines) * line_height
+            pdf.set_xy(x + col_widths[0], y + (row_h - nombre_h) / 2)
+            pdf.multi_cell(col_widths[1], line_height, str(nombre), align="L")
+
+            # Municipio
+            mun_h = len(mun_lines) * line_height
+            pdf.set_xy(x + col_widths[0] + col_widths[1], y + (row_h - mun_h) / 2)
+            pdf.multi_cell(col_widths[2], line_height, str(municipio), align="L")
+
+            # Propiedad
+            prop_h = len(prop_lines) * line_height
+            pdf.set_xy(x + col_widths[0] + col_widths[1] + col_widths[2], y + (row_h - prop_h) / 2)
+            pdf.multi_cell(col_widths[3], line_height, str(propiedad), align="L")
+
+            # Mover a siguiente fila
+            pdf.set_y(y + row_h)
+
+        pdf.ln(5)  # Espacio después de la tabla
+
+    # === TABLA ZEPA === 
+    if zepa_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(zepa_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a Zonas de Especial Protección para las Aves (ZEPA):", ln=True)
+        pdf.ln(2)
+        col_w_code = 30
+        col_w_name = pdf.w - 2 * pdf.l_margin - col_w_code
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_code, row_height, "Código", border=1, fill=True)
+        pdf.cell(col_w_name, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for site_code, site_name in zepa_detectado:
+            code_lines = pdf.multi_cell(col_w_code, 5, str(site_code), split_only=True)
+            name_lines = pdf.multi_cell(col_w_name, 5, str(site_name), split_only=True)
+            row_h = max(row_height, len(code_lines) * 5, len(name_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_code, row_h)
+            pdf.rect(x + col_w_code, y, col_w_name, row_h)
+            code_h = len(code_lines) * 5
+            y_code = y + (row_h - code_h) / 2
+            pdf.set_xy(x, y_code)
+            pdf.multi_cell(col_w_code, 5, str(site_code), align="L")
+            name_h = len(name_lines) * 5
+            y_name = y + (row_h - name_h) / 2
+            pdf.set_xy(x + col_w_code, y_name)
+            pdf.multi_cell(col_w_name, 5, str(site_name), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # === TALBA LIC === 
+    if lic_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(lic_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a Lugares de Importancia Comunitaria (LIC):", ln=True)
+        pdf.ln(2)
+        col_w_code = 30
+        col_w_name = pdf.w - 2 * pdf.l_margin - col_w_code
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_code, row_height, "Código", border=1, fill=True)
+        pdf.cell(col_w_name, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for site_code, site_name in lic_detectado:
+            code_lines = pdf.multi_cell(col_w_code, 5, str(site_code), split_only=True)
+            name_lines = pdf.multi_cell(col_w_name, 5, str(site_name), split_only=True)
+            row_h = max(row_height, len(code_lines) * 5, len(name_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_code, row_h)
+            pdf.rect(x + col_w_code, y, col_w_name, row_h)
+            code_h = len(code_lines) * 5
+            y_code = y + (row_h - code_h) / 2
+            pdf.set_xy(x, y_code)
+            pdf.multi_cell(col_w_code, 5, str(site_code), align="L")
+            name_h = len(name_lines) * 5
+            y_name = y + (row_h - name_h) / 2
+            pdf.set_xy(x + col_w_code, y_name)
+            pdf.multi_cell(col_w_name, 5, str(site_name), align="L") 
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+        
+    # === TABLA ENP === 
+    enp_detectado = list(set(tuple(row) for row in enp_detectado))  # ← ELIMINA DUPLICADOS
+    if enp_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(enp_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe     
+
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a Espacios Naturales Protegidos (ENP):", ln=True)
+        pdf.ln(2)
+
+        # --- ANCHO TOTAL DISPONIBLE ---
+        page_width = pdf.w - 2 * pdf.l_margin
+        col_widths = [page_width * 0.45, page_width * 0.55]  # 45% | 55%
+        line_height = 5
+
+        # --- CABECERA ---
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_widths[0], 5, "Nombre", border=1, fill=True)
+        pdf.cell(col_widths[1], 5, "Figura", border=1, fill=True, ln=True)
+
+        # --- FILAS ---
+        pdf.set_font("Arial", "", 10)
+        for nombre, figura in enp_detectado:
+            nombre = str(nombre)
+            figura = str(figura)
+
+            # Calcular líneas necesarias
+            nombre_lines = len(pdf.multi_cell(col_widths[0], line_height, nombre, split_only=True))
+            figura_lines = len(pdf.multi_cell(col_widths[1], line_height, figura, split_only=True))
+            row_height = max(5, nombre_lines * line_height, figura_lines * line_height)
+
+            x = pdf.get_x()
+            y = pdf.get_y()
+
+            # Dibujar bordes
+            pdf.rect(x, y, col_widths[0], row_height)
+            pdf.rect(x + col_widths[0], y, col_widths[1], row_height)
+
+            # Texto centrado verticalmente
+            pdf.set_xy(x, y + (row_height - nombre_lines * line_height) / 2)
+            pdf.multi_cell(col_widths[0], line_height, nombre)
+
+            pdf.set_xy(x + col_widths[0], y + (row_height - figura_lines * line_height) / 2)
+            pdf.multi_cell(col_widths[1], line_height, figura)
+
+            pdf.set_y(y + row_height)
+
+        pdf.ln(5)
+        
+    # === TABLA ESTEPARIAS ===
+    if esteparias_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(esteparias_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afecciones a zonas de distribución de aves esteparias:", ln=True)
+        pdf.ln(2)
+
+        col_cuad = 35
+        col_esp  = 50
+        col_nom  = pdf.w - 2 * pdf.l_margin - col_cuad - col_esp
+        line_height = 5
+
+        # --- CABECERA ---
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_cuad, 5, "Cuadrícula", border=1, fill=True)
+        pdf.cell(col_esp,  5, "Especie",     border=1, fill=True)
+        pdf.cell(col_nom,  5, "Nombre común", border=1, fill=True, ln=True)
+
+        # --- FILAS (TODO DENTRO DEL BUCLE) ---
+        pdf.set_font("Arial", "", 10)
+        for cuad, especie, nombre in esteparias_detectado:
+            # 1. Calcular altura de cada celda
+            cuad_l = len(pdf.multi_cell(col_cuad, line_height, str(cuad), split_only=True))
+            esp_l  = len(pdf.multi_cell(col_esp,  line_height, str(especie), split_only=True))
+            nom_l  = len(pdf.multi_cell(col_nom,  line_height, str(nombre), split_only=True))
+            row_h = max(5, cuad_l * line_height, esp_l * line_height, nom_l * line_height)
+
+            # 2. SALTO DE PÁGINA SI NO CABE
+            if pdf.get_y() + row_h > pdf.h - pdf.b_margin:
+                pdf.add_page()
+
+            # 3. Posición actual
+            x, y = pdf.get_x(), pdf.get_y()
+
+            # 4. Dibujar bordes
+            pdf.rect(x, y, col_cuad, row_h)
+            pdf.rect(x + col_cuad, y, col_esp, row_h)
+            pdf.rect(x + col_cuad + col_esp, y, col_nom, row_h)
+
+            # 5. Escribir texto (centrado verticalmente)
+            pdf.set_xy(x, y + (row_h - cuad_l * line_height) / 2)
+            pdf.multi_cell(col_cuad, line_height, str(cuad))
+
+            pdf.set_xy(x + col_cuad, y + (row_h - esp_l * line_height) / 2)
+            pdf.multi_cell(col_esp, line_height, str(especie))
+
+            pdf.set_xy(x + col_cuad + col_esp, y + (row_h - nom_l * line_height) / 2)
+            pdf.multi_cell(col_nom, line_height, str(nombre))
+
+            # 6. Avanzar a la siguiente fila
+            pdf.set_y(y + row_h)
+
+        pdf.ln(5)  # Espacio final
+
+    # === TABLA TORTUGA ===
+    if tortuga_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(tortuga_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación tortuga mora:", ln=True)
+        pdf.ln(2)
+        col_w_cat_id = 50
+        col_w_cat_desc = pdf.w - 2 * pdf.l_margin - col_w_cat_id
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_cat_id, row_height, "Cat_id", border=1, fill=True)
+        pdf.cell(col_w_cat_desc, row_height, "Clasificación", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for cat_id, cat_desc in tortuga_detectado:
+            cat_id_lines = pdf.multi_cell(col_w_cat_id, 5, str(cat_id), split_only=True)
+            cat_desc_lines = pdf.multi_cell(col_w_cat_desc, 5, str(cat_desc), split_only=True)
+            row_h = max(row_height, len(cat_id_lines) * 5, len(cat_desc_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_cat_id, row_h)
+            pdf.rect(x + col_w_cat_id, y, col_w_cat_desc, row_h)
+            cat_id_h = len(cat_id_lines) * 5
+            y_cat_id = y + (row_h - cat_id_h) / 2
+            pdf.set_xy(x, y_cat_id)
+            pdf.multi_cell(col_w_cat_id, 5, str(cat_id), align="L")
+            cat_desc_h = len(cat_desc_lines) * 5
+            y_cat_desc = y + (row_h - cat_desc_h) / 2
+            pdf.set_xy(x + col_w_cat_id, y_cat_desc)
+            pdf.multi_cell(col_w_cat_desc, 5, str(cat_desc), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+        
+    # === TABLA PERDICERA ===
+    if perdicera_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(perdicera_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación águila perdicera:", ln=True)
+        pdf.ln(2)
+        col_w_zona = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_zona
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_zona, row_height, "Zona", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for zona, nombre in perdicera_detectado:
+            zona_lines = pdf.multi_cell(col_w_zona, 5, str(zona), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(zona_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_zona, row_h)
+            pdf.rect(x + col_w_zona, y, col_w_nombre, row_h)
+            zona_h = len(zona_lines) * 5
+            y_zona = y + (row_h - zona_h) / 2
+            pdf.set_xy(x, y_zona)
+            pdf.multi_cell(col_w_zona, 5, str(zona), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_zona, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # === TABLA NUTRIA ===
+    if nutria_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(nutria_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación nutria:", ln=True)
+        pdf.ln(2)
+        col_w_tipo_de_ar = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_tipo_de_ar
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_tipo_de_ar, row_height, "Área", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for tipo_de_ar, nombre in nutria_detectado:
+            tipo_de_ar_lines = pdf.multi_cell(col_w_tipo_de_ar, 5, str(tipo_de_ar), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(tipo_de_ar_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_tipo_de_ar, row_h)
+            pdf.rect(x + col_w_tipo_de_ar, y, col_w_nombre, row_h)
+            tipo_de_ar_h = len(tipo_de_ar_lines) * 5
+            y_tipo_de_ar = y + (row_h - tipo_de_ar_h) / 2
+            pdf.set_xy(x, y_tipo_de_ar)
+            pdf.multi_cell(col_w_tipo_de_ar, 5, str(tipo_de_ar), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_tipo_de_ar, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # === TABLA FARTET ===
+    if fartet_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(fartet_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación fartet:", ln=True)
+        pdf.ln(2)
+        col_w_clasificac = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_clasificac
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_clasificac, row_height, "Área", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for clasificac, nombre in fartet_detectado:
+            clasificac_lines = pdf.multi_cell(col_w_clasificac, 5, str(clasificac), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(clasificac_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_clasificac, row_h)
+            pdf.rect(x + col_w_clasificac, y, col_w_nombre, row_h)
+            clasificac_h = len(clasificac_lines) * 5
+            y_clasificac = y + (row_h - clasificac_h) / 2
+            pdf.set_xy(x, y_clasificac)
+            pdf.multi_cell(col_w_clasificac, 5, str(clasificac), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_clasificac, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # === TABLA MALVASIA ===
+    if malvasia_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(malvasia_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación malvasia:", ln=True)
+        pdf.ln(2)
+        col_w_clasificac = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_clasificac
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_clasificac, row_height, "Área", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for clasificac, nombre in malvasia_detectado:
+            clasificac_lines = pdf.multi_cell(col_w_clasificac, 5, str(clasificac), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(clasificac_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_clasificac, row_h)
+            pdf.rect(x + col_w_clasificac, y, col_w_nombre, row_h)
+            clasificac_h = len(clasificac_lines) * 5
+            y_clasificac = y + (row_h - clasificac_h) / 2
+            pdf.set_xy(x, y_clasificac)
+            pdf.multi_cell(col_w_clasificac, 5, str(clasificac), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_clasificac, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # === TABLA GARBANCILLO ===
+    if garbancillo_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(garbancillo_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación garbancillo:", ln=True)
+        pdf.ln(2)
+        col_w_tipo = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_tipo
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_tipo, row_height, "Área", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for tipo, nombre in garbancillo_detectado:
+            tipo_lines = pdf.multi_cell(col_w_tipo, 5, str(tipo), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(tipo_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_tipo, row_h)
+            pdf.rect(x + col_w_tipo, y, col_w_nombre, row_h)
+            tipo_h = len(tipo_lines) * 5
+            y_tipo = y + (row_h - tipo_h) / 2
+            pdf.set_xy(x, y_tipo)
+            pdf.multi_cell(col_w_tipo, 5, str(tipo), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_tipo, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+        
+    # === TABLA FLORA ===
+    if flora_detectado:
+        # Estimamos altura: título + cabecera + filas + espacio
+        altura_estimada = 5 + 5 + (len(flora_detectado) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+        
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Afección a Plan de Recuperación flora:", ln=True)
+        pdf.ln(2)
+        col_w_tipo = 50
+        col_w_nombre = pdf.w - 2 * pdf.l_margin - col_w_tipo
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_tipo, row_height, "Área", border=1, fill=True)
+        pdf.cell(col_w_nombre, row_height, "Nombre", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for tipo, nombre in flora_detectado:
+            tipo_lines = pdf.multi_cell(col_w_tipo, 5, str(tipo), split_only=True)
+            nombre_lines = pdf.multi_cell(col_w_nombre, 5, str(nombre), split_only=True)
+            row_h = max(row_height, len(tipo_lines) * 5, len(nombre_lines) * 5)
+            x = pdf.get_x()
+            y = pdf.get_y()
+            pdf.rect(x, y, col_w_tipo, row_h)
+            pdf.rect(x + col_w_tipo, y, col_w_nombre, row_h)
+            tipo_h = len(tipo_lines) * 5
+            y_tipo = y + (row_h - tipo_h) / 2
+            pdf.set_xy(x, y_tipo)
+            pdf.multi_cell(col_w_tipo, 5, str(tipo), align="L")
+            nombre_h = len(nombre_lines) * 5
+            y_nombre = y + (row_h - nombre_h) / 2
+            pdf.set_xy(x + col_w_tipo, y_nombre)
+            pdf.multi_cell(col_w_nombre, 5, str(nombre), align="L")
+            pdf.set_y(y + row_h)
+        pdf.ln(5)        
+          
+    # === TABLA DESGLOSE POR PARCELA (FINCAS DE VARIAS PARCELAS) ===
+    desglose = datos.get("desglose_parcelas") or []
+    if desglose:
+        filas_desglose = []
+        for etiqueta, afecciones_parcela in desglose:
+            if not afecciones_parcela:
+                filas_desglose.append((etiqueta, "Sin afecciones", ""))
+            for nombre_capa, elementos in afecciones_parcela:
+                filas_desglose.append((etiqueta, nombre_capa, elementos))
+        altura_estimada = 5 + 5 + (len(filas_desglose) * 6) + 10
+        if not hay_espacio_suficiente(pdf, altura_estimada):
+            pdf.add_page()  # Salta a nueva página si no cabe
+
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(0, 5, "Desglose de afecciones por parcela:", ln=True)
+        pdf.ln(2)
+        col_w_parcela = 30
+        col_w_capa = 60
+        col_w_elementos = pdf.w - 2 * pdf.l_margin - col_w_parcela - col_w_capa
+        row_height = 5
+        pdf.set_font("Arial", "B", 10)
+        pdf.set_fill_color(*azul_rgb)
+        pdf.cell(col_w_parcela, row_height, "Parcela", border=1, fill=True)
+        pdf.cell(col_w_capa, row_height, "Afección", border=1, fill=True)
+        pdf.cell(col_w_elementos, row_height, "Elementos", border=1, fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for etiqueta, nombre_capa, elementos in filas_desglose:
+            columnas = [(col_w_parcela, str(etiqueta)), (col_w_capa, str(nombre_capa)), (col_w_elementos, str(elementos))]
+            row_h = max(
+                [row_height] + [len(pdf.multi_cell(ancho, 5, texto, split_only=True)) * 5 for ancho, texto in columnas]
+            )
+            if not hay_espacio_suficiente(pdf, row_h):
+                pdf.add_page()
+            x = pdf.get_x()
+            y = pdf.get_y()
+            for ancho, texto in columnas:
+                pdf.rect(x, y, ancho, row_h)
+                texto_h = len(pdf.multi_cell(ancho, 5, texto, split_only=True)) * 5
+                pdf.set_xy(x, y + (row_h - texto_h) / 2)
+                pdf.multi_cell(ancho, 5, texto, align="L")
+                x += ancho
+            pdf.set_y(y + row_h)
+        pdf.ln(5)
+
+    # Secciones fijas (procedimientos y CONDICIONADO): maquetación precalculada
+    secciones_pdf.escribir_procedimientos(pdf)
+    secciones_pdf.escribir_condicionado(pdf)
+
+    pdf.close()
+    if not capas_con_error and primera_cuerpo == 2:
+        paginas_pdf.guardar(clave_cuerpo, pdf, primera=primera_cuerpo)
+    return pdf.output(dest='S').encode('latin1'), capas_con_error
+
+
+# Campos del solicitante en `datos` (formulario de la página o columnas del CSV por lotes)
+CAMPOS_SOLICITANTE = ("nombre", "apellidos", "dni", "dirección", "teléfono", "email", "objeto de la solicitud")
+
+
+def fecha_hoy():
+    """Fecha del informe tal como se imprime en la página 1."""
+    return datetime.today().strftime('%d/%m/%Y')
+
+
+def datos_informe(solicitante, x, y, municipio, poligono, parcela, resultados):
+    """Diccionario `datos` del informe a partir del solicitante y del resultado de consultar_afecciones."""
+    datos = {
+        "fecha_informe": fecha_hoy(),
+        **{campo: solicitante.get(campo, "") for campo in CAMPOS_SOLICITANTE},
+        "coordenadas_x": x, "coordenadas_y": y,
+        "municipio": str(municipio), "polígono": str(poligono), "parcela": str(parcela)
+    }
+    for clave, capa in CAPAS.items():
+        datos[capa["clave_datos"]] = resultados[clave]["texto"]
+    datos["filas_afecciones"] = {
+        CAPAS[clave]["clave_datos"]: resultado["filas"] for clave, resultado in resultados.items()
+    }
+    return datos
+
+
+def desglose_finca(parcelas_gdf, resultados):
+    """
+    Desglose de una finca de varias parcelas para el informe: por parcela
+    ("Pol/Parcela"), [(nombre de la capa, "elemento 1, elemento 2")].
+    """
+    por_parcela = desglose_por_parcela(parcelas_gdf.geometry.to_numpy(), resultados)
+    return [
+        (
+            f"{masa}/{parcela}",
+            [(CAPAS[clave]["nombre"], ", ".join(nombres)) for clave, nombres in afecciones_parcela.items()],
+        )
+        for masa, parcela, afecciones_parcela in zip(parcelas_gdf["MASA"], parcelas_gdf["PARCELA"], por_parcela)
+    ]
+
+
+def clave_archivo(ambito, solicitante, localizacion, x, y, query_geom, fecha):
+    """
+    Clave del informe en el archivo, sin consultar ninguna capa: solicitante,
+    localización (municipio, polígono, parcela), coordenadas, geometría,
+    versión de cada capa en la parcela y fecha del informe (va impresa en la
+    página 1). None si alguna versión no se conoce.
+    """
+    versiones = versiones_locales(query_geom)
+    if versiones is None:
+        return None
+    return archivo.clave(
+        ambito,
+        {campo: solicitante.get(campo, "") for campo in CAMPOS_SOLICITANTE},
+        [str(valor) for valor in (*localizacion, x, y)],
+        query_geom, versiones, secciones_pdf.VERSION_PLANTILLA, fecha,
+    )
+
+
+def informe_archivado(ambito, solicitante, localizacion, x, y, query_geom):
+    """PDF archivado de una solicitud idéntica del mismo día o None; se mira antes de lanzar las etapas."""
+    clave_informe = clave_archivo(ambito, solicitante, localizacion, x, y, query_geom, fecha_hoy())
+    return archivo.leer(clave_informe) if clave_informe else None
+
+
+def obtener_informe(datos, x, y, query_geom, ambito, plazo=None, mapas=None):
+    """
+    PDF del informe: del archivo si ya se generó uno idéntico (ver
+    clave_archivo); si no, se genera y, si está completo, se archiva.
+    """
+    localizacion = (datos.get("municipio", ""), datos.get("polígono", ""), datos.get("parcela", ""))
+    clave_informe = clave_archivo(ambito, datos, localizacion, x, y, query_geom, datos.get("fecha_informe", ""))
+    pdf_bytes = archivo.leer(clave_informe) if clave_informe else None
+    if pdf_bytes is None:
+        pdf_bytes, capas_con_error = generar_pdf(datos, x, y, query_geom, ambito, plazo=plazo, mapas=mapas)
+        # Con «Error al consultar» impreso en alguna capa el informe no está completo
+        if clave_informe and not capas_con_error and archivo.archivable(datos):
+            archivo.guardar(clave_informe, pdf_bytes, ambito, datos)
+    return pdf_bytes
+
+
+def etapas_informe(
+    solicitante, x, y, lon, lat, localizacion, query_geom, parcela_gdf, ambito, plazo, anticipadas=None,
+    progreso=None,
+):
+    """
+    Etapas del informe para afecciones.etapas.ejecutar. En paralelo desde el
+    principio: consultas de las capas, mapa de localización y leyendas del
+    mapa web; tras las consultas, mapa temático, `datos` y mapa web; el PDF
+    en cuanto están `datos` y los dos mapas. `localizacion`: (municipio,
+    polígono, parcela) tal como salen en el informe. `anticipadas`: futuros
+    de afecciones.anticipo, que sustituyen a las etapas del mismo nombre.
+    `progreso`: lista a la que se añade (clave, resultado, segundos) según
+    termina cada capa.
+    """
+    anticipadas = anticipadas or {}
+
+    def anticipada(nombre, calcular):
+        # Si el cálculo anticipado ni siquiera ha empezado, se hace ahora; si no
+        # termina dentro del plazo del informe (o falla), también
+        futuro = anticipadas.get(nombre)
+        if futuro is None or futuro.cancel():
+            return calcular(), False
+        try:
+            resultado, avisos_anticipados = futuro.result(timeout=plazo.restante())
+        except Exception:
+            return calcular(), False
+        # Avisos del hilo anticipado (sin sesión de Streamlit): se muestran ahora
+        avisos.mostrar(avisos_anticipados)
+        return resultado, True
+
+    def consultar():
+        al_terminar = (lambda *capa: progreso.append(capa)) if progreso is not None else None
+        return consultar_afecciones(query_geom, plazo=plazo.reservando(red.RESERVA_PDF), al_terminar=al_terminar)
+
+    def afecciones():
+        resultados, anticipado = anticipada("afecciones", consultar)
+        if anticipado and capas_tiempo_agotado(resultados):
+            # Capas que no respondieron a tiempo en segundo plano: otro intento con el plazo del informe
+            resultados = consultar()
+        return resultados
+
+    def datos(afecciones):
+        resultado = datos_informe(solicitante, x, y, *localizacion, afecciones)
+        if parcela_gdf is not None and len(parcela_gdf) > 1:
+            resultado["desglose_parcelas"] = desglose_finca(parcela_gdf, afecciones)
+        return resultado
+
+    def mapa_web(afecciones, leyendas):
+        return crear_mapa(lon, lat, [r["texto"] for r in afecciones.values()], parcela_gdf=parcela_gdf)
+
+    def pdf(datos, mapa_localizacion, mapa_tematico):
+        mapas = {"localizacion": mapa_localizacion, "tematica": mapa_tematico}
+        return obtener_informe(datos, x, y, query_geom, ambito, plazo=plazo, mapas=mapas)
+
+    return {
+        "afecciones": (afecciones, []),
+        "mapa_localizacion": (
+            lambda: anticipada("mapa_localizacion", lambda: generar_imagen_estatica_mapa(x, y, plazo=plazo))[0], []
+        ),
+        "leyendas": (lambda: anticipada("leyendas", lambda: precargar_leyendas(plazo))[0], []),
+        "mapa_tematico": (lambda afecciones: generar_imagen_tematica(query_geom), ["afecciones"]),
+        "datos": (datos, ["afecciones"]),
+        "mapa_web": (mapa_web, ["afecciones", "leyendas"]),
+        "pdf": (pdf, ["datos", "mapa_localizacion", "mapa_tematico"]),
+    }
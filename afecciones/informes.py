@@ -0,0 +1,71 @@
+"""
+Informes PDF recientes, en memoria, para volver a descargarlos.
+
+Los PDF se generan en memoria y no se escriben en el directorio de trabajo.
+Cada sesión de Streamlit conserva como mucho MAX_POR_SESION (se descartan
+sus informes más antiguos, nunca los de otras sesiones); los que nadie lee
+en INFORMES_TTL segundos se descartan, para no acumular los de sesiones ya
+cerradas. Los que superan UMBRAL_MEMORIA pasan a un fichero temporal
+(SpooledTemporaryFile) que se borra solo al descartarlos.
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+MAX_POR_SESION = int(os.environ.get("AFECCIONES_MAX_INFORMES_SESION", 2))
+INFORMES_TTL = float(os.environ.get("AFECCIONES_INFORMES_TTL", 3600))
+UMBRAL_MEMORIA = 2 * 1024 * 1024
+
+_lock = threading.Lock()
+_informes = OrderedDict()  # id -> {"fichero": SpooledTemporaryFile, "sesion", "usado"}
+
+
+def _sesion_actual():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return ctx.session_id if ctx is not None else None
+    except Exception:
+        return None
+
+
+def _descartar(id_informe):
+    _informes.pop(id_informe)["fichero"].close()
+
+
+def guardar(contenido, sesion=None):
+    """
+    Guarda el PDF (bytes) y devuelve su identificador. `sesion`: id de la
+    sesión dueña del informe (por defecto, la de Streamlit en curso).
+    """
+    if sesion is None:
+        sesion = _sesion_actual()
+    fichero = tempfile.SpooledTemporaryFile(max_size=UMBRAL_MEMORIA)
+    fichero.write(contenido)
+    id_informe = uuid.uuid4().hex
+    ahora = time.monotonic()
+    with _lock:
+        _informes[id_informe] = {"fichero": fichero, "sesion": sesion, "usado": ahora}
+        for id_antiguo, informe in list(_informes.items()):
+            if informe["usado"] < ahora - INFORMES_TTL:
+                _descartar(id_antiguo)
+        de_la_sesion = [id_sesion for id_sesion, informe in _informes.items() if informe["sesion"] == sesion]
+        for id_antiguo in de_la_sesion[:-MAX_POR_SESION]:
+            _descartar(id_antiguo)
+    return id_informe
+
+
+def leer(id_informe):
+    """Bytes del PDF o None si ya se descartó."""
+    with _lock:
+        informe = _informes.get(id_informe)
+        if informe is None:
+            return None
+        informe["usado"] = time.monotonic()
+        _informes.move_to_end(id_informe)
+        informe["fichero"].seek(0)
+        return informe["fichero"].read()
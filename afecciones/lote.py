@@ -0,0 +1,278 @@
+"""
+Generación de informes por lotes a partir de un CSV de parcelas, sin interfaz.
+
+    python -m afecciones.lote parcelas.csv --salida informes/ --procesos 4
+    python -m afecciones.lote parcelas_clm.csv --ambito jccm --salida informes_clm/
+
+Cada fila identifica la parcela por municipio, polígono y parcela (si no
+está en el parcelario, la fila da error), o por coordenadas x, y (ETRS89
+UTM 30N; si además trae municipio, se busca la parcela que contiene el
+punto). Columnas opcionales: provincia (jccm),
+ambito (carm / jccm, por fila), nombre, apellidos, dni, direccion,
+telefono, email y objeto. Separador «,» o «;».
+
+Las filas se reparten entre procesos. Las cachés de las capas (resultados,
+teselas, rejillas y el archivo de informes) están en disco, en CACHE_DIR, y
+las comparten todos los procesos; el parcelario de cada municipio se carga
+una vez por proceso. Cada fila terminada se anota en <salida>/progreso.jsonl:
+si el lote se interrumpe, al relanzarlo solo se procesan las filas que
+faltan o que no terminaron bien. Al final se escribe <salida>/resumen.csv.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Plazo (s) de cada informe del lote: sin nadie esperando en la página, puede
+# ser mayor que el de la interfaz para no dejar capas indeterminadas
+PLAZO_LOTE = float(os.environ.get("AFECCIONES_PLAZO_LOTE", 120))
+PROGRESO = "progreso.jsonl"
+RESUMEN = "resumen.csv"
+COLUMNAS_RESUMEN = [
+    "fila", "ambito", "municipio", "poligono", "parcela", "x", "y",
+    "estado", "afecciones", "indeterminadas", "fichero", "error",
+]
+# Columna del CSV -> campo del solicitante en `datos`
+SOLICITANTE = {
+    "nombre": "nombre", "apellidos": "apellidos", "dni": "dni", "direccion": "dirección",
+    "telefono": "teléfono", "email": "email", "objeto": "objeto de la solicitud",
+}
+ALIAS = {"masa": "poligono", "correo": "email", "objeto de la solicitud": "objeto"}
+
+
+def _normalizar_columna(nombre):
+    nombre = unicodedata.normalize("NFKD", nombre.strip().lower())
+    nombre = "".join(c for c in nombre if not unicodedata.combining(c))
+    return ALIAS.get(nombre, nombre)
+
+
+def leer_csv(ruta):
+    """Filas del CSV como dicts con las columnas normalizadas (minúsculas, sin tildes)."""
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        return [
+            {_normalizar_columna(k): (v or "").strip() for k, v in fila.items() if k}
+            for fila in csv.DictReader(f, dialect=dialecto)
+        ]
+
+
+def id_fila(n, fila):
+    """Identificador de la fila para el progreso: si la fila cambia, se vuelve a procesar."""
+    contenido = json.dumps(fila, sort_keys=True, ensure_ascii=False)
+    return f"{n}:{hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _nombre_fichero(n, municipio, poligono, parcela, x, y):
+    if municipio and poligono and parcela:
+        base = f"{n:05d}_{municipio}_{poligono}_{parcela}"
+    else:
+        base = f"{n:05d}_{x:.0f}_{y:.0f}"
+    return re.sub(r"[^\w.-]+", "_", base) + ".pdf"
+
+
+# === TRABAJO DE CADA PROCESO ===
+def _iniciar_proceso():
+    # Fuera de una sesión, Streamlit avisa en cada llamada a st.*: no aporta nada aquí
+    from streamlit import logger as st_logger
+
+    st_logger.set_log_level("error")
+
+
+def _numero(valor):
+    """Polígono o parcela comparable: "007", 7 y 7.0 -> "7"."""
+    texto = str(valor).strip()
+    try:
+        numero = float(texto)
+    except ValueError:
+        return texto.lstrip("0") or texto
+    return str(int(numero)) if numero.is_integer() else texto
+
+
+@lru_cache(maxsize=8)
+def _parcelario(ambito, municipio, provincia):
+    """Parcelario con MASA y PARCELA normalizadas; los fallos se lanzan (y no quedan en caché)."""
+    from afecciones import parcelas, red
+
+    gdf = parcelas.cargar_parcelario(
+        ambito, municipio, provincia=provincia or None, plazo=red.Plazo(parcelas.PLAZO_PARCELARIO)
+    )
+    if gdf is None:
+        raise parcelas.ParcelarioNoDisponible(f"No se pudo cargar el parcelario de {municipio}")
+    return gdf.assign(_masa=gdf["MASA"].map(_numero), _parcela=gdf["PARCELA"].map(_numero))
+
+
+def _buscar_parcela(gdf, poligono, parcela):
+    sel = gdf[(gdf["_masa"] == _numero(poligono)) & (gdf["_parcela"] == _numero(parcela))]
+    return sel if not sel.empty else None
+
+
+def procesar_fila(n, fila, ambito, salida, plazo_informe=PLAZO_LOTE):
+    """Genera el informe de una fila; devuelve su registro para el resumen."""
+    from shapely.geometry import Point
+
+    from afecciones import red
+    from afecciones.capas import consultar_afecciones
+    from afecciones.informe_pdf import datos_informe, obtener_informe
+
+    ambito = (fila.get("ambito") or ambito).lower()
+    municipio = fila.get("municipio", "")
+    poligono = fila.get("poligono", "")
+    parcela = fila.get("parcela", "")
+    registro = {"fila": n, "ambito": ambito, "municipio": municipio, "poligono": poligono, "parcela": parcela}
+    try:
+        x = float(fila["x"].replace(",", ".")) if fila.get("x") else None
+        y = float(fila["y"].replace(",", ".")) if fila.get("y") else None
+        gdf = _parcelario(ambito, municipio, fila.get("provincia", "")) if municipio else None
+
+        geom = None
+        if poligono and parcela:
+            # El informe certifica el polígono y la parcela de la fila: tienen que estar en el parcelario
+            if gdf is None:
+                raise ValueError("Polígono y parcela sin municipio: no se puede localizar la parcela")
+            sel = _buscar_parcela(gdf, poligono, parcela)
+            if sel is None:
+                raise ValueError(f"Parcela {poligono}/{parcela} no encontrada en el parcelario de {municipio}")
+            geom = sel.geometry.iloc[0]
+        elif x is not None and y is not None:
+            # Consulta por punto: polígono y parcela solo si salen del parcelario
+            poligono, parcela = "", ""
+            geom = Point(x, y)
+            if gdf is not None:
+                contiene = gdf[gdf.contains(geom)]
+                if not contiene.empty:
+                    poligono, parcela = str(contiene["MASA"].iloc[0]), str(contiene["PARCELA"].iloc[0])
+        if geom is None:
+            raise ValueError("La fila no trae polígono y parcela ni coordenadas")
+        if x is None or y is None:
+            centroide = geom.centroid
+            x, y = round(centroide.x, 2), round(centroide.y, 2)
+        registro.update(poligono=poligono, parcela=parcela, x=x, y=y)
+
+        plazo = red.Plazo(plazo_informe)
+        resultados = consultar_afecciones(geom, plazo=plazo.reservando(red.RESERVA_PDF))
+        solicitante = {campo: fila.get(columna, "") for columna, campo in SOLICITANTE.items()}
+        datos = datos_informe(solicitante, x, y, municipio or "N/A", poligono or "N/A", parcela or "N/A", resultados)
+        pdf_bytes = obtener_informe(datos, x, y, geom, ambito, plazo=plazo)
+
+        fichero = _nombre_fichero(n, municipio, poligono, parcela, x, y)
+        temporal = os.path.join(salida, f"{fichero}.tmp")
+        with open(temporal, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(temporal, os.path.join(salida, fichero))
+
+        textos = [resultado["texto"] for resultado in resultados.values()]
+        indeterminadas = [t for t in textos if t.startswith("Indeterminado")]
+        registro.update(
+            estado="incompleto" if indeterminadas else "ok",
+            afecciones=" | ".join(t for t in textos if not t.startswith(("No afecta", "Indeterminado"))),
+            indeterminadas=" | ".join(indeterminadas),
+            fichero=fichero,
+        )
+    except Exception as e:
+        registro.update(estado="error", error=str(e))
+    return registro
+
+
+# === ORQUESTACIÓN ===
+def _leer_progreso(ruta):
+    hechos = {}
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue  # última línea a medias si el lote se cortó
+                hechos[registro["id"]] = registro
+    except OSError:
+        pass
+    return hechos
+
+
+def _escribir_resumen(ruta, registros):
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=COLUMNAS_RESUMEN, extrasaction="ignore")
+        escritor.writeheader()
+        escritor.writerows(registros)
+    os.replace(temporal, ruta)
+
+
+def ejecutar(ruta_csv, salida, ambito="carm", procesos=None, plazo=PLAZO_LOTE):
+    """Procesa el CSV (reanudando el progreso anterior) y devuelve los registros del resumen."""
+    os.makedirs(salida, exist_ok=True)
+    filas = leer_csv(ruta_csv)
+    ids = [id_fila(n, fila) for n, fila in enumerate(filas, start=1)]
+    ruta_progreso = os.path.join(salida, PROGRESO)
+    hechos = _leer_progreso(ruta_progreso)
+
+    pendientes = [
+        (n, fila) for n, fila in enumerate(filas, start=1)
+        if hechos.get(ids[n - 1], {}).get("estado") != "ok"
+    ]
+    logger.info("%d filas, %d ya hechas, %d pendientes", len(filas), len(filas) - len(pendientes), len(pendientes))
+    # Por municipio: cada proceso carga el parcelario de un municipio una sola vez
+    pendientes.sort(key=lambda p: (p[1].get("ambito", ""), p[1].get("provincia", ""), p[1].get("municipio", "")))
+
+    if pendientes:
+        contexto = multiprocessing.get_context("spawn")
+        with open(ruta_progreso, "a", encoding="utf-8") as progreso, ProcessPoolExecutor(
+            max_workers=procesos, mp_context=contexto, initializer=_iniciar_proceso
+        ) as ejecutor:
+            futuros = {ejecutor.submit(procesar_fila, n, fila, ambito, salida, plazo): n for n, fila in pendientes}
+            for hechas, futuro in enumerate(as_completed(futuros), start=1):
+                n = futuros[futuro]
+                registro = futuro.result()
+                registro["id"] = ids[n - 1]
+                hechos[registro["id"]] = registro
+                progreso.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                progreso.flush()
+                logger.info(
+                    "[%d/%d] fila %d: %s%s", hechas, len(pendientes), n, registro["estado"],
+                    f" ({registro['error']})" if registro.get("error") else "",
+                )
+
+    registros = [hechos[i] for i in ids if i in hechos]
+    _escribir_resumen(os.path.join(salida, RESUMEN), registros)
+    return registros
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera informes de afecciones para una lista de parcelas (CSV).")
+    parser.add_argument("csv", help="CSV con municipio, poligono, parcela o x, y (más datos del solicitante)")
+    parser.add_argument("--salida", default="informes", help="directorio de los PDF, el progreso y el resumen")
+    parser.add_argument("--ambito", choices=["carm", "jccm"], default="carm", help="si el CSV no trae la columna ambito")
+    parser.add_argument("--procesos", type=int, default=None, help="procesos en paralelo (por defecto, uno por CPU)")
+    parser.add_argument(
+        "--plazo", type=float, default=PLAZO_LOTE, help=f"segundos por informe (por defecto {PLAZO_LOTE:.0f})"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    registros = ejecutar(args.csv, args.salida, args.ambito, args.procesos, args.plazo)
+    estados = [r["estado"] for r in registros]
+    logger.info(
+        "%d ok, %d incompletos, %d con error. Resumen en %s",
+        estados.count("ok"), estados.count("incompleto"), estados.count("error"),
+        os.path.join(args.salida, RESUMEN),
+    )
+    return 1 if "error" in estados else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
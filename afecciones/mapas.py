@@ -0,0 +1,277 @@
+"""Utilidades de mapas: mapa web interactivo y mapas estáticos (localización y afecciones) para el PDF."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import folium
+import numpy as np
+import shapely
+import streamlit as st
+from branca.element import MacroElement, Template
+from PIL import Image, ImageDraw, ImageFont
+from staticmap import CircleMarker, StaticMap
+
+from afecciones import imagenes, red, wms
+from afecciones.cache import CACHE_DIR
+from afecciones.capas import elementos_cercanos
+from afecciones.disco import CacheDisco
+
+URL_TESELAS_OSM = 'http://a.tile.openstreetmap.org/{z}/{x}/{y}.png'
+# Teselas OSM en disco (LRU con cuota) e imágenes de localización ya renderizadas
+_teselas_osm = CacheDisco(
+    os.path.join(CACHE_DIR, "osm"),
+    ttl=float(os.environ.get("AFECCIONES_OSM_TTL", 30 * 86400)),
+    cuota=int(os.environ.get("AFECCIONES_OSM_CUOTA_MB", 200)) * 1024 * 1024,
+    extension=".png",
+)
+_imagenes_localizacion = CacheDisco(
+    os.path.join(CACHE_DIR, "localizacion"), ttl=30 * 86400, cuota=100 * 1024 * 1024, extension=".jpg"
+)
+# Ancho (mm) con que se imprimen los mapas en el PDF
+ANCHO_MAPA_PDF = 90
+
+# Mapas HTML renderizados que se conservan en memoria (por geometría y afecciones)
+MAPAS_EN_CACHE = 64
+
+# (nombre en el control de capas, capa WMS, texto alternativo de la leyenda)
+CAPAS_WMS = [
+    ("Red Natura 2000", "SIG_LUP_SITES_CARM:RN2000", "Red Natura"),
+    ("Montes", "PFO_ZOR_DMVP_CARM:MONTES", "Montes"),
+    ("Vias Pecuarias", "PFO_ZOR_DMVP_CARM:VP_CARM", "Vias Pecuarias")
+]
+
+LEYENDA_HTML = """
+    {% macro html(this, kwargs) %}
+<div style="
+    position: fixed;
+    bottom: 20px;
+    left: 20px;
+    background-color: white;
+    border: 1px solid grey;
+    z-index: 9999;
+    font-size: 10px;
+    padding: 5px;
+    box-shadow: 2px 2px 6px rgba(0,0,0,0.2);
+    line-height: 1.1em;
+    width: auto;
+    transform: scale(0.75);
+    transform-origin: top left;
+">
+    <b>Leyenda</b><br>
+    <div>
+__IMAGENES__
+    </div>
+</div>
+{% endmacro %}
+"""
+
+
+def _html_mapa(lon, lat, afecciones, parcela_geojson, leyendas):
+    """HTML completo del mapa; la misma cadena se muestra en la página y se descarga."""
+    m = folium.Map(location=[lat, lon], zoom_start=16)
+    folium.Marker([lat, lon], popup=f"Coordenadas transformadas: {lon}, {lat}").add_to(m)
+
+    if parcela_geojson is not None:
+        folium.GeoJson(
+            parcela_geojson,
+            name="Parcela",
+            style_function=lambda x: {'fillColor': 'transparent', 'color': 'blue', 'weight': 2, 'dashArray': '5, 5'}
+        ).add_to(m)
+
+    for name, layer, _ in CAPAS_WMS:
+        folium.raster_layers.WmsTileLayer(
+            url=wms.url_teselas(),
+            name=name,
+            fmt="image/png",
+            layers=layer,
+            transparent=True,
+            opacity=0.25,
+            control=True
+        ).add_to(m)
+
+    folium.LayerControl().add_to(m)
+
+    legend = MacroElement()
+    imagenes = "\n".join(
+        f'        <img src="{leyenda}" alt="{alt}"><br>' for leyenda, (_, _, alt) in zip(leyendas, CAPAS_WMS)
+    )
+    legend._template = Template(LEYENDA_HTML.replace("__IMAGENES__", imagenes))
+    m.get_root().add_child(legend)
+
+    for afeccion in afecciones:
+        folium.Marker([lat, lon], popup=afeccion).add_to(m)
+
+    return m.get_root().render()
+
+
+@st.cache_data(show_spinner=False, max_entries=MAPAS_EN_CACHE)
+def _renderizar_mapa(lon, lat, afecciones, parcela_geojson, leyendas):
+    return _html_mapa(lon, lat, afecciones, parcela_geojson, leyendas)
+
+
+def crear_mapa(lon, lat, afecciones=[], parcela_gdf=None):
+    """
+    (HTML del mapa, afecciones). El mapa se genera en memoria, sin escribir
+    ficheros, y se reutiliza si se repite la misma parcela con las mismas afecciones.
+    """
+    if lon is None or lat is None:
+        st.error("Coordenadas inválidas para generar el mapa.")
+        return None, afecciones
+
+    parcela_geojson = None
+    if parcela_gdf is not None and not parcela_gdf.empty:
+        try:
+            parcela_geojson = parcela_gdf.to_crs("EPSG:4326").to_json()
+        except Exception as e:
+            st.error(f"Error al añadir la parcela al mapa: {str(e)}")
+
+    # Leyendas incrustadas (data URI de la caché WMS): el navegador no las pide al servidor.
+    # Si alguna no se pudo descargar queda su URL remota y el mapa no se cachea, para
+    # incrustarla en cuanto el servidor responda.
+    leyendas = tuple(wms.leyenda_data_uri(layer) for _, layer, _ in CAPAS_WMS)
+    renderizar = _renderizar_mapa if all(l.startswith("data:") for l in leyendas) else _html_mapa
+    try:
+        return renderizar(lon, lat, tuple(afecciones), parcela_geojson, leyendas), afecciones
+    except Exception as e:
+        st.error(f"Error al generar el mapa: {str(e)}")
+        return None, afecciones
+
+
+def precargar_leyendas(plazo=None):
+    """Descarga (a la caché WMS) las leyendas del mapa web, para que renderizarlo no espere a la red."""
+    with ThreadPoolExecutor(max_workers=len(CAPAS_WMS)) as ejecutor:
+        list(ejecutor.map(lambda capa: wms.leyenda_data_uri(capa[1], plazo=plazo), CAPAS_WMS))
+
+
+class StaticMapRed(StaticMap):
+    """
+    StaticMap que descarga las teselas con el cliente HTTP compartido y las
+    guarda en la caché de disco. staticmap ya pide en paralelo las teselas
+    que faltan; las que están en caché no salen a la red.
+    """
+
+    def __init__(self, *args, plazo=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plazo = plazo
+
+    def get(self, url, **kwargs):
+        contenido = _teselas_osm.leer(url)
+        if contenido is not None:
+            return 200, contenido
+        kwargs.pop("timeout", None)  # se aplica el timeout uniforme del cliente
+        res = red.get(url, plazo=self.plazo, **kwargs)
+        if res.status_code == 200:
+            _teselas_osm.guardar(url, res.content)
+        return res.status_code, res.content
+
+
+def imagen_localizacion(lon, lat, zoom=16, size=(800, 600), plazo=None, ancho_mm=ANCHO_MAPA_PDF):
+    """
+    JPEG (bytes, a resolución de impresión) del mapa de localización: teselas OSM
+    y punto rojo. Se guarda por punto, zoom y tamaño: un informe repetido no
+    vuelve a renderizarlo. Lanza RuntimeError si no se pudieron descargar las teselas.
+    """
+    clave = f"{lon:.7f}|{lat:.7f}|{zoom}|{size[0]}x{size[1]}|{ancho_mm}"
+    contenido = _imagenes_localizacion.leer(clave)
+    if contenido is not None:
+        return contenido
+
+    m = StaticMapRed(size[0], size[1], url_template=URL_TESELAS_OSM, plazo=plazo)
+    m.add_marker(CircleMarker((lon, lat), 'red', 12))
+    contenido = imagenes.a_jpeg(m.render(zoom=zoom), ancho_mm)
+    _imagenes_localizacion.guardar(clave, contenido)
+    return contenido
+
+
+# === MAPA TEMÁTICO (SIN RED) ===
+# clave de CAPAS -> (etiqueta de la leyenda, color)
+CAPAS_TEMATICO = {
+    "enp": ("ENP", (46, 139, 87)),
+    "zepa": ("ZEPA", (230, 126, 34)),
+    "lic": ("LIC", (142, 68, 173)),
+    "mup": ("MUP", (139, 90, 43)),
+    "vp": ("Vías pecuarias", (214, 162, 0)),
+}
+COLOR_PARCELA = (0, 0, 255)
+# Entorno mínimo (m) que se dibuja alrededor de la parcela
+ENTORNO_MIN = 250
+
+
+def _a_pixeles(coords, vista, res):
+    coords = np.asarray(coords)
+    return list(zip(((coords[:, 0] - vista[0]) / res).tolist(), ((vista[3] - coords[:, 1]) / res).tolist()))
+
+
+def _dibujar(draw, geom, color, vista, res, relleno=True):
+    if geom.is_empty:
+        return
+    if hasattr(geom, "geoms"):
+        for parte in geom.geoms:
+            _dibujar(draw, parte, color, vista, res, relleno)
+    elif geom.geom_type == "Polygon":
+        exterior = _a_pixeles(geom.exterior.coords, vista, res)
+        if relleno:
+            draw.polygon(exterior, fill=color + (90,))
+            for hueco in geom.interiors:
+                draw.polygon(_a_pixeles(hueco.coords, vista, res), fill=(0, 0, 0, 0))
+        for anillo in [exterior] + [_a_pixeles(h.coords, vista, res) for h in geom.interiors]:
+            draw.line(anillo, fill=color + (255,), width=3 if not relleno else 2)
+    elif geom.geom_type in ("LineString", "LinearRing"):
+        draw.line(_a_pixeles(geom.coords, vista, res), fill=color + (255,), width=4)
+    elif geom.geom_type == "Point":
+        (px, py), = _a_pixeles(geom.coords, vista, res)
+        draw.ellipse((px - 8, py - 8, px + 8, py + 8), outline=color + (255,), width=3)
+
+
+def _escala(draw, size, res, fuente):
+    # Barra de escala con una longitud «redonda» de ~1/5 del ancho
+    objetivo = size[0] * res / 5
+    longitud = max(l for l in (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000) if l <= max(objetivo, 10))
+    pixeles = longitud / res
+    x1, y1 = size[0] - 20, size[1] - 20
+    draw.rectangle((x1 - pixeles - 10, y1 - 28, x1 + 10, y1 + 8), fill=(255, 255, 255))
+    draw.line((x1 - pixeles, y1, x1, y1), fill=(0, 0, 0), width=3)
+    texto = f"{longitud // 1000} km" if longitud >= 1000 else f"{longitud} m"
+    draw.text((x1 - pixeles, y1 - 22), texto, fill=(0, 0, 0), font=fuente)
+
+
+def imagen_tematica(geom, size=(800, 600), ancho_mm=ANCHO_MAPA_PDF):
+    """
+    PNG con paleta (bytes, a resolución de impresión) con la parcela y los elementos de ENP, ZEPA, LIC, MUP y VP de
+    su entorno, dibujados desde las capas ya cacheadas: no usa la red.
+    """
+    minx, miny, maxx, maxy = geom.bounds
+    margen = max(ENTORNO_MIN, 0.5 * max(maxx - minx, maxy - miny))
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    res = max((maxx - minx + 2 * margen) / size[0], (maxy - miny + 2 * margen) / size[1])  # m por píxel
+    vista = (cx - res * size[0] / 2, cy - res * size[1] / 2, cx + res * size[0] / 2, cy + res * size[1] / 2)
+
+    imagen = Image.new("RGB", size, (255, 255, 255))
+    elementos = elementos_cercanos(vista, list(CAPAS_TEMATICO))
+    presentes = []
+    for clave, (etiqueta, color) in CAPAS_TEMATICO.items():
+        gdf = elementos.get(clave)
+        if gdf is None or gdf.empty:
+            continue
+        presentes.append((etiqueta, color))
+        capa = Image.new("RGBA", size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(capa)
+        for recortada in shapely.clip_by_rect(gdf.geometry.to_numpy(), *vista):
+            _dibujar(draw, recortada, color, vista, res)
+        imagen.paste(capa, (0, 0), capa)
+
+    draw = ImageDraw.Draw(imagen, "RGBA")
+    _dibujar(draw, geom, COLOR_PARCELA, vista, res, relleno=False)
+
+    try:
+        fuente = ImageFont.truetype("DejaVuSans.ttf", 14)
+    except OSError:
+        fuente = ImageFont.load_default()
+    leyenda = [("Parcela", COLOR_PARCELA)] + presentes
+    draw.rectangle((10, 10, 170, 20 + 22 * len(leyenda)), fill=(255, 255, 255, 220), outline=(128, 128, 128))
+    for n, (etiqueta, color) in enumerate(leyenda):
+        y = 18 + 22 * n
+        draw.rectangle((18, y, 34, y + 14), fill=color + (160,), outline=color)
+        draw.text((42, y), etiqueta, fill=(0, 0, 0), font=fuente)
+    _escala(draw, size, res, fuente)
+
+    return imagenes.a_paleta(imagen, ancho_mm)
@@ -0,0 +1,115 @@
+"""
+Páginas del informe que no dependen de los datos del solicitante.
+
+Todo lo que va a partir de la página 2 (afecciones detectadas, procedimientos
+y condicionado) depende solo de la parcela y del resultado de las capas. Al
+generar un informe se guardan los flujos de contenido de esas páginas tal
+como los deja FPDF; si se vuelve a pedir la misma parcela con otros datos del
+solicitante, solo se dibuja la página 1 y el resto se copia sin cambios.
+
+Los flujos hacen referencia a fuentes (/F<n>) e imágenes (/I<n>) por su
+número de registro en el documento; se guardan esos números (y los enlaces a
+URL de cada página) y solo se reutilizan las páginas si el nuevo documento
+los tiene iguales o puede registrar las fuentes que faltan con el mismo
+número. Si no, se genera el informe completo.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_CUERPOS = int(os.environ.get("AFECCIONES_MAX_CUERPOS_PDF", 64))
+
+# Campos de `datos` que solo aparecen en la página 1
+CAMPOS_PAGINA_1 = (
+    "fecha_informe", "nombre", "apellidos", "dni", "dirección", "teléfono", "email",
+    "objeto de la solicitud", "coordenadas_x", "coordenadas_y", "municipio", "polígono", "parcela",
+)
+
+_lock = threading.Lock()
+_cuerpos = OrderedDict()  # clave -> {"paginas", "fuentes", "imagenes"}
+
+
+def clave(ambito, datos, geom, version):
+    """Clave de las páginas 2..N: ámbito (página), datos de afecciones, geometría y versión de plantilla."""
+    afecciones = {k: v for k, v in datos.items() if k not in CAMPOS_PAGINA_1}
+    contenido = json.dumps(
+        [ambito, afecciones, geom.wkb_hex if geom is not None else None, version],
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def guardar(clave_cuerpo, pdf, primera=2):
+    """
+    Guarda las páginas desde `primera` de un PDF ya cerrado (pdf.close()).
+    Solo deben llegar aquí páginas sin datos del solicitante.
+    """
+    paginas = [pdf.pages[n] for n in range(primera, pdf.page + 1)]
+    enlaces = [list(pdf.page_links.get(n, [])) for n in range(primera, pdf.page + 1)]
+    # Solo enlaces a URL: los internos apuntan a páginas por número
+    if not paginas or any(not isinstance(e[4], str) for lista in enlaces for e in lista):
+        return
+    flujo = "".join(paginas)
+    usadas_f = {int(n) for n in re.findall(r"/F(\d+) ", flujo)}
+    usadas_i = {int(n) for n in re.findall(r"/I(\d+) Do", flujo)}
+    cuerpo = {
+        "paginas": paginas,
+        "enlaces": enlaces,
+        "fuentes": {k: dict(f) for k, f in pdf.fonts.items() if f["i"] in usadas_f},
+        "imagenes": {k: im["i"] for k, im in pdf.images.items() if im["i"] in usadas_i},
+    }
+    with _lock:
+        _cuerpos[clave_cuerpo] = cuerpo
+        _cuerpos.move_to_end(clave_cuerpo)
+        while len(_cuerpos) > MAX_CUERPOS:
+            _cuerpos.popitem(last=False)
+
+
+def reutilizar(clave_cuerpo, pdf):
+    """
+    Completa `pdf` (con la página 1 ya dibujada) con las páginas guardadas y
+    lo cierra. Devuelve False, sin tocar el documento, si no hay páginas
+    guardadas o sus fuentes e imágenes no coinciden con las del documento.
+    """
+    with _lock:
+        cuerpo = _cuerpos.get(clave_cuerpo)
+        if cuerpo is not None:
+            _cuerpos.move_to_end(clave_cuerpo)
+    # La página 1 se desbordó: las copiadas llevarían mal el número de página
+    if cuerpo is None or pdf.page != 1:
+        return False
+
+    for nombre, i in cuerpo["imagenes"].items():
+        if pdf.images.get(nombre, {}).get("i") != i:
+            return False
+    faltan = []
+    for nombre, fuente in cuerpo["fuentes"].items():
+        if nombre in pdf.fonts:
+            if pdf.fonts[nombre]["i"] != fuente["i"]:
+                return False
+        elif fuente.get("type") != "core":
+            return False
+        else:
+            faltan.append((fuente["i"], nombre, fuente))
+    # Las fuentes que la página 1 no usa se registran con el número que tenían
+    faltan.sort()
+    if [i for i, _, _ in faltan] != list(range(len(pdf.fonts) + 1, len(pdf.fonts) + 1 + len(faltan))):
+        return False
+    for _, nombre, fuente in faltan:
+        pdf.fonts[nombre] = dict(fuente)
+
+    # Cierre de la página 1 (como hace add_page) y páginas copiadas tal cual
+    pdf.in_footer = 1
+    pdf.footer()
+    pdf.in_footer = 0
+    pdf._endpage()
+    for contenido, enlaces in zip(cuerpo["paginas"], cuerpo["enlaces"]):
+        pdf.page += 1
+        pdf.pages[pdf.page] = contenido
+        if enlaces:
+            pdf.page_links[pdf.page] = list(enlaces)
+    pdf._enddoc()
+    return True
@@ -0,0 +1,106 @@
+"""
+Carga del parcelario catastral (shapefiles publicados en GitHub) y
+selección de la geometría de una parcela, sin depender de la interfaz.
+"""
+import os
+import tempfile
+
+import geopandas as gpd
+import shapely
+import streamlit as st
+from shapely.geometry import Point
+
+from afecciones import red
+
+URL_CATASTRO_CARM = "https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/CATASTRO/"
+URL_CATASTRO_JCCM = "https://raw.githubusercontent.com/iberiaforestal/CATASTRO_JCCM/master/CATASTRO/"
+EXTENSIONES = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+# Tiempo máximo (s) para descargar el parcelario de un municipio, aparte del
+# plazo del informe: los de municipios grandes (MURCIA) pesan decenas de MB
+PLAZO_PARCELARIO = float(os.environ.get("AFECCIONES_PLAZO_PARCELARIO", 120))
+
+
+class ParcelarioNoDisponible(RuntimeError):
+    """No se pudo descargar o leer el parcelario del municipio."""
+
+
+def nombre_archivo_carm(municipio):
+    """Nombre base del shapefile de un municipio de Murcia ("Fuente Álamo" -> "FUENTE_ALAMO")."""
+    return municipio.upper().replace(" ", "_").replace("Á", "A").replace("É", "E").replace("Í", "I")
+
+
+def _leer_shapefile(base, plazo=None):
+    """Descarga <base>.shp/.shx/.dbf/.prj/.cpg y lo devuelve en EPSG:25830, o None si falta algún fichero."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = {}
+        for ext in EXTENSIONES:
+            try:
+                r = red.get(base + ext, plazo=plazo)
+                r.raise_for_status()
+            except Exception:
+                return None
+            path = os.path.join(tmpdir, "PARCELA" + ext)
+            with open(path, "wb") as f:
+                f.write(r.content)
+            paths[ext] = path
+        return gpd.read_file(paths[".shp"]).to_crs(epsg=25830)
+
+
+def cargar_parcelario(ambito, municipio, provincia=None, plazo=None):
+    """
+    Parcelario del municipio ("carm" o "jccm") o None si no se pudo cargar.
+    En "jccm" hace falta la provincia (ValueError si no se indica).
+    """
+    if ambito == "carm":
+        return _leer_shapefile(URL_CATASTRO_CARM + nombre_archivo_carm(municipio), plazo)
+    if not provincia:
+        raise ValueError(f"Falta la provincia de {municipio} para descargar su parcelario")
+    return _leer_shapefile(f"{URL_CATASTRO_JCCM}{provincia.upper()}/{municipio.upper()}/PARCELA", plazo)
+
+
+# cache_resource: el mismo GeoDataFrame para todas las sesiones, sin copiarlo en
+# cada acierto (cache_data lo serializaría entero); nadie debe modificarlo
+@st.cache_resource(show_spinner=False, ttl=3600, max_entries=16)
+def _parcelario_cacheado(ambito, municipio, provincia):
+    gdf = cargar_parcelario(ambito, municipio, provincia=provincia, plazo=red.Plazo(PLAZO_PARCELARIO))
+    if gdf is None:
+        # Con excepción para que el fallo no quede en caché
+        raise ParcelarioNoDisponible(f"No se pudo cargar el parcelario de {municipio}. Vuelve a intentarlo.")
+    return gdf
+
+
+def parcelario(ambito, municipio, provincia=None):
+    """
+    Parcelario del municipio para las páginas del informe, cacheado y
+    compartido entre recargas y sesiones (de solo lectura). Lanza
+    ParcelarioNoDisponible si no se pudo cargar.
+    """
+    return _parcelario_cacheado(ambito, municipio, provincia)
+
+
+def geometria_finca(gdf, seleccion, x, y):
+    """
+    (parcelas_gdf, geometría de consulta) de una finca de una o varias
+    parcelas [(masa, parcela), ...]: las que están en el parcelario y su unión;
+    si no se encuentra ninguna, (None, punto X/Y).
+    """
+    if gdf is not None and seleccion:
+        buscadas = set(seleccion)
+        sel = gdf[[par in buscadas for par in zip(gdf["MASA"], gdf["PARCELA"])]]
+        if not sel.empty:
+            geometria = sel.geometry.iloc[0] if len(sel) == 1 else shapely.union_all(sel.geometry.to_numpy())
+            return sel, geometria
+    return None, Point(x, y)
+
+
+def geometria_parcela(gdf, masa, parcela, x, y):
+    """(parcela_gdf, geometría de consulta) de una sola parcela; ver geometria_finca."""
+    return geometria_finca(gdf, [(masa, parcela)], x, y)
+
+
+def etiqueta_finca(seleccion):
+    """(texto del polígono, texto de la parcela) de la finca para el informe: "12", "5, 7" o "12, 14", "12/5, 14/9"."""
+    masas = list(dict.fromkeys(str(masa) for masa, _ in seleccion))
+    if len(masas) == 1:
+        return masas[0], ", ".join(str(parcela) for _, parcela in seleccion)
+    return ", ".join(masas), ", ".join(f"{masa}/{parcela}" for masa, parcela in seleccion)
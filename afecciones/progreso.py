@@ -0,0 +1,156 @@
+"""
+Progreso del informe en la página: una línea por capa, que se rellena en
+cuanto su consulta termina (con su estado y su tiempo), y una barra para el
+resto de etapas hasta el PDF. Con la cola de informes (afecciones.cola), el
+estado del trabajo encolado.
+
+Las capas terminadas llegan como lista [(clave, resultado, segundos)] que
+rellenan los hilos de consulta (consultar_afecciones(al_terminar=...)); la
+página la lee desde el hilo del script con `actualizar`, que
+afecciones.etapas.ejecutar llama mientras espera (al_esperar).
+"""
+import os
+
+import streamlit as st
+from streamlit.components.v1 import html
+
+from afecciones import cola, informes
+from afecciones.capas import CAPAS
+
+# Segundos entre consultas del estado de un informe encolado
+INTERVALO_COLA = float(os.environ.get("AFECCIONES_COLA_SONDEO", 2))
+
+# Etiquetas de la barra para las etapas de informe_pdf.etapas_informe
+NOMBRES_ETAPAS = {
+    "afecciones": "consultas de las capas",
+    "mapa_localizacion": "mapa de localización",
+    "leyendas": "leyendas del mapa",
+    "mapa_tematico": "mapa de afecciones",
+    "datos": "datos del informe",
+    "mapa_web": "mapa interactivo",
+    "pdf": "PDF",
+}
+
+
+def _icono(texto):
+    if texto.startswith("Indeterminado"):
+        return "⚠️"
+    if texto.startswith("No afecta"):
+        return "✅"
+    return "🔶"
+
+
+def crear_panel(capas_terminadas, etapas):
+    """Reserva en la página las líneas de las capas y la barra; devuelve el estado del panel."""
+    st.subheader("Consulta de capas")
+    lineas = {}
+    for clave, capa in CAPAS.items():
+        lineas[clave] = st.empty()
+        lineas[clave].markdown(f"⏳ **{capa['nombre']}**: consultando...")
+    panel = {
+        "lineas": lineas,
+        "barra": st.progress(0.0, text="Preparando el informe..."),
+        "capas": capas_terminadas,
+        "mostradas": 0,
+        "etapas": list(etapas),
+    }
+    actualizar(panel, {})
+    return panel
+
+
+def actualizar(panel, hechas):
+    """Muestra las capas terminadas desde la última llamada y el avance de las etapas (`hechas`: {etapa: ...})."""
+    nuevas = panel["capas"][panel["mostradas"]:]
+    panel["mostradas"] += len(nuevas)
+    for clave, resultado, segundos in nuevas:
+        texto = resultado["texto"]
+        panel["lineas"][clave].markdown(f"{_icono(texto)} **{CAPAS[clave]['nombre']}**: {texto} · {segundos:.1f} s")
+
+    capas = len({clave for clave, _, _ in panel["capas"]})
+    total = len(CAPAS) + len(panel["etapas"])
+    faltan = [NOMBRES_ETAPAS.get(etapa, etapa) for etapa in panel["etapas"] if etapa not in hechas]
+    if faltan:
+        texto = f"Capas {capas}/{len(CAPAS)} · pendiente: {', '.join(faltan)}"
+    else:
+        texto = "Informe generado"
+    panel["barra"].progress(min(1.0, (capas + len(panel["etapas"]) - len(faltan)) / total), text=texto)
+
+
+# === INFORMES EN LA COLA (AFECCIONES_COLA=1) ===
+@st.fragment(run_every=INTERVALO_COLA)
+def seguir_trabajo(sesion):
+    """
+    Estado del informe encolado (sesion["trabajo_id"]), consultado cada pocos
+    segundos. Al terminar deja el PDF, el mapa y las afecciones en la sesión,
+    como la generación directa, y recarga la página para mostrarlos.
+    """
+    trabajo = cola.estado(sesion["trabajo_id"])
+    if trabajo is None:
+        sesion.pop("trabajo_id", None)
+        st.warning("El informe ya no está en la cola. Vuelve a generarlo.")
+    elif trabajo["estado"] == "hecho":
+        salida = trabajo["salida"]
+        sesion["pdf_id"] = informes.guardar(trabajo["pdf"])
+        sesion["mapa_html"] = salida["mapa_html"]
+        sesion["afecciones"] = salida["afecciones"]
+        sesion["resultado_cola"] = salida
+        sesion.pop("trabajo_id", None)
+        st.rerun(scope="app")
+    elif trabajo["estado"] == "error":
+        sesion.pop("trabajo_id", None)
+        st.error(f"No se pudo generar el informe: {trabajo['error']}")
+    elif trabajo["estado"] == "pendiente":
+        reintento = f" (reintento tras: {trabajo['error']})" if trabajo["error"] else ""
+        st.info(f"Informe en cola, posición {trabajo['posicion']}{reintento}...")
+    else:
+        st.info(f"Generando el informe (intento {trabajo['intentos']})...")
+
+
+def trabajo_en_url():
+    """Id del informe encolado que va en la URL de la página (?trabajo=<id>) o None."""
+    return st.query_params.get("trabajo") if cola.ACTIVA else None
+
+
+def pagina_trabajo(sesion):
+    """
+    Informe encolado recuperado por la URL tras recargar la página o
+    reconectar, cuando la sesión ya no tiene los datos del lanzador: se sigue
+    su estado y, al terminar, se ofrece como en la página del informe.
+    """
+    trabajo_id = trabajo_en_url()
+    st.title("Informe básico de Afecciones al medio")
+    if sesion.get("trabajo_recuperado") != trabajo_id:
+        sesion["trabajo_recuperado"] = trabajo_id
+        sesion["trabajo_id"] = trabajo_id
+    if sesion.get("trabajo_id"):
+        seguir_trabajo(sesion)
+        return
+    if sesion.get("resultado_cola"):
+        mostrar_resultado_cola(sesion["resultado_cola"])
+    pdf_bytes = informes.leer(sesion["pdf_id"]) if sesion.get("pdf_id") else None
+    if pdf_bytes is not None:
+        st.download_button(
+            "📄 Descargar informe PDF", pdf_bytes, file_name="informe_afecciones.pdf", mime="application/pdf"
+        )
+    if sesion.get("mapa_html"):
+        st.download_button(
+            "🌍 Descargar mapa HTML", sesion["mapa_html"], file_name="mapa_busqueda.html", mime="text/html"
+        )
+    if st.button("Nuevo informe"):
+        st.query_params.pop("trabajo", None)
+        st.switch_page("afecc.py")
+
+
+def mostrar_resultado_cola(salida):
+    """Afecciones y mapa de un informe generado en la cola."""
+    if salida["agotadas"]:
+        st.warning(
+            "Sin respuesta a tiempo (se marcan como indeterminadas): "
+            + ", ".join(CAPAS[clave]["nombre"] for clave in salida["agotadas"])
+        )
+    st.subheader("Resultado de las afecciones")
+    for afeccion in salida["afecciones"]:
+        st.write(f"• {afeccion}")
+    if salida["mapa_html"]:
+        html(salida["mapa_html"], height=500)
+    st.caption(f"Tiempos por etapa: {salida['tiempos']}")
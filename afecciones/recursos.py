@@ -0,0 +1,48 @@
+"""
+Recursos estáticos del informe, preparados una vez por proceso.
+
+El logo se decodifica una sola vez: sus dimensiones, la copia optimizada
+para impresión ya preparada para FPDF y los bytes originales para la
+interfaz (que Streamlit sirve desde su propio almacén de medios en lugar de
+pedirlos a GitHub en cada recarga).
+"""
+import functools
+from io import BytesIO
+
+from PIL import Image
+
+from afecciones import imagenes
+
+LOGO_PATH = "logos.jpg"
+LOGO_URL = "https://raw.githubusercontent.com/iberiaforestal/AFECCIONES_CARM/main/logos.jpg"
+# Ancho máximo del logo en el encabezado del PDF (mm)
+LOGO_ANCHO_MM = 180
+
+
+@functools.lru_cache(maxsize=None)
+def logo(path=LOGO_PATH):
+    """
+    {"ancho", "alto", "ratio", "info": imagen preparada para FPDF, "original": bytes}
+    o None si el fichero no existe o no se puede leer.
+    """
+    try:
+        with open(path, "rb") as f:
+            original = f.read()
+        img = Image.open(BytesIO(original))
+        img.load()
+    except OSError:
+        return None
+    impresion = imagenes.a_jpeg(img, LOGO_ANCHO_MM, calidad=90)
+    return {
+        "ancho": img.width,
+        "alto": img.height,
+        "ratio": img.width / img.height,
+        "info": imagenes.preparar(min(impresion, original, key=len)),
+        "original": original,
+    }
+
+
+def logo_ui():
+    """Logo para st.image: los bytes locales o, si falta el fichero, su URL."""
+    datos = logo()
+    return datos["original"] if datos else LOGO_URL
@@ -0,0 +1,193 @@
+"""
+Cliente HTTP compartido para toda la E/S saliente (WFS, parcelarios, API de
+GitHub y teselas OSM).
+
+Una única sesión con pool de conexiones keep-alive, reintentos, timeouts
+uniformes y un límite de peticiones simultáneas por host, segura para usarla
+desde todos los hilos de Streamlit. HTTP/2 se activa con AFECCIONES_HTTP2=1
+si el paquete `h2` está instalado (soporte experimental de urllib3).
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# Timeout (conexión, lectura) en segundos para todas las peticiones
+TIMEOUT = (10, 60)
+
+# Tiempo máximo (s) para generar un informe completo
+PLAZO_INFORME = float(os.environ.get("AFECCIONES_PLAZO_INFORME", 20))
+# Parte del plazo que se reserva para el mapa estático y el PDF
+RESERVA_PDF = 5
+
+# Peticiones simultáneas por host (el resto espera turno)
+LIMITE_POR_HOST = {
+    "mapas-gis-inter.carm.es": 4,
+    "raw.githubusercontent.com": 8,
+    "api.github.com": 2,
+    "a.tile.openstreetmap.org": 2,
+}
+LIMITE_POR_DEFECTO = 4
+
+HTTP2 = False
+if os.environ.get("AFECCIONES_HTTP2") == "1":
+    try:
+        import h2  # noqa: F401
+        import urllib3.http2
+
+        urllib3.http2.inject_into_urllib3()
+        HTTP2 = True
+    except ImportError:
+        pass
+
+
+# === MÉTRICAS DE CONEXIONES ===
+_lock_metricas = threading.Lock()
+_metricas = defaultdict(lambda: {"peticiones": 0, "conexiones_abiertas": 0})
+
+
+def _sumar(host, campo):
+    with _lock_metricas:
+        _metricas[host][campo] += 1
+
+
+def metricas():
+    """Por host: peticiones, conexiones abiertas y conexiones reutilizadas (keep-alive)."""
+    with _lock_metricas:
+        return {
+            host: {**datos, "conexiones_reutilizadas": datos["peticiones"] - datos["conexiones_abiertas"]}
+            for host, datos in _metricas.items()
+        }
+
+
+class _ContadorConexiones:
+    # Cada petición (incluidos los reintentos) toma una conexión del pool con
+    # _get_conn; solo las que no estaban abiertas pasan por _new_conn.
+    def _get_conn(self, timeout=None):
+        _sumar(self.host, "peticiones")
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        _sumar(self.host, "conexiones_abiertas")
+        return super()._new_conn()
+
+
+class _PoolHTTP(_ContadorConexiones, HTTPConnectionPool):
+    pass
+
+
+class _PoolHTTPS(_ContadorConexiones, HTTPSConnectionPool):
+    pass
+
+
+class _AdaptadorCompartido(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PoolHTTP, "https": _PoolHTTPS}
+
+
+# Reintentos: hasta REINTENTOS más, con espera de BACKOFF * 2^(n-1) s (2, 4, 8)
+REINTENTOS = 3
+BACKOFF = 2
+ESTADOS_REINTENTO = (500, 502, 503, 504, 429)
+
+
+def _sesion(max_retries):
+    sesion = requests.Session()
+    adaptador = _AdaptadorCompartido(
+        max_retries=max_retries,
+        pool_connections=16,
+        pool_maxsize=max([LIMITE_POR_DEFECTO, *LIMITE_POR_HOST.values()]),
+    )
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+# Sesión segura con reintentos
+retry = Retry(total=REINTENTOS, backoff_factor=BACKOFF, status_forcelist=list(ESTADOS_REINTENTO))
+session = _sesion(retry)
+# Sin reintentos de urllib3: con plazo, get() reintenta solo mientras quepa en él
+session_plazo = _sesion(0)
+
+
+class Plazo:
+    """Fecha límite de un informe, compartida por todas sus etapas."""
+
+    def __init__(self, segundos=PLAZO_INFORME):
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+
+    def restante(self):
+        return max(0.0, self.limite - time.monotonic())
+
+    def agotado(self):
+        return self.restante() <= 0
+
+    def reservando(self, segundos):
+        """Plazo que termina `segundos` antes que este (margen para las etapas siguientes)."""
+        return Plazo(max(0.0, self.restante() - segundos))
+
+    def timeout(self):
+        restante = max(self.restante(), 0.1)
+        return (min(TIMEOUT[0], restante), min(TIMEOUT[1], restante))
+
+
+_lock_semaforos = threading.Lock()
+_semaforos = {}
+
+
+def _semaforo(host):
+    with _lock_semaforos:
+        if host not in _semaforos:
+            _semaforos[host] = threading.BoundedSemaphore(LIMITE_POR_HOST.get(host, LIMITE_POR_DEFECTO))
+        return _semaforos[host]
+
+
+def get(url, timeout=None, plazo=None, **kwargs):
+    """
+    GET a través del cliente compartido. Lanza las excepciones habituales de requests.
+    Con `plazo`, ni el timeout de cada intento ni los reintentos y sus esperas
+    pasan del tiempo que le queda al informe; entre intentos no se ocupa el
+    turno del host.
+    """
+    semaforo = _semaforo(urlsplit(url).hostname)
+    if plazo is None:
+        with semaforo:
+            return session.get(url, timeout=timeout or TIMEOUT, **kwargs)
+
+    ultimo = None
+    for intento in range(REINTENTOS + 1):
+        if intento:
+            espera = BACKOFF * 2 ** (intento - 1)
+            if espera >= plazo.restante():
+                break
+            time.sleep(espera)
+        if plazo.agotado() or not semaforo.acquire(timeout=plazo.restante()):
+            break
+        try:
+            if plazo.agotado():
+                break
+            respuesta = session_plazo.get(url, timeout=plazo.timeout(), **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            ultimo = e
+            continue
+        finally:
+            semaforo.release()
+        if respuesta.status_code not in ESTADOS_REINTENTO:
+            return respuesta
+        ultimo = respuesta
+    else:
+        # Sin más intentos: el último error (o la respuesta, para raise_for_status)
+        if isinstance(ultimo, Exception):
+            raise ultimo
+        return ultimo
+    if isinstance(ultimo, requests.Response):
+        return ultimo
+    raise requests.exceptions.Timeout(f"Plazo del informe agotado: {url}") from ultimo
@@ -0,0 +1,209 @@
+"""
+Rejilla precalculada de afecciones para consultas por punto.
+
+Para cada capa se clasifica una rejilla fija en EPSG:25830: cada celda queda
+fuera de la capa, dentro de un único elemento (se guarda su índice) o en la
+frontera. Un punto que cae en una celda dentro o fuera se responde con un
+acceso al array, sin descargar la capa ni calcular intersecciones; solo las
+celdas frontera pasan a la consulta exacta.
+
+Las rejillas se construyen fuera de línea desde una copia local de las capas
+(o descargándolas del WFS) y se abren con memoria mapeada:
+
+    python -m afecciones.rejilla                      # todas las capas, desde el WFS
+    python -m afecciones.rejilla enp zepa --espejo DIR  # DIR/<clave>.geojson
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.strtree import STRtree
+
+from afecciones.cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+REJILLAS_DIR = os.path.join(CACHE_DIR, "rejillas")
+# Lado de la celda (m, EPSG:25830)
+TAMANO_REJILLA = int(os.environ.get("AFECCIONES_TAMANO_REJILLA", 250))
+# Una rejilla más antigua que esto se ignora: la capa puede haber cambiado
+REJILLA_TTL = float(os.environ.get("AFECCIONES_REJILLA_TTL", 30 * 86400))
+
+# Valores de celda (>= 0: dentro del elemento con ese índice)
+FUERA = -1
+FRONTERA = -2
+
+_lock = threading.Lock()
+_rejillas = {}  # clave -> {"marca": mtime del .json o None, "rejilla": (array, meta) o None, "caducada"}
+
+
+def _rutas(clave):
+    return os.path.join(REJILLAS_DIR, f"{clave}.npy"), os.path.join(REJILLAS_DIR, f"{clave}.json")
+
+
+# === CONSTRUCCIÓN (FUERA DE LÍNEA) ===
+def clasificar(geometrias, tamano=TAMANO_REJILLA, filas_por_bloque=200):
+    """
+    (rejilla int32 [filas, columnas], origen (x0, y0)) sobre la extensión de
+    las geometrías. Una celda es «dentro» solo si toca un único elemento y está
+    contenida en él; si toca varios, queda como frontera.
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    arbol = STRtree(geometrias)
+    minx, miny, maxx, maxy = shapely.total_bounds(geometrias)
+    x0 = math.floor(minx / tamano) * tamano
+    y0 = math.floor(miny / tamano) * tamano
+    columnas = max(1, math.ceil((maxx - x0) / tamano))
+    filas = max(1, math.ceil((maxy - y0) / tamano))
+    rejilla = np.full((filas, columnas), FUERA, dtype=np.int32)
+
+    xs = x0 + np.arange(columnas) * tamano
+    # Por bloques de filas para no crear millones de cajas a la vez
+    for fila_ini in range(0, filas, filas_por_bloque):
+        ys = y0 + np.arange(fila_ini, min(fila_ini + filas_por_bloque, filas)) * tamano
+        X, Y = np.meshgrid(xs, ys)
+        cajas = shapely.box(X.ravel(), Y.ravel(), X.ravel() + tamano, Y.ravel() + tamano)
+        bloque = np.full(len(cajas), FUERA, dtype=np.int32)
+
+        tocadas, _ = arbol.query(cajas, predicate="intersects")
+        toques = np.bincount(tocadas, minlength=len(cajas))
+        bloque[toques > 0] = FRONTERA
+        cajas_dentro, elementos = arbol.query(cajas, predicate="within")
+        unicas = toques[cajas_dentro] == 1
+        bloque[cajas_dentro[unicas]] = elementos[unicas]
+
+        rejilla[fila_ini:fila_ini + len(ys)] = bloque.reshape(len(ys), columnas)
+    return rejilla, (x0, y0)
+
+
+def construir(clave, contenido, tamano=TAMANO_REJILLA):
+    """Clasifica la capa (GeoJSON en bytes, EPSG:25830) y guarda su rejilla en REJILLAS_DIR."""
+    features = [f for f in json.loads(contenido).get("features", []) if f.get("geometry")]
+    if not features:
+        raise ValueError(f"La capa {clave} no tiene elementos")
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in features])
+    rejilla, origen = clasificar(geometrias, tamano)
+
+    os.makedirs(REJILLAS_DIR, exist_ok=True)
+    ruta_npy, ruta_json = _rutas(clave)
+    temporal = f"{ruta_npy}.{os.getpid()}.tmp.npy"
+    np.save(temporal, rejilla)
+    os.replace(temporal, ruta_npy)
+    meta = {
+        "origen": origen,
+        "tamano": tamano,
+        "creado": time.time(),
+        "elementos": [f.get("properties") or {} for f in features],
+    }
+    temporal = f"{ruta_json}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temporal, ruta_json)
+    with _lock:
+        _rejillas.pop(clave, None)
+    return rejilla
+
+
+# === CONSULTA ===
+def _leer(clave):
+    ruta_npy, ruta_json = _rutas(clave)
+    try:
+        with open(ruta_json, encoding="utf-8") as f:
+            meta = json.load(f)
+        return np.load(ruta_npy, mmap_mode="r"), meta
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _cargar(clave):
+    """
+    (rejilla, metadatos) o None si no hay o está caducada. Se vuelve a leer si
+    cambia el fichero (rejilla construida o reconstruida con el servidor en
+    marcha); la caducidad se mira en cada consulta.
+    """
+    _, ruta_json = _rutas(clave)
+    try:
+        marca = os.stat(ruta_json).st_mtime_ns
+    except OSError:
+        marca = None
+    with _lock:
+        cargada = _rejillas.get(clave)
+        if cargada is None or cargada["marca"] != marca:
+            cargada = {"marca": marca, "rejilla": _leer(clave) if marca is not None else None, "caducada": False}
+            _rejillas[clave] = cargada
+        rejilla = cargada["rejilla"]
+        if rejilla is not None and time.time() - rejilla[1]["creado"] >= REJILLA_TTL:
+            if not cargada["caducada"]:
+                logger.warning("Rejilla de %s caducada; se ignora hasta reconstruirla", clave)
+                cargada["caducada"] = True
+            return None
+        return rejilla
+
+
+def version(clave):
+    """Marca de la rejilla cargada (cambia al reconstruirla) o None si no hay."""
+    cargada = _cargar(clave)
+    return None if cargada is None else cargada[1]["creado"]
+
+
+def consultar_punto(clave, punto):
+    """
+    Elementos de la capa que contienen el punto (DataFrame con sus atributos,
+    vacío si ninguno) o None si no hay rejilla o el punto cae en una celda
+    frontera y hace falta la consulta exacta.
+    """
+    cargada = _cargar(clave)
+    if cargada is None:
+        return None
+    rejilla, meta = cargada
+    x0, y0 = meta["origen"]
+    tamano = meta["tamano"]
+    columna = math.floor((punto.x - x0) / tamano)
+    fila = math.floor((punto.y - y0) / tamano)
+    if not (0 <= fila < rejilla.shape[0] and 0 <= columna < rejilla.shape[1]):
+        return pd.DataFrame()
+    valor = int(rejilla[fila, columna])
+    if valor == FRONTERA:
+        return None
+    if valor == FUERA:
+        return pd.DataFrame()
+    return pd.DataFrame([meta["elementos"][valor]])
+
+
+def main(argv=None):
+    from afecciones import red
+    from afecciones.capas import CAPAS
+
+    parser = argparse.ArgumentParser(description="Construye las rejillas precalculadas de afecciones.")
+    parser.add_argument("capas", nargs="*", help="claves de CAPAS (por defecto, todas)")
+    parser.add_argument("--espejo", help="directorio con <clave>.geojson en EPSG:25830 (si no, se descarga del WFS)")
+    parser.add_argument("--tamano", type=int, default=TAMANO_REJILLA, help="lado de la celda en metros")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    for clave in args.capas or list(CAPAS):
+        if args.espejo:
+            with open(os.path.join(args.espejo, f"{clave}.geojson"), "rb") as f:
+                contenido = f.read()
+        else:
+            response = red.get(f"{CAPAS[clave]['url']}&srsName=EPSG:25830")
+            response.raise_for_status()
+            contenido = response.content
+        inicio = time.perf_counter()
+        rejilla = construir(clave, contenido, args.tamano)
+        frontera = np.count_nonzero(rejilla == FRONTERA) / rejilla.size
+        logger.info(
+            "%s: %d x %d celdas, %.1f %% frontera (%.1f s)",
+            clave, *rejilla.shape, 100 * frontera, time.perf_counter() - inicio,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Secciones fijas del informe PDF: avisos y procedimientos en sede electrónica
+y CONDICIONADO.
+
+Su texto no cambia entre informes, así que la maquetación (partir en líneas
+con el mismo algoritmo de multi_cell, espaciado de justificación, alturas y
+reparto del CONDICIONADO en dos columnas) se calcula una sola vez por versión
+de la plantilla y tamaño de página. Cada informe solo escribe las líneas ya
+partidas.
+"""
+import functools
+import hashlib
+
+from fpdf import FPDF
+
+PROCEDIMIENTOS = [
+    ("1609", "Solicitudes, escritos y comunicaciones que no disponen de un procedimiento específico en la Guía de Procedimientos y Servicios.", "https://sede.carm.es/web/pagina?IDCONTENIDO=1609&IDTIPO=240&RASTRO=c$m40288"),
+    ("1802", "Emisión de certificación sobre delimitación vías pecuarias con respecto a fincas particulares para inscripción registral.", "https://sede.carm.es/web/pagina?IDCONTENIDO=1802&IDTIPO=240&RASTRO=c$m40288"),
+    ("3482", "Emisión de Informe en el ejercicio de los derechos de adquisición preferente (tanteo y retracto) en transmisiones fincas forestales.", None),
+    ("3483", "Autorización de proyectos o actuaciones materiales en dominio público forestal que no conlleven concesión administrativa.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3483&IDTIPO=240&RASTRO=c$m40288"),
+    ("3485", "Deslinde y amojonamiento de montes a instancia de parte.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3485&IDTIPO=240&RASTRO=c$m40288"),
+    ("3487", "Clasificación, deslinde, desafectación y amojonamiento de vías pecuarias.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3487&IDTIPO=240&RASTRO=c$m40293"),
+    ("3488", "Emisión de certificaciones de colindancia de fincas particulares respecto a montes incluidos en el Catálogo de Utilidad Pública.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3488&IDTIPO=240&RASTRO=c$m40293"),
+    ("3489", "Autorizaciones en dominio público pecuario sin uso privativo.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3489&IDTIPO=240&RASTRO=c$m40288"),
+    ("3490", "Emisión de certificación o informe de colindancia de finca particular respecto de vía pecuaria.", "https://sede.carm.es/web/pagina?IDCONTENIDO=3490&IDTIPO=240&RASTRO=c$m40288"),
+    ("5883", "(INM) Emisión de certificación o informe para inmatriculación o inscripción registral de fincas colindantes con monte incluido en el CUP.", "https://sede.carm.es/web/pagina?IDCONTENIDO=5883&IDTIPO=240&RASTRO=c$m40288"),
+    ("482", "Autorizaciones e informes en Espacios Naturales Protegidos y Red Natura 2000 de la Región de Murcia.", "https://sede.carm.es/web/pagina?IDCONTENIDO=482&IDTIPO=240&RASTRO=c$m40288"),
+    ("7186", "Ocupación renovable de carácter temporal de vías pecuarias con concesión demanial.", None),
+    ("7202", "Modificación de trazados en vías pecuarias.", "https://sede.carm.es/web/pagina?IDCONTENIDO=7202&IDTIPO=240&RASTRO=c$m40288"),
+    ("7222", "Concesión para la utilización privativa y aprovechamiento especial del dominio público.", None),
+    ("7242", "Autorización de permutas en montes públicos.", "https://sede.carm.es/web/pagina?IDCONTENIDO=7242&IDTIPO=240&RASTRO=c$m40288"),
+]
+
+TEXTO_AVISO = (
+    "Este borrador preliminar de afecciones no tiene el valor de una certificación oficial y por tanto carece de validez legal y solo sirve como información general con carácter orientativo."
+)
+TEXTO_SOLICITUD = (
+    "En caso de ser detectadas afecciones a Dominio público forestal o pecuario, así como a Espacios Naturales Protegidos o RN2000, debe solicitar informe oficial a la D. G. de Patrimonio Natural y Acción Climática, a través de los procedimientos establecidos en sede electrónica:\n"
+)
+
+CONDICIONADO = (
+    "1.- Las afecciones del presente informe se basan en cartografia oficial de la Comunidad Autonoma de la Region de Murcia y de la Direccion General del Catastro, cumpliendo el estandar tecnico Web Feature Service (WFS) definido por el Open Geospatial Consortium (OGC) y la Directiva INSPIRE, eximiendo a IBERIA FORESTAL INGENIERIA S.L de cualquier error en la cartografia.\n\n"
+    "2.- De acuerdo con lo establecido en el articulo 22.1 de la ley 43/2003 de 21 de noviembre de Montes, toda inmatriculacion o inscripcion de exceso de cabida en el Registro de la Propiedad de un monte o de una finca colindante con monte demanial o ubicado en un termino municipal en el que existan montes demaniales requerira el previo informe favorable de los titulares de dichos montes y, para los montes catalogados, el del organo forestal de la comunidad autonoma.\n\n"
+    "3.- De acuerdo con lo establecido en el articulo 25.5 de la ley 43/2003 de 21 de noviembre de Montes, para posibilitar el ejercicio del derecho de adquisicion preferente a traves de la accion de tanteo, el transmitente debera notificar fehacientemente a la Administracion publica titular de ese derecho los datos relativos al precio y caracteristicas de la transmision proyectada, la cual dispondra de un plazo de tres meses, a partir de dicha notificacion, para ejercitar dicho derecho, mediante el abono o consignacion de su importe en las referidas condiciones.\n\n"
+    "4.- En relacion al Dominio Publico Pecuario, salvaguardando lo que pudiera resultar de los futuros deslindes, en la parcela objeto este informe, cualquier construccion, plantacion, vallado, obras, instalaciones, etc., no deberian realizarse dentro del area delimitada como Dominio Publico Pecuario provisional para evitar invadir este.\n"
+    "En todo caso, no podra interrumpirse el transito por el Dominio Publico Pecuario, dejando siempre el paso adecuado para el transito ganadero y otros usos legalmente establecidos en la Ley 3/1995, de 23 de marzo, de Vias Pecuarias.\n\n"
+    "5.- El Planeamiento se regira por la Ley 13/2015, de 30 de marzo, de ordenacion territorial y urbanistica de la Region de Murcia, y por el PGOU del termino municipal. El Regimen del suelo no urbanizable se recoge en el articulo 5 de la citada Ley. Se indica que en casos de suelo no urbanizables.\n\n"
+    "6.- En suelo no urbanizable se prestara especial atencion a la Disposicion adicional segunda de la Ley 3/2020, de 27 de julio, de recuperacion y proteccion del Mar Menor, solicitando para posibles cambios de uso lo establecido en el articulo 8 de la Ley 8/2014, de 21 de noviembre, de Medidas Tributarias, de Simplificacion Administrativa y en materia de Funcion Publica.\n\n"
+    "7.- Los Planes de Gestion de la Red Natura 2000 aprobados, en la actualidad para la Comunidad Autonoma de la Region de Murcia son:\n"
+        "- Decreto n. 13/2017, de 1 de marzo - Declaracion de las ZEC \"Minas de la Celia\" y \"Cueva de las Yeseras\" y aprobacion de su Plan de Gestion.\n"
+        "- Decreto n. 259/2019, de 10 de octubre - Declaracion de ZEC y aprobacion del Plan de Gestion Integral de los Espacios Protegidos del Mar Menor y la Franja Litoral Mediterranea.\n"
+        "- Decreto n. 231/2020, de 29 de diciembre - Aprobacion del Plan de Gestion Integral de los Espacios Protegidos Red Natura 2000 de la Sierra de Ricote y La Navela.\n"
+        "- Decreto n. 47/2022, de 5 de mayo - Declaracion de ZEC y aprobacion del Plan de Gestion Integral de los Espacios Protegidos Red Natura 2000 del Alto Guadalentin; y aprobacion de los Planes de gestion de las ZEC del Cabezo de la Jara y Rambla de Nogalte y de la Sierra de Enmedio.\n"
+        "- Decreto n. 252/2022, de 22 de diciembre - Declaracion de ZEC y aprobacion del Plan de Gestion Integral de los espacios protegidos de los relieves y cuencas centro-orientales de la Region de Murcia.\n"
+        "- Decreto n. 28/2025, de 10 de abril - Declaracion de ZEC y aprobacion del Plan de Gestion Integral de los Espacios Protegidos del Altiplano de la Region de Murcia.\n\n"
+    "8.- Los Planes de Ordenacion de los Recursos Naturales aprobados, en la actualidad para la Comunidad Autonoma de la Region de Murcia son:\n"
+        "- Parque Regional Sierra de la Pila - Decreto n 43/2004, de 14 de mayo (aprobado definitivamente; BORM n 130, de 07/06/2004).\n"
+        "- Parque Regional Sierra de El Carche - Decreto n 69/2002, de 22 de marzo (aprobado; BORM n 77, de 04/04/2002).\n"
+        "- Parque Regional Salinas y Arenales de San Pedro del Pinatar - Decreto 44/1995, de 26 de mayo de 1995 (BORM n 151, de 01/07/1995).\n"
+        "- Parque Regional Calblanque, Monte de las Cenizas y Pena del Aguila - Decreto 45/1995, de 26 de mayo de 1995 (BORM n 152, de 03/07/1995).\n"
+        "- Parque Regional Sierra Espuna (incluido el Paisaje Protegido Barrancos de Gebas) - Decreto 13/1995, de 31 de marzo de 1995 (aprobacion del PORN; BORM n 85, de 11/04/1995).\n"
+        "- Humedal del Ajauque y Rambla Salada - Orden (1998) (fase inicial).\n"
+        "- Saladares del Guadalentin - Orden (29/12/1998) (fase inicial).\n"
+        "- Sierra de Salinas - Orden (03/07/2002) (fase inicial).\n"
+        "- Carrascoy y El Valle - Orden (18/05/2005) (fase inicial - ademas, existe en 2025 proyecto de Plan / Plan de Gestion/ZEC en informacion publica).\n"
+        "- Sierra de la Muela, Cabo Tinoso y Roldan - Orden (15/03/2006) (fase inicial).\n\n"
+    "9.- Los Planes de Recuperacion de Flora aprobados, en la actualidad para la Comunidad Autonoma de la Region de Murcia son:\n"
+        "- Decreto 244/2014, de 19 de diciembre: aprueba los planes de recuperacion de las especies Cistus heterophyllus subsp. carthaginensis, Erica arborea, Juniperus turbinata, Narcissus nevadensis subsp. enemeritoi y Scrophularia arguta. Publicado en BORM n 297, de 27/12/2014.\n"
+        "- Decreto 12/2007, de 22 de febrero: aprueba el plan de recuperacion de la especie Astragalus nitidiflorus (\"garbancillo de Tallante\"). Publicado en BORM n 51, de 3/03/2007.\n\n"
+    "10.- Los Planes de Recuperacion de Fauna aprobados, en la actualidad para la Comunidad Autonoma de la Region de Murcia son:\n"
+        "- Decreto n. 59/2016, de 22 de junio, de aprobacion de los planes de recuperacion del aguila perdicera, la nutria y el fartet.\n"
+        "- Decreto n. 70/2016, de 12 de julio - Catalogacion de la malvasia cabeciblanca como especie en peligro de extincion y aprobacion de su Plan de Recuperacion en la Region de Murcia."
+)
+
+PIE = (
+    "La normativa de referencia esta actualizada a fecha de uno de enero de dos mil veintiseis, y sera revisada trimestralmente.\n\n"
+    "Para mas informacion:\n"
+    "E-mail: info@iberiaforestal.es"
+)
+
+# Cambia con cualquier cambio de los textos: invalida la maquetación cacheada
+VERSION_PLANTILLA = hashlib.sha1(
+    repr((PROCEDIMIENTOS, TEXTO_AVISO, TEXTO_SOLICITUD, CONDICIONADO, PIE)).encode()
+).hexdigest()[:12]
+
+# Procedimientos
+LINEA_PROC = 4
+ANCHO_CODIGO = 9
+SEPARACION_CODIGO = 2
+ESPACIO_INICIAL = 10
+ESPACIO_ENTRE = 4
+ESPACIO_FINAL = 5
+MARGEN_INFERIOR = 20
+# CONDICIONADO
+MARGEN_LATERAL = 15
+SEPARACION_COLUMNAS = 5
+LINEA_COND = 4.5
+
+
+class _Grabadora(FPDF):
+    """FPDF que no escribe nada: guarda las líneas que multi_cell enviaría a cell()."""
+
+    def cell(self, w, h=0, txt='', border=0, ln=0, align='', fill=0, link=''):
+        self.lineas.append((txt, self.ws, border))
+
+    def _out(self, s):
+        pass
+
+
+def _partir(formato, fuente, w, h, texto, border=0, align="J"):
+    """[(texto, espaciado de palabras, borde)] por línea, exactamente como las escribiría multi_cell."""
+    grabadora = _Grabadora(format=formato, unit="mm")
+    grabadora.add_page()
+    grabadora.set_font(*fuente)
+    grabadora.lineas = []
+    grabadora.multi_cell(w, h, texto, border=border, align=align)
+    return grabadora.lineas
+
+
+@functools.lru_cache(maxsize=8)
+def maqueta(ancho_pagina, alto_pagina, margen, version=VERSION_PLANTILLA):
+    """Líneas y alturas de las secciones fijas para un tamaño de página y margen."""
+    formato = (ancho_pagina, alto_pagina)  # en mm
+    ancho_util = ancho_pagina - 2 * margen
+    ancho_texto = ancho_pagina - (margen + ANCHO_CODIGO + SEPARACION_CODIGO) - margen
+
+    aviso = _partir(formato, ("Arial", "B", 10), ancho_util, 5, TEXTO_AVISO, border=1)
+    solicitud = _partir(formato, ("Arial", "B", 8), ancho_util, 5, TEXTO_SOLICITUD)
+    procedimientos = [
+        (codigo, url, _partir(formato, ("Arial", "", 8), ancho_texto, LINEA_PROC, texto))
+        for codigo, texto, url in PROCEDIMIENTOS
+    ]
+    altura_total = (
+        ESPACIO_INICIAL
+        + max(1, len(aviso)) * 5 + 2
+        + ESPACIO_ENTRE
+        + max(1, len(solicitud)) * 5 + 2
+        + sum(max(1, len(lineas)) * LINEA_PROC for _, _, lineas in procedimientos)
+        + ESPACIO_FINAL
+    )
+
+    # CONDICIONADO: párrafos repartidos en dos columnas de altura similar
+    ancho_columna = (ancho_pagina - 2 * MARGEN_LATERAL - SEPARACION_COLUMNAS) / 2
+    columnas = ([], [])
+    alturas = [0, 0]
+    for parrafo in (p.strip() for p in CONDICIONADO.split('\n\n') if p.strip()):
+        lineas = _partir(formato, ("Arial", "", 9), ancho_columna, LINEA_COND, parrafo)
+        columna = 0 if alturas[0] <= alturas[1] else 1
+        columnas[columna].append(lineas)
+        alturas[columna] += len(lineas) * LINEA_COND
+    pie = _partir(formato, ("Arial", "", 9), ancho_pagina - 2 * margen, LINEA_COND, PIE)
+
+    return {
+        "ancho_util": ancho_util,
+        "ancho_texto": ancho_texto,
+        "aviso": aviso,
+        "solicitud": solicitud,
+        "procedimientos": procedimientos,
+        "altura_total": altura_total,
+        "ancho_columna": ancho_columna,
+        "columnas": columnas,
+        "pie": pie,
+    }
+
+
+def _maqueta_de(pdf):
+    return maqueta(pdf.w, pdf.h, pdf.l_margin)
+
+
+def _escribir(pdf, w, h, lineas, align="J", fill=False):
+    """Escribe líneas ya partidas como lo haría multi_cell (incluido el justificado)."""
+    for texto, ws, borde in lineas:
+        if ws != pdf.ws:
+            pdf.ws = ws
+            pdf._out('%.3f Tw' % (ws * pdf.k) if ws else '0 Tw')
+        pdf.cell(w, h, texto, borde, 2, align, fill)
+    if pdf.ws:
+        pdf.ws = 0
+        pdf._out('0 Tw')
+    pdf.x = pdf.l_margin
+
+
+def escribir_procedimientos(pdf):
+    """Cuadro de aviso, texto de solicitud y procedimientos con enlace a sede electrónica."""
+    m = _maqueta_de(pdf)
+    margin = pdf.l_margin
+    pdf.set_font("Arial", "", 8)
+    x_texto = margin + ANCHO_CODIGO + SEPARACION_CODIGO
+
+    # Si no cabe todo, nueva página (el bloque no se corta)
+    if pdf.h - pdf.get_y() - MARGEN_INFERIOR < m["altura_total"]:
+        pdf.add_page()
+    pdf.ln(ESPACIO_INICIAL)
+
+    # --- CUADRO ROJO ---
+    pdf.set_font("Arial", "B", 10)
+    pdf.set_text_color(255, 0, 0)
+    pdf.set_draw_color(0, 0, 0)
+    pdf.set_line_width(0.5)
+    pdf.set_fill_color(251, 228, 213)
+    _escribir(pdf, m["ancho_util"], 5, m["aviso"], fill=True)
+    pdf.ln(2)
+
+    # --- TEXTO EN NEGRITA ---
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", "B", 8)
+    _escribir(pdf, m["ancho_util"], 5, m["solicitud"])
+    pdf.ln(2)
+
+    # --- PROCEDIMIENTOS ---
+    pdf.set_font("Arial", "", 8)
+    y = pdf.get_y()
+    for codigo, url, lineas in m["procedimientos"]:
+        altura_linea = max(1, len(lineas)) * LINEA_PROC
+        if pdf.get_y() + altura_linea > pdf.h - pdf.b_margin:
+            pdf.add_page()
+            y = pdf.get_y()
+
+        pdf.set_xy(margin, y)
+        if url:
+            pdf.set_text_color(0, 0, 255)
+            pdf.cell(ANCHO_CODIGO, LINEA_PROC, f"- {codigo}", border=0)
+            pdf.link(margin, y, ANCHO_CODIGO, LINEA_PROC, url)
+            pdf.set_text_color(0, 0, 0)
+        else:
+            pdf.cell(ANCHO_CODIGO, LINEA_PROC, f"- {codigo}", border=0)
+
+        pdf.set_xy(x_texto, y)
+        _escribir(pdf, m["ancho_texto"], LINEA_PROC, lineas)
+        y += altura_linea
+
+    pdf.ln(ESPACIO_FINAL)
+
+
+def escribir_condicionado(pdf):
+    """Página del CONDICIONADO en dos columnas y pie con la fecha de la normativa."""
+    m = _maqueta_de(pdf)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 12, "CONDICIONADO", ln=True, align="C")
+    pdf.ln(8)
+
+    pdf.set_font("Arial", "", 9)
+    y_inicio = pdf.get_y()
+    y_final = y_inicio
+    for n, parrafos in enumerate(m["columnas"]):
+        pdf.set_y(y_inicio)
+        for lineas in parrafos:
+            pdf.set_x(MARGEN_LATERAL + n * (m["ancho_columna"] + SEPARACION_COLUMNAS))
+            _escribir(pdf, m["ancho_columna"], LINEA_COND, lineas)
+        y_final = max(y_final, pdf.get_y())
+    pdf.set_y(y_final)
+
+    # === PIE ===
+    pdf.ln(10)
+    pdf.set_font("Arial", "", 9)
+    _escribir(pdf, m["ancho_util"], LINEA_COND, m["pie"])
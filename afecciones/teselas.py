@@ -0,0 +1,135 @@
+"""
+Caché de teselas para las consultas WFS filtradas por bbox.
+
+La bbox de la parcela se ajusta a una rejilla fija en EPSG:25830 y cada
+(capa, celda) se descarga una sola vez y se guarda en disco, así que parcelas
+vecinas (mismo municipio, misma finca) comparten las descargas. Los
+elementos que cruzan varias celdas se deduplican por su ID de WFS al
+cargarlos en el índice combinado (afecciones.indice).
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from afecciones import red
+from afecciones.cache import CACHE_DIR
+
+# Lado de la celda de la rejilla (m, EPSG:25830)
+TAMANO_CELDA = int(os.environ.get("AFECCIONES_TAMANO_CELDA", 5000))
+TESELAS_DIR = os.path.join(CACHE_DIR, "teselas")
+TESELAS_TTL = 604800  # 7 días, igual que la descarga de capas completas
+
+_lock_estadisticas = threading.Lock()
+_estadisticas = defaultdict(lambda: {"aciertos": 0, "fallos": 0})
+
+
+def estadisticas():
+    """Aciertos y fallos de la caché de teselas por capa."""
+    with _lock_estadisticas:
+        return {capa: dict(datos) for capa, datos in _estadisticas.items()}
+
+
+def _contar(clave, campo):
+    with _lock_estadisticas:
+        _estadisticas[clave][campo] += 1
+
+
+def celdas(bounds, tamano=TAMANO_CELDA):
+    """Celdas (i, j) de la rejilla que cubren la envolvente (minx, miny, maxx, maxy)."""
+    minx, miny, maxx, maxy = bounds
+    return [
+        (i, j)
+        for i in range(math.floor(minx / tamano), math.floor(maxx / tamano) + 1)
+        for j in range(math.floor(miny / tamano), math.floor(maxy / tamano) + 1)
+    ]
+
+
+def bbox_celda(i, j, tamano=TAMANO_CELDA):
+    return (i * tamano, j * tamano, (i + 1) * tamano, (j + 1) * tamano)
+
+
+def _ruta_celda(clave, i, j):
+    return os.path.join(TESELAS_DIR, clave, f"{TAMANO_CELDA}_{i}_{j}.geojson")
+
+
+def descargar_celda(clave, url, i, j, plazo=None):
+    """GeoJSON (bytes) de la celda; de disco si está vigente. Los fallos se propagan."""
+    ruta = _ruta_celda(clave, i, j)
+    try:
+        if time.time() - os.path.getmtime(ruta) < TESELAS_TTL:
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+            _contar(clave, "aciertos")
+            return contenido
+    except OSError:
+        pass
+
+    _contar(clave, "fallos")
+    minx, miny, maxx, maxy = bbox_celda(i, j)
+    response = red.get(
+        f"{url}&srsName=EPSG:25830&bbox={minx},{miny},{maxx},{maxy},EPSG:25830",
+        plazo=plazo,
+    )
+    response.raise_for_status()
+    contenido = response.content
+    json.loads(contenido)  # no se guardan en caché respuestas de error del servidor
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+    return contenido
+
+
+def piezas_locales(clave, bounds):
+    """{"i_j": GeoJSON} de las celdas que cubren `bounds` y ya están en disco (sin red)."""
+    piezas = {}
+    for i, j in celdas(bounds):
+        try:
+            with open(_ruta_celda(clave, i, j), "rb") as f:
+                piezas[f"{i}_{j}"] = f.read()
+        except OSError:
+            continue
+    return piezas
+
+
+def descargar(clave, url, bounds, plazo=None):
+    """
+    ({"i_j": GeoJSON de la celda} para las celdas que cubren `bounds`, versión)
+    o None si alguna celda no se pudo descargar. La versión cambia si cambia
+    cualquiera de ellas.
+    """
+    try:
+        piezas = {f"{i}_{j}": descargar_celda(clave, url, i, j, plazo) for i, j in celdas(bounds)}
+    except Exception:
+        return None
+    return piezas, _version(piezas)
+
+
+def _version(piezas):
+    return hashlib.sha1(
+        b"".join(hashlib.sha1(contenido).digest() for contenido in piezas.values())
+    ).hexdigest()
+
+
+def version_local(clave, bounds):
+    """
+    Versión (la misma que daría `descargar`) si todas las celdas que cubren
+    `bounds` están en disco y vigentes; None si falta alguna (sin red).
+    """
+    piezas = {}
+    for i, j in celdas(bounds):
+        ruta = _ruta_celda(clave, i, j)
+        try:
+            if time.time() - os.path.getmtime(ruta) >= TESELAS_TTL:
+                return None
+            with open(ruta, "rb") as f:
+                piezas[f"{i}_{j}"] = f.read()
+        except OSError:
+            return None
+    return _version(piezas)
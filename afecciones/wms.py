@@ -0,0 +1,216 @@
+"""
+Proxy con caché para las teselas WMS y las leyendas del mapa interactivo.
+
+Las peticiones GetMap / GetLegendGraphic se guardan en disco por capa, bbox,
+tamaño y resto de parámetros, con caducidad y cuota, así que cada tesela se
+pide al servidor regional una sola vez para todos los usuarios. Las leyendas
+se incrustan en el mapa como data URI.
+
+El navegador solo pasa por el proxy si se indica en AFECCIONES_PROXY_WMS_URL
+la dirección en la que lo ve (junto con AFECCIONES_PROXY_WMS_PUERTO para
+arrancarlo dentro de la aplicación); si no, las teselas se piden
+directamente al servidor.
+
+    python -m afecciones.wms                      # proxy independiente
+    python -m afecciones.wms --simulado 8766      # servidor WMS de prueba
+    AFECCIONES_WMS_ORIGEN=http://localhost:8766/wms python -m afecciones.wms
+"""
+import argparse
+import base64
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qsl, urlsplit
+
+from afecciones import red
+from afecciones.cache import CACHE_DIR
+from afecciones.disco import CacheDisco
+
+logger = logging.getLogger(__name__)
+
+WMS_ORIGEN = os.environ.get("AFECCIONES_WMS_ORIGEN", "https://mapas-gis-inter.carm.es/geoserver/ows")
+WMS_TTL = float(os.environ.get("AFECCIONES_WMS_TTL", 7 * 86400))
+WMS_CUOTA = int(os.environ.get("AFECCIONES_WMS_CUOTA_MB", 200)) * 1024 * 1024
+
+PROXY_PUERTO = int(os.environ.get("AFECCIONES_PROXY_WMS_PUERTO", 0))
+# Dirección del proxy tal como la ve el navegador del usuario (no la del servidor)
+PROXY_URL = os.environ.get("AFECCIONES_PROXY_WMS_URL")
+
+if PROXY_PUERTO and not PROXY_URL:
+    logger.warning("AFECCIONES_PROXY_WMS_PUERTO sin AFECCIONES_PROXY_WMS_URL: las teselas se piden al servidor WMS")
+
+# Capas que el proxy acepta (no es un proxy abierto)
+CAPAS_PERMITIDAS = {
+    "SIG_LUP_SITES_CARM:RN2000",
+    "PFO_ZOR_DMVP_CARM:MONTES",
+    "PFO_ZOR_DMVP_CARM:VP_CARM",
+}
+# Parámetros que forman la clave de la caché (el resto se ignoran)
+PARAMETROS = (
+    "service", "version", "request", "layers", "layer", "styles", "format", "transparent",
+    "srs", "crs", "bbox", "width", "height",
+)
+
+_cache = CacheDisco(os.path.join(CACHE_DIR, "wms"), WMS_TTL, WMS_CUOTA)
+
+
+def _normalizar(params):
+    params = {k.lower(): v for k, v in params.items()}
+    return {k: params[k] for k in PARAMETROS if k in params}
+
+
+def obtener(params, plazo=None):
+    """
+    (contenido, tipo MIME) de una petición GetMap / GetLegendGraphic, de la
+    caché de disco si está vigente. Lanza ValueError si la petición no está
+    permitida y las excepciones de requests si el servidor falla.
+    """
+    params = _normalizar(params)
+    if params.get("request", "").lower() not in ("getmap", "getlegendgraphic"):
+        raise ValueError("Petición WMS no permitida")
+    if params.get("layers", params.get("layer")) not in CAPAS_PERMITIDAS:
+        raise ValueError("Capa WMS no permitida")
+
+    tipo = params.get("format", "image/png")
+    clave = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    contenido = _cache.leer(clave)
+    if contenido is not None:
+        return contenido, tipo
+
+    response = red.get(WMS_ORIGEN, params=params, plazo=plazo)
+    response.raise_for_status()
+    # Los errores de GeoServer llegan con 200 y XML: no se guardan
+    if not response.headers.get("Content-Type", "").startswith("image/"):
+        raise ValueError(f"Respuesta WMS no válida: {response.headers.get('Content-Type')}")
+    _cache.guardar(clave, response.content)
+    return response.content, tipo
+
+
+def url_leyenda(capa):
+    return (
+        f"{WMS_ORIGEN}?service=WMS&version=1.3.0&request=GetLegendGraphic"
+        f"&format=image%2Fpng&width=20&height=20&layer={capa.replace(':', '%3A')}"
+    )
+
+
+def leyenda_data_uri(capa, plazo=None):
+    """Leyenda de la capa como data URI; si el servidor no responde, su URL remota."""
+    try:
+        contenido, tipo = obtener(
+            {"service": "WMS", "version": "1.3.0", "request": "GetLegendGraphic",
+             "format": "image/png", "width": "20", "height": "20", "layer": capa},
+            plazo=plazo,
+        )
+    except Exception:
+        return url_leyenda(capa)
+    return f"data:{tipo};base64,{base64.b64encode(contenido).decode('ascii')}"
+
+
+# === PROXY HTTP ===
+class _ManejadorProxy(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/wms":
+            self.send_error(404)
+            return
+        try:
+            contenido, tipo = obtener(dict(parse_qsl(url.query)))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception:
+            self.send_error(502, "Servidor WMS no disponible")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(contenido)))
+        self.send_header("Cache-Control", f"public, max-age={int(WMS_TTL)}")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+_lock_proxy = threading.Lock()
+_proxy = None
+
+
+def iniciar_proxy(puerto=PROXY_PUERTO):
+    """Arranca el proxy en un hilo (una vez por proceso)."""
+    global _proxy
+    with _lock_proxy:
+        if _proxy is None:
+            _proxy = ThreadingHTTPServer(("", puerto), _ManejadorProxy)
+            _proxy.daemon_threads = True
+            threading.Thread(target=_proxy.serve_forever, name="proxy-wms", daemon=True).start()
+        return _proxy
+
+
+def url_teselas():
+    """
+    URL base de las WmsTileLayer: el proxy si está activado, si no el servidor
+    WMS. El proxy integrado solo se usa con AFECCIONES_PROXY_WMS_URL: el
+    navegador no puede adivinar en qué dirección se publica el puerto.
+    """
+    if PROXY_PUERTO and PROXY_URL:
+        try:
+            iniciar_proxy()
+            return PROXY_URL
+        except OSError:
+            logger.exception("No se pudo arrancar el proxy WMS en el puerto %s", PROXY_PUERTO)
+            return f"{WMS_ORIGEN}?SERVICE=WMS&?"
+    return PROXY_URL or f"{WMS_ORIGEN}?SERVICE=WMS&?"
+
+
+# === SERVIDOR WMS SIMULADO (PRUEBAS LOCALES) ===
+class _ManejadorSimulado(BaseHTTPRequestHandler):
+    peticiones = 0
+
+    def do_GET(self):
+        from PIL import Image
+
+        type(self).peticiones += 1
+        params = {k.lower(): v for k, v in parse_qsl(urlsplit(self.path).query)}
+        tamano = (int(params.get("width", 256)), int(params.get("height", 256)))
+        buffer = BytesIO()
+        Image.new("RGBA", tamano, (0, 128, 0, 64)).save(buffer, format="PNG")
+        contenido = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def servidor_simulado(puerto=0):
+    """Servidor WMS local que devuelve PNG generados; para probar el proxy sin red."""
+    servidor = ThreadingHTTPServer(("localhost", puerto), _ManejadorSimulado)
+    threading.Thread(target=servidor.serve_forever, name="wms-simulado", daemon=True).start()
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proxy con caché para el WMS del mapa interactivo.")
+    parser.add_argument("--puerto", type=int, default=PROXY_PUERTO or 8765)
+    parser.add_argument("--simulado", type=int, metavar="PUERTO", help="arranca solo el servidor WMS de prueba")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.simulado is not None:
+        servidor = servidor_simulado(args.simulado)
+        logger.info("WMS simulado en http://localhost:%d/wms", servidor.server_address[1])
+    else:
+        servidor = iniciar_proxy(args.puerto)
+        logger.info("Proxy WMS en el puerto %d -> %s", servidor.server_address[1], WMS_ORIGEN)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Cachés en disco de las pruebas fuera del directorio de trabajo (antes de importar afecciones)
+os.environ.setdefault("AFECCIONES_CACHE_DIR", tempfile.mkdtemp(prefix="afecciones_pruebas_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
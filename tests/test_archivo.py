@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+from shapely.geometry import box
+
+from afecciones import archivo, capas, informe_pdf, teselas
+
+PARCELA = box(650000, 4200000, 650100, 4200100)
+SOLICITANTE = {"nombre": "Ana", "apellidos": "Pérez", "dni": "11111111H"}
+LOCALIZACION = ("MULA", "12", "34")
+HOY = informe_pdf.fecha_hoy()
+
+
+@pytest.fixture
+def celdas_en_disco(monkeypatch, tmp_path):
+    """Todas las capas con sus celdas de la parcela en disco; ninguna extensión conocida."""
+    monkeypatch.setattr(teselas, "TESELAS_DIR", str(tmp_path / "teselas"))
+    monkeypatch.setattr(capas, "extension_capa", lambda clave, plazo=None: None)
+    for clave in capas.CAPAS:
+        for i, j in teselas.celdas(PARCELA.bounds):
+            ruta = teselas._ruta_celda(clave, i, j)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "wb") as f:
+                f.write(b'{"features": []}')
+    return tmp_path
+
+
+def test_la_version_local_coincide_con_la_descarga(celdas_en_disco):
+    piezas, version = teselas.descargar("enp", "http://sin-red.local", PARCELA.bounds)
+    assert teselas.version_local("enp", PARCELA.bounds) == version
+    assert teselas.version_local("enp", box(0, 0, 10, 10).bounds) is None
+
+
+def test_clave_con_fecha_y_sin_resultados(celdas_en_disco):
+    clave = informe_pdf.clave_archivo("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA, HOY)
+    assert clave is not None
+    # Los resultados no cuentan (la versión de las capas ya los determina)
+    datos = informe_pdf.datos_informe(
+        SOLICITANTE, 650050, 4200050, *LOCALIZACION,
+        {clave: {"texto": "No afecta", "filas": None} for clave in capas.CAPAS},
+    )
+    assert informe_pdf.clave_archivo("carm", datos, LOCALIZACION, 650050, 4200050, PARCELA, HOY) == clave
+    # La fecha va impresa en la página 1: otro día, otra clave
+    assert informe_pdf.clave_archivo("carm", datos, LOCALIZACION, 650050, 4200050, PARCELA, "01/01/2000") != clave
+    # Otro solicitante u otra página, otra clave
+    assert informe_pdf.clave_archivo("carm", {**SOLICITANTE, "dni": "2"}, LOCALIZACION, 650050, 4200050, PARCELA, HOY) != clave
+    assert informe_pdf.clave_archivo("jccm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA, HOY) != clave
+
+
+def test_sin_celdas_no_hay_clave(celdas_en_disco):
+    ruta = teselas._ruta_celda("vp", *teselas.celdas(PARCELA.bounds)[0])
+    os.utime(ruta, (0, time.time() - teselas.TESELAS_TTL - 1))
+    assert informe_pdf.clave_archivo("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA, HOY) is None
+
+
+def test_informe_archivado(celdas_en_disco, monkeypatch):
+    monkeypatch.setattr(archivo, "ARCHIVO_DIR", str(celdas_en_disco / "archivo"))
+    monkeypatch.setattr(archivo, "ARCHIVO_DB", str(celdas_en_disco / "archivo" / "archivo.sqlite"))
+    assert informe_pdf.informe_archivado("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA) is None
+    clave = informe_pdf.clave_archivo("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA, HOY)
+    archivo.guardar(clave, b"%PDF-prueba", "carm", {"fecha_informe": "01/01/2000", **SOLICITANTE})
+    assert informe_pdf.informe_archivado("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA) == b"%PDF-prueba"
+
+
+def test_no_archiva_informes_con_capas_con_error(celdas_en_disco, monkeypatch):
+    monkeypatch.setattr(archivo, "ARCHIVO_DIR", str(celdas_en_disco / "archivo"))
+    monkeypatch.setattr(archivo, "ARCHIVO_DB", str(celdas_en_disco / "archivo" / "archivo.sqlite"))
+    # Afección detectada sin sus filas y el WFS caído al volver a descargarla
+    monkeypatch.setattr(informe_pdf, "_descargar_geojson", lambda url, plazo=None: None)
+    resultados = {clave: {"texto": "No afecta", "filas": None} for clave in capas.CAPAS}
+    resultados["enp"] = {"texto": "Dentro de ENP: Sierra Espuña", "filas": None}
+    datos = informe_pdf.datos_informe(SOLICITANTE, 650050, 4200050, *LOCALIZACION, resultados)
+
+    pdf_bytes = informe_pdf.obtener_informe(
+        datos, 650050, 4200050, PARCELA, "carm", mapas={"localizacion": None, "tematica": None}
+    )
+    assert pdf_bytes.startswith(b"%PDF")
+    assert informe_pdf.informe_archivado("carm", SOLICITANTE, LOCALIZACION, 650050, 4200050, PARCELA) is None
@@ -0,0 +1,20 @@
+from shapely.geometry import Polygon
+
+from afecciones import cache
+
+
+def test_hash_no_depende_del_orden_de_vertices():
+    a = Polygon([(0, 0), (10, 0), (10, 10), (0, 10)])
+    b = Polygon([(10, 10), (0, 10), (0, 0), (10, 0)])
+    assert cache.hash_geometria(a) == cache.hash_geometria(b)
+    assert cache.hash_geometria(a) != cache.hash_geometria(a.buffer(1))
+
+
+def test_una_version_nueva_sustituye_a_la_anterior():
+    geom = cache.hash_geometria(Polygon([(0, 0), (5, 0), (5, 5)]))
+    cache.guardar_resultado(geom, "zepa", "v1", {"texto": "No afecta a ZEPA", "filas": None})
+    cache.guardar_resultado(geom, "zepa", "v2", {"texto": "ZEPA X", "filas": [["ES0000", "X"]]})
+    assert cache.leer_resultado(geom, "zepa", "v1") is None
+    # Las filas vuelven como tuplas, igual que al calcularlas
+    assert cache.leer_resultado(geom, "zepa", "v2") == {"texto": "ZEPA X", "filas": [("ES0000", "X")]}
+    assert cache.leer_resultado(geom, "lic", "v2") is None
@@ -0,0 +1,20 @@
+from shapely.geometry import box
+
+from afecciones import cache, capas
+
+
+def test_fuera_de_extension_con_margen():
+    extension = (0, 0, 1000, 1000)
+    assert not capas._fuera_de_extension(box(1020, 0, 1100, 10), extension)
+    assert capas._fuera_de_extension(box(1100, 0, 1200, 10), extension)
+
+
+def test_capa_fuera_de_extension_no_se_descarga(monkeypatch):
+    def descargar(*args, **kwargs):
+        raise AssertionError("no debe descargarse")
+
+    monkeypatch.setattr(capas, "descargar_piezas", descargar)
+    cache.guardar_extension("zepa", (600000, 4150000, 700000, 4250000))
+    parcela = box(100000, 4000000, 100100, 4000100)
+    resultado, version = capas._preparar_capa(parcela, "zepa", cache.hash_geometria(parcela))
+    assert resultado == {"texto": "No afecta a ZEPA", "filas": []} and version is None
@@ -0,0 +1,56 @@
+import json
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import box, mapping
+
+from afecciones import censo
+
+
+def _capa(*elementos):
+    return json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": id_elemento, "geometry": mapping(geom), "properties": {}}
+            for id_elemento, geom in elementos
+        ],
+    }).encode()
+
+
+def test_no_descarga_capas_fuera_del_municipio(monkeypatch):
+    descargadas = []
+
+    def descargar(clave, bounds, plazo=None):
+        descargadas.append(clave)
+        return {"completa": _capa((f"{clave}.1", box(0, 0, 50, 50)))}, "v1"
+
+    extensiones = {"enp": (0, 0, 1000, 1000), "zepa": (500000, 4000000, 600000, 4100000), "lic": None}
+    monkeypatch.setattr(censo, "extension_capa", lambda clave, plazo=None: extensiones[clave])
+    monkeypatch.setattr(censo, "descargar_piezas", descargar)
+    # Sin extensión conocida (lic) se descarga por si acaso
+    assert sorted(censo.cargar_capas(["enp", "zepa", "lic"], (0, 0, 100, 100))) == ["enp", "lic"]
+    assert sorted(descargadas) == ["enp", "lic"]
+
+
+def test_cruza_parcelas_y_elementos(monkeypatch, tmp_path):
+    monkeypatch.setattr(censo, "extension_capa", lambda clave, plazo=None: None)
+    monkeypatch.setattr(
+        censo, "descargar_piezas",
+        lambda clave, bounds, plazo=None: ({"completa": _capa(("censo.1", box(0, 0, 15, 10)))}, "v1"),
+    )
+    parcelario = gpd.GeoDataFrame(
+        {"MASA": [1, 1, 2], "PARCELA": [1, 2, 3]},
+        geometry=[box(0, 0, 10, 10), box(10, 0, 20, 10), box(100, 100, 110, 110)], crs="EPSG:25830",
+    )
+    ruta = str(tmp_path / "parcelario.gpkg")
+    parcelario.to_file(ruta)
+    tabla = censo.censo("carm", "MULA", claves=["enp"], parcelario=ruta)
+    solapes = dict(zip(tabla["parcela"], tabla["area_solape_m2"]))
+    assert solapes == {"1": 100.0, "2": 50.0}
+
+
+def test_jccm_sin_provincia():
+    with pytest.raises(ValueError, match="provincia"):
+        censo.censo("jccm", "TOLEDO")
+    with pytest.raises(SystemExit):
+        censo.main(["TOLEDO", "--ambito", "jccm", "--salida", "censo.csv"])
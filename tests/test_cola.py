@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from shapely.geometry import box
+
+from afecciones import cola
+
+PARCELA = box(650000, 4200000, 650100, 4200100)
+
+
+@pytest.fixture(autouse=True)
+def cola_vacia(monkeypatch, tmp_path):
+    monkeypatch.setattr(cola, "COLA_DB", str(tmp_path / "cola.sqlite"))
+
+
+@pytest.fixture
+def conn():
+    conexion = cola._conectar()
+    yield conexion
+    conexion.close()
+
+
+def _encolar():
+    return cola.encolar("carm", {"nombre": "Ana"}, ("MULA", "12", "34"), 650050, 4200050, PARCELA)
+
+
+def test_pendiente_en_curso_hecho(conn, monkeypatch):
+    trabajo_id = _encolar()
+    assert cola.estado(trabajo_id) == {"estado": "pendiente", "intentos": 0, "error": None, "posicion": 1}
+
+    def generar(ambito, entrada):
+        assert cola.estado(trabajo_id)["estado"] == "en_curso"
+        assert entrada["localizacion"] == ["MULA", "12", "34"]
+        return b"%PDF", {"tiempos": "total 1.0 s"}
+
+    monkeypatch.setattr(cola, "generar", generar)
+    assert cola.procesar_siguiente(conn)
+    estado = cola.estado(trabajo_id)
+    assert estado["estado"] == "hecho" and estado["pdf"] == b"%PDF" and estado["intentos"] == 1
+    assert not cola.procesar_siguiente(conn)
+
+
+def test_reintentos_con_espera_y_error_final(conn, monkeypatch):
+    monkeypatch.setattr(cola, "MAX_INTENTOS", 2)
+    monkeypatch.setattr(cola, "generar", lambda ambito, entrada: 1 / 0)
+    trabajo_id = _encolar()
+
+    assert cola.procesar_siguiente(conn)
+    estado = cola.estado(trabajo_id)
+    assert estado["estado"] == "pendiente" and "division" in estado["error"]
+    # Con espera: no se vuelve a tomar enseguida
+    assert not cola.procesar_siguiente(conn)
+
+    conn.execute("UPDATE trabajos SET disponible = 0")
+    assert cola.procesar_siguiente(conn)
+    assert cola.estado(trabajo_id)["estado"] == "error"
+
+
+def test_admision(monkeypatch):
+    monkeypatch.setattr(cola, "MAX_SIN_TERMINAR", 2)
+    _encolar()
+    _encolar()
+    with pytest.raises(cola.ColaLlena):
+        _encolar()
+
+
+def test_abandonado_vuelve_a_la_cola(conn, monkeypatch):
+    monkeypatch.setattr(cola, "ABANDONO", 60)
+    trabajo_id = _encolar()
+    assert cola._tomar(conn)["id"] == trabajo_id
+    # Renovado hace poco: sigue en curso
+    assert cola._tomar(conn) is None
+    conn.execute("UPDATE trabajos SET actualizado = ?", (time.time() - 120,))
+    assert cola._tomar(conn)["id"] == trabajo_id
+    assert cola.estado(trabajo_id)["intentos"] == 2
+
+
+def test_el_latido_evita_el_abandono(conn, monkeypatch):
+    monkeypatch.setattr(cola, "ABANDONO", 0.5)
+    monkeypatch.setattr(cola, "LATIDO", 0.05)
+    trabajo_id = _encolar()
+
+    def generar(ambito, entrada):
+        # Otro proceso busca trabajo mientras este sigue generando
+        otra = cola._conectar()
+        try:
+            for _ in range(8):
+                time.sleep(0.1)
+                assert cola._tomar(otra) is None
+        finally:
+            otra.close()
+        return b"%PDF", {"tiempos": ""}
+
+    monkeypatch.setattr(cola, "generar", generar)
+    assert cola.procesar_siguiente(conn)
+    assert cola.estado(trabajo_id)["estado"] == "hecho"
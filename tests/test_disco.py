@@ -0,0 +1,26 @@
+import os
+import time
+
+from afecciones.disco import CacheDisco
+
+
+def test_caducidad_por_fecha_de_descarga(tmp_path):
+    cache = CacheDisco(str(tmp_path), ttl=60, cuota=10**6)
+    cache.guardar("a", b"contenido")
+    assert cache.leer("a") == b"contenido"
+    antiguo = time.time() - 120
+    os.utime(cache.ruta("a"), (time.time(), antiguo))
+    assert cache.leer("a") is None
+    assert cache.leer("no existe") is None
+
+
+def test_cuota_borra_primero_las_menos_usadas(tmp_path):
+    cache = CacheDisco(str(tmp_path), ttl=3600, cuota=250)
+    ahora = time.time()
+    for n, clave in enumerate(["vieja", "media", "nueva"]):
+        cache.guardar(clave, b"x" * 100)
+        os.utime(cache.ruta(clave), (ahora - 100 + n * 10, ahora))
+    cache.leer("vieja")  # usada ahora: pasa a ser la más reciente
+    cache.purgar()
+    assert cache.leer("media") is None
+    assert cache.leer("vieja") is not None and cache.leer("nueva") is not None
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from afecciones import etapas
+
+
+def test_dependencias_reciben_los_resultados_y_en_paralelo():
+    barrera = threading.Barrier(2, timeout=5)  # a y b solo pasan si corren a la vez
+
+    def a():
+        barrera.wait()
+        return 1
+
+    def b():
+        barrera.wait()
+        return 2
+
+    resultado = etapas.ejecutar({
+        "suma": (lambda a, b: a + b, ["a", "b"]),
+        "a": (a, []),
+        "b": (b, []),
+    })
+    assert resultado["resultados"] == {"a": 1, "b": 2, "suma": 3}
+    assert not resultado["errores"] and set(resultado["tiempos"]) == {"a", "b", "suma"}
+
+
+def test_error_se_propaga_a_las_dependientes():
+    def falla():
+        raise RuntimeError("servicio caído")
+
+    resultado = etapas.ejecutar({
+        "afecciones": (falla, []),
+        "datos": (lambda afecciones: afecciones, ["afecciones"]),
+        "pdf": (lambda datos: datos, ["datos"]),
+        "mapa": (lambda: "mapa", []),
+    })
+    assert resultado["resultados"] == {"mapa": "mapa"}
+    assert str(resultado["errores"]["afecciones"]) == "servicio caído"
+    assert "afecciones" in str(resultado["errores"]["datos"]) and "datos" in str(resultado["errores"]["pdf"])
+
+
+def test_dependencias_circulares_o_inexistentes():
+    with pytest.raises(ValueError, match="circulares"):
+        etapas.ejecutar({"a": (lambda b: b, ["b"]), "b": (lambda a: a, ["a"]), "c": (lambda: 0, [])})
+    with pytest.raises(ValueError, match="inexistentes"):
+        etapas.ejecutar({"a": (lambda x: x, ["x"])})
+
+
+def test_al_esperar_ve_el_progreso_y_el_final():
+    vistos = []
+    liberar = threading.Event()
+    resultado = etapas.ejecutar(
+        {"rapida": (lambda: 1, []), "lenta": (lambda: liberar.wait(5), [])},
+        al_esperar=lambda resultados: (vistos.append(dict(resultados)), liberar.set()),
+        intervalo=0.01,
+    )
+    assert vistos[-1] == resultado["resultados"] == {"rapida": 1, "lenta": True}
@@ -0,0 +1,45 @@
+import io
+import json
+
+import pytest
+import shapely
+
+from afecciones import geometrias
+
+
+def test_texto_en_grados_se_reproyecta_a_utm():
+    geometria = geometrias.leer_texto("POLYGON((-1.13 37.98, -1.12 37.98, -1.12 37.99, -1.13 37.99, -1.13 37.98))")
+    xmin, ymin, _, _ = geometria.bounds
+    assert 600000 < xmin < 700000 and 4200000 < ymin < 4210000
+    assert 90 < geometria.area / 10000 < 105  # 0,01° x 0,01° ~ 880 m x 1110 m
+
+
+def test_vertices_y_geometria_invalida_reparada():
+    cuadrado = geometrias.leer_texto("650000;4200000\n650100;4200000\n650100;4200100\n650000;4200100")
+    assert cuadrado.area == pytest.approx(10000)
+    # Pajarita autointersecada: se repara en dos triángulos
+    pajarita = geometrias.leer_texto("POLYGON((650000 4200000, 650100 4200100, 650100 4200000, 650000 4200100, 650000 4200000))")
+    assert pajarita.is_valid and pajarita.area == pytest.approx(5000)
+
+
+def test_rechaza_lo_que_no_es_superficie_o_no_cabe():
+    with pytest.raises(ValueError, match="polígono"):
+        geometrias.leer_texto("LINESTRING(650000 4200000, 650100 4200100)")
+    with pytest.raises(ValueError, match="Formato no admitido"):
+        geometrias.leer_fichero(io.BytesIO(b""), "proyecto.dwg")
+
+
+def test_fichero_geojson_y_paso_por_la_sesion(monkeypatch):
+    monkeypatch.setattr(geometrias, "LOTE_ELEMENTOS", 1)  # se une lote a lote
+    contenido = json.dumps({
+        "type": "FeatureCollection",
+        "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::25830"}},
+        "features": [
+            {"type": "Feature", "properties": {}, "geometry": shapely.geometry.mapping(shapely.box(x, 0, x + 100, 100))}
+            for x in (650000, 650100)
+        ],
+    }).encode()
+    geometria = geometrias.leer_fichero(io.BytesIO(contenido), "proyecto.geojson")
+    assert geometria.area == pytest.approx(20000)
+    _, recuperada = geometrias.desde_sesion(geometrias.a_sesion(geometria))
+    assert recuperada.equals(geometria)
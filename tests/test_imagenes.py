@@ -0,0 +1,29 @@
+from io import BytesIO
+
+from fpdf import FPDF
+from PIL import Image
+
+from afecciones import imagenes
+
+
+def _jpeg(ancho, alto):
+    buffer = BytesIO()
+    Image.new("RGB", (ancho, alto), (10, 120, 200)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_reducir_a_resolucion_de_impresion():
+    assert imagenes.reducir(Image.new("RGB", (2000, 1000)), 90).size == (531, 266)
+    pequena = Image.new("RGB", (100, 50))
+    assert imagenes.reducir(pequena, 90) is pequena
+
+
+def test_imagen_en_memoria_se_incrusta_tal_cual():
+    contenido = _jpeg(300, 200)
+    pdf = FPDF()
+    pdf.add_page()
+    imagenes.imagen(pdf, "mapa", contenido, x=10, y=10, w=90)
+    imagenes.imagen(pdf, "mapa", contenido, x=10, y=120, w=90)
+    assert list(pdf.images) == ["mapa"] and pdf.images["mapa"]["f"] == "DCTDecode"
+    salida = pdf.output(dest="S").encode("latin-1")
+    assert salida.count(b"/Subtype /Image") == 1 and contenido in salida
@@ -0,0 +1,60 @@
+import json
+
+import shapely
+from shapely.geometry import box, mapping
+
+from afecciones.indice import IndiceAfecciones
+
+
+def _pieza(*elementos):
+    return json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": id_elemento, "geometry": mapping(geom), "properties": {"nombre": id_elemento}}
+            for id_elemento, geom in elementos
+        ],
+    }).encode()
+
+
+def test_consulta_por_capa_y_deduplica_por_id():
+    indice = IndiceAfecciones()
+    # El mismo elemento en dos celdas vecinas cuenta una vez
+    indice.actualizar_capa("enp", {"0_0": _pieza(("enp.1", box(0, 0, 20, 10))), "1_0": _pieza(("enp.1", box(0, 0, 20, 10)))})
+    indice.actualizar_capa("zepa", {"0_0": _pieza(("zepa.1", box(100, 100, 110, 110)))})
+
+    resultado = indice.query(box(5, 5, 6, 6))
+    # Un solo árbol para las dos capas, con el elemento repetido una vez
+    assert indice._combinado["claves"] == ["enp", "zepa"] and len(indice._combinado["geometrias"]) == 2
+    assert list(resultado["enp"].index) == ["enp.1"] and resultado["zepa"].empty
+    assert set(indice.query(box(5, 5, 6, 6), claves={"zepa"})) == {"zepa"}
+    assert indice.limites("enp") == (0.0, 0.0, 20.0, 10.0)
+
+    en_geoms, filas = indice.pares([box(200, 200, 201, 201), box(105, 105, 106, 106)])["zepa"]
+    assert list(en_geoms) == [1] and list(filas) == [0]
+
+
+def test_geometrias_preparadas_al_crear_el_bloque():
+    indice = IndiceAfecciones()
+    indice.actualizar_capa("enp", {"0_0": _pieza(("enp.1", box(0, 0, 10, 10)))})
+    geometrias = indice._capas["enp"]["bloque"]["geometrias"]
+    assert shapely.is_prepared(geometrias).all()
+    consulta = box(1, 1, 2, 2)
+    indice.query(consulta)
+    # La geometría de la consulta (compartida entre hilos) no se modifica
+    assert not shapely.is_prepared(consulta)
+
+
+def test_descarta_las_piezas_menos_usadas():
+    indice = IndiceAfecciones(max_piezas=2, retencion=0)
+    for n in range(5):
+        indice.actualizar_capa("enp", {f"{n}_0": _pieza((f"enp.{n}", box(n * 10, 0, n * 10 + 5, 5)))})
+    assert list(indice._capas["enp"]["piezas"]) == ["3_0", "4_0"]
+    assert sorted(indice.bloque("enp").index) == ["enp.3", "enp.4"]
+
+
+def test_no_descarta_piezas_recien_usadas():
+    indice = IndiceAfecciones(max_piezas=1, retencion=300)
+    indice.actualizar_capa("enp", {"0_0": _pieza(("enp.0", box(0, 0, 5, 5)))})
+    indice.actualizar_capa("enp", {"1_0": _pieza(("enp.1", box(10, 0, 15, 5)))})
+    # La primera puede estar a mitad de una consulta: se conserva
+    assert len(indice.bloque("enp")) == 2
@@ -0,0 +1,50 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from shapely.geometry import Point
+
+from afecciones import anticipo, avisos, capas, cola, informe_pdf, red
+
+
+def test_calculo_anticipado_sin_terminar_no_bloquea_el_informe(monkeypatch):
+    monkeypatch.setattr(informe_pdf, "precargar_leyendas", lambda plazo: "en el hilo del informe")
+    liberar = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as ejecutor:
+        atascado = ejecutor.submit(liberar.wait)
+        time.sleep(0.05)  # ya en marcha: no se puede cancelar
+        etapas = informe_pdf.etapas_informe(
+            {}, 0, 0, 0, 0, ("", "", ""), None, None, "carm", red.Plazo(0.2), anticipadas={"leyendas": atascado},
+        )
+        inicio = time.monotonic()
+        assert etapas["leyendas"][0]() == "en el hilo del informe"
+        assert time.monotonic() - inicio < 1
+        liberar.set()
+
+
+def test_los_avisos_del_calculo_anticipado_se_muestran_al_usarlo(monkeypatch):
+    mostrados = []
+    monkeypatch.setattr(avisos.st, "warning", mostrados.append)
+    hecho = Future()
+    hecho.set_result(("leyendas listas", [("warning", "Servicio no disponible: vp")]))
+    etapas = informe_pdf.etapas_informe(
+        {}, 0, 0, 0, 0, ("", "", ""), None, None, "carm", red.Plazo(5), anticipadas={"leyendas": hecho},
+    )
+    assert etapas["leyendas"][0]() == "leyendas listas"
+    assert mostrados == ["Servicio no disponible: vp"]
+
+
+def test_el_calculo_anticipado_recoge_sus_avisos(monkeypatch):
+    def caida(url, _plazo=None):
+        raise ConnectionError("sin red")
+
+    monkeypatch.setattr(capas, "_descargar_capa", caida)
+    resultado, recogidos = anticipo._con_avisos(capas.descargar_capa, "http://wfs.local/capa_anticipada")
+    assert resultado is None and recogidos == [("warning", "Servicio no disponible: capa_anticipada")]
+
+
+def test_sin_anticipo_con_la_cola_activa(monkeypatch):
+    monkeypatch.setattr(cola, "ACTIVA", True)
+    sesion = {}
+    assert anticipo.lanzar(sesion, Point(650000, 4200000), 650000, 4200000) == {}
+    assert "anticipo" not in sesion
@@ -0,0 +1,23 @@
+from afecciones import informes
+
+
+def test_cada_sesion_descarta_solo_sus_informes(monkeypatch):
+    monkeypatch.setattr(informes, "MAX_POR_SESION", 2)
+    mio = informes.guardar(b"mio", sesion="a")
+    # Muchos informes de otras sesiones no desplazan el de esta
+    for n in range(50):
+        informes.guardar(b"otro %d" % n, sesion=f"otra-{n}")
+    assert informes.leer(mio) == b"mio"
+
+    segundo = informes.guardar(b"segundo", sesion="a")
+    tercero = informes.guardar(b"tercero", sesion="a")
+    assert informes.leer(mio) is None
+    assert informes.leer(segundo) == b"segundo" and informes.leer(tercero) == b"tercero"
+
+
+def test_caducan_los_que_nadie_lee(monkeypatch):
+    antiguo = informes.guardar(b"antiguo", sesion="b")
+    monkeypatch.setattr(informes, "INFORMES_TTL", 0)
+    reciente = informes.guardar(b"reciente", sesion="c")
+    assert informes.leer(antiguo) is None
+    assert informes.leer(reciente) == b"reciente"
@@ -0,0 +1,42 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from afecciones import lote, parcelas
+
+
+@pytest.fixture(autouse=True)
+def _sin_cache():
+    lote._parcelario.cache_clear()
+    yield
+    lote._parcelario.cache_clear()
+
+
+def test_parcela_con_ceros_a_la_izquierda(monkeypatch):
+    gdf = gpd.GeoDataFrame(
+        {"MASA": ["007", "7"], "PARCELA": [12, 13]}, geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1)], crs="EPSG:25830"
+    )
+    monkeypatch.setattr(parcelas, "cargar_parcelario", lambda *args, **kwargs: gdf)
+    parcelario = lote._parcelario("carm", "MURCIA", "")
+    assert list(lote._buscar_parcela(parcelario, "7", "012").index) == [0]
+    assert list(lote._buscar_parcela(parcelario, "07", "13.0").index) == [1]
+    assert lote._buscar_parcela(parcelario, "7", "14") is None
+
+
+def test_parcelario_no_disponible_no_queda_en_cache(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(parcelas, "cargar_parcelario", lambda *args, **kwargs: llamadas.append(kwargs["plazo"]))
+    for _ in range(2):
+        with pytest.raises(parcelas.ParcelarioNoDisponible):
+            lote._parcelario("carm", "MURCIA", "")
+    assert len(llamadas) == 2 and llamadas[0].segundos == parcelas.PLAZO_PARCELARIO
+
+
+def test_parcela_no_encontrada_es_un_error(monkeypatch, tmp_path):
+    gdf = gpd.GeoDataFrame({"MASA": [7], "PARCELA": [12]}, geometry=[box(0, 0, 1, 1)], crs="EPSG:25830")
+    monkeypatch.setattr(parcelas, "cargar_parcelario", lambda *args, **kwargs: gdf)
+    fila = {"municipio": "MURCIA", "poligono": "7", "parcela": "99", "x": "650000", "y": "4200000"}
+    registro = lote.procesar_fila(1, fila, "carm", str(tmp_path))
+    # No se cae al punto X/Y con la etiqueta de una parcela que no se ha comprobado
+    assert registro["estado"] == "error" and "7/99" in registro["error"]
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,87 @@
+from io import BytesIO
+from types import SimpleNamespace
+
+import geopandas as gpd
+from PIL import Image
+from shapely.geometry import box
+
+from afecciones import mapas, red, wms
+
+
+def test_mapa_con_leyenda_remota_no_se_cachea(monkeypatch):
+    llamadas = []
+
+    def html_mapa(*args):
+        llamadas.append(args)
+        return "<html></html>"
+
+    monkeypatch.setattr(mapas, "_html_mapa", html_mapa)
+    monkeypatch.setattr(wms, "leyenda_data_uri", wms.url_leyenda)  # servidor WMS caído
+    for _ in range(2):
+        assert mapas.crear_mapa(-1.1, 37.6, ["ZEPA"])[0] == "<html></html>"
+    assert len(llamadas) == 2
+
+    monkeypatch.setattr(wms, "leyenda_data_uri", lambda capa: "data:image/png;base64,")
+    for _ in range(2):
+        mapas.crear_mapa(-1.1, 37.6, ["ZEPA"])
+    assert len(llamadas) == 3
+
+
+def test_proxy_sin_url_publica_no_se_usa(monkeypatch):
+    monkeypatch.setattr(wms, "PROXY_PUERTO", 8765)
+    monkeypatch.setattr(wms, "PROXY_URL", None)
+    arrancados = []
+    monkeypatch.setattr(wms, "iniciar_proxy", lambda: arrancados.append(True))
+    assert wms.url_teselas().startswith(wms.WMS_ORIGEN) and not arrancados
+
+
+def test_localizacion_y_teselas_osm_en_disco(monkeypatch):
+    descargas = []
+
+    def get(url, plazo=None, **kwargs):
+        descargas.append(url)
+        return SimpleNamespace(status_code=200, content=b"png")
+
+    monkeypatch.setattr(red, "get", get)
+    mapa = mapas.StaticMapRed(10, 10, url_template=mapas.URL_TESELAS_OSM)
+    url = mapas.URL_TESELAS_OSM.format(z=16, x=1, y=2)
+    assert mapa.get(url, timeout=5) == (200, b"png") and mapa.get(url) == (200, b"png")
+    assert descargas == [url]
+
+    renderizados = []
+
+    def render(self, zoom=None):
+        renderizados.append(zoom)
+        return Image.new("RGB", (800, 600), (200, 200, 200))
+
+    monkeypatch.setattr(mapas.StaticMapRed, "render", render)
+    primera = mapas.imagen_localizacion(-1.123, 37.456)
+    assert mapas.imagen_localizacion(-1.123, 37.456) == primera and renderizados == [16]
+    # A resolución de impresión: 90 mm a 150 ppp
+    assert Image.open(BytesIO(primera)).width == 531
+
+
+def test_mapa_tematico_sin_red(monkeypatch):
+    zepa = gpd.GeoDataFrame({"site_name": ["X"]}, geometry=[box(600000, 4200000, 600400, 4200400)], crs="EPSG:25830")
+    pedidas = []
+
+    def elementos_cercanos(bounds, claves):
+        pedidas.append(claves)
+        return {"zepa": zepa}
+
+    monkeypatch.setattr(mapas, "elementos_cercanos", elementos_cercanos)
+    png = Image.open(BytesIO(mapas.imagen_tematica(box(600300, 4200300, 600500, 4200500))))
+    assert png.format == "PNG" and png.mode == "P" and png.width == 531
+    assert pedidas == [list(mapas.CAPAS_TEMATICO)]
+    colores = {color for _, color in png.convert("RGB").getcolors(maxcolors=4096)}
+    assert mapas.COLOR_PARCELA in colores
+
+
+def test_mapa_web_en_memoria(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wms, "leyenda_data_uri", lambda capa: f"data:image/png;base64,{capa}")
+    parcela = gpd.GeoDataFrame(geometry=[box(650000, 4160000, 650100, 4160100)], crs="EPSG:25830")
+    html, afecciones = mapas.crear_mapa(-1.3, 37.6, ["ZEPA"], parcela)
+    assert afecciones == ["ZEPA"] and "<html>" in html.lower()
+    assert "data:image/png;base64," in html and '"FeatureCollection"' in html
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,67 @@
+import re
+import zlib
+
+import pytest
+from shapely.geometry import box
+
+from afecciones import paginas_pdf
+from afecciones.capas import CAPAS
+from afecciones.informe_pdf import datos_informe, generar_pdf
+
+X, Y = 650000, 4200000
+PARCELA = box(X - 50, Y - 50, X + 50, Y + 50)
+SIN_MAPAS = {"localizacion": None, "tematica": None}
+
+
+def _datos(**solicitante):
+    resultados = {clave: {"texto": f"No afecta a {capa['nombre']}", "filas": None} for clave, capa in CAPAS.items()}
+    return datos_informe(solicitante, X, Y, "MULA", "12", "34", resultados)
+
+
+def _texto_pdf(contenido):
+    """Flujos de contenido del PDF ya descomprimidos."""
+    flujos = re.findall(rb"stream\n(.*?)\nendstream", contenido, re.S)
+    return "".join(zlib.decompress(flujo).decode("latin1") for flujo in flujos if flujo.startswith(b"x"))
+
+
+def _texto_cacheado():
+    return "".join("".join(cuerpo["paginas"]) for cuerpo in paginas_pdf._cuerpos.values())
+
+
+@pytest.fixture(autouse=True)
+def _vaciar_cuerpos():
+    paginas_pdf._cuerpos.clear()
+    yield
+    paginas_pdf._cuerpos.clear()
+
+
+def test_reutiliza_paginas_con_otro_solicitante():
+    primero = generar_pdf(_datos(nombre="Ana", dni="11111111H"), X, Y, PARCELA, "carm", mapas=SIN_MAPAS)[0]
+    assert len(paginas_pdf._cuerpos) == 1
+    assert "11111111H" not in _texto_cacheado()
+
+    segundo = generar_pdf(_datos(nombre="Luis", dni="22222222J"), X, Y, PARCELA, "carm", mapas=SIN_MAPAS)[0]
+    assert "22222222J" in _texto_pdf(segundo) and "11111111H" not in _texto_pdf(segundo)
+    # Páginas 2..N copiadas tal cual del primer informe
+    assert _texto_cacheado() and _texto_cacheado() in _texto_pdf(segundo)
+    assert _texto_cacheado() in _texto_pdf(primero)
+
+
+def test_no_guarda_paginas_si_la_primera_se_desborda():
+    direccion = "Calle de prueba con un nombre larguísimo número 12345 " * 40
+    datos = _datos(nombre="Ana", apellidos="Pérez", dni="33333333P", **{"dirección": direccion})
+    pdf = generar_pdf(datos, X, Y, PARCELA, "carm", mapas=SIN_MAPAS)[0]
+
+    assert "33333333P" in _texto_pdf(pdf)
+    assert not paginas_pdf._cuerpos
+    for dato in ("33333333P", "Ana", "Calle de prueba"):
+        assert dato not in _texto_cacheado()
+
+
+def test_no_reutiliza_si_la_primera_se_desborda():
+    generar_pdf(_datos(nombre="Ana", dni="11111111H"), X, Y, PARCELA, "carm", mapas=SIN_MAPAS)
+    direccion = "Calle de prueba con un nombre larguísimo número 12345 " * 40
+    pdf = generar_pdf(_datos(nombre="Luis", dni="44444444A", **{"dirección": direccion}), X, Y, PARCELA, "carm", mapas=SIN_MAPAS)[0]
+
+    # Informe completo: la numeración de las páginas del cuerpo sigue a la página 1 desbordada
+    assert "44444444A" in _texto_pdf(pdf) and "11111111H" not in _texto_pdf(pdf)
@@ -0,0 +1,53 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from afecciones import parcelas
+
+
+@pytest.fixture
+def descargas(monkeypatch):
+    parcelas._parcelario_cacheado.clear()
+    llamadas = []
+
+    def preparar(*resultados):
+        pendientes = list(resultados)
+
+        def cargar(ambito, municipio, provincia=None, plazo=None):
+            llamadas.append(plazo.segundos)
+            return pendientes.pop(0)
+
+        monkeypatch.setattr(parcelas, "cargar_parcelario", cargar)
+        return llamadas
+
+    yield preparar
+    parcelas._parcelario_cacheado.clear()
+
+
+def _gdf():
+    return gpd.GeoDataFrame(
+        {"MASA": [1, 1], "PARCELA": [5, 7]}, geometry=[box(0, 0, 10, 10), box(10, 0, 20, 10)], crs="EPSG:25830"
+    )
+
+
+def test_el_fallo_no_queda_en_cache(descargas):
+    llamadas = descargas(None, _gdf())
+    with pytest.raises(parcelas.ParcelarioNoDisponible):
+        parcelas.parcelario("carm", "MULA")
+    primero = parcelas.parcelario("carm", "MULA")
+    # Compartido, no una copia por acierto
+    assert len(primero) == 2 and parcelas.parcelario("carm", "MULA") is primero
+    # Segundo intento descargado, tercero de la caché; con su propio plazo, no el del informe
+    assert llamadas == [parcelas.PLAZO_PARCELARIO] * 2
+
+
+def test_geometria_finca_une_las_parcelas():
+    seleccion, geometria = parcelas.geometria_finca(_gdf(), [(1, 5), (1, 7)], 0, 0)
+    assert len(seleccion) == 2 and geometria.area == 200
+    seleccion, geometria = parcelas.geometria_finca(_gdf(), [(2, 5)], 3, 4)
+    assert seleccion is None and geometria.geom_type == "Point"
+
+
+def test_etiqueta_finca():
+    assert parcelas.etiqueta_finca([(12, 5), (12, 7)]) == ("12", "5, 7")
+    assert parcelas.etiqueta_finca([(12, 5), (14, 9)]) == ("12, 14", "12/5, 14/9")
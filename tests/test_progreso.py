@@ -0,0 +1,34 @@
+from afecciones import progreso
+from afecciones.capas import CAPAS
+
+
+class _Elemento:
+    def __init__(self):
+        self.llamadas = []
+
+    def markdown(self, texto):
+        self.llamadas.append(texto)
+
+    def progress(self, valor, text=None):
+        self.llamadas.append((valor, text))
+
+
+def test_actualizar_muestra_solo_las_capas_nuevas():
+    terminadas = []
+    panel = {
+        "lineas": {clave: _Elemento() for clave in CAPAS},
+        "barra": _Elemento(),
+        "capas": terminadas,
+        "mostradas": 0,
+        "etapas": ["afecciones", "pdf"],
+    }
+    terminadas.append(("zepa", {"texto": "No afecta a ZEPA"}, 1.234))
+    progreso.actualizar(panel, {})
+    terminadas.append(("lic", {"texto": "Indeterminado: LIC (servicio no disponible)"}, 3.0))
+    progreso.actualizar(panel, {"afecciones": None})
+
+    assert panel["lineas"]["zepa"].llamadas == ["✅ **ZEPA**: No afecta a ZEPA · 1.2 s"]
+    assert panel["lineas"]["lic"].llamadas[0].startswith("⚠️ **LIC**")
+    valor, texto = panel["barra"].llamadas[-1]
+    assert texto == f"Capas 2/{len(CAPAS)} · pendiente: PDF"
+    assert valor == 3 / (len(CAPAS) + 2)
@@ -0,0 +1,12 @@
+from PIL import Image
+
+from afecciones import recursos
+
+
+def test_logo_se_prepara_una_vez(tmp_path):
+    ruta = str(tmp_path / "logo.png")
+    Image.new("RGB", (1200, 300), (255, 255, 255)).save(ruta)
+    datos = recursos.logo(ruta)
+    assert recursos.logo(ruta) is datos
+    assert datos["ratio"] == 4 and datos["info"]["w"] <= 1200
+    assert recursos.logo(str(tmp_path / "no_existe.jpg")) is None
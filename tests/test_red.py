@@ -0,0 +1,96 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from afecciones import red
+
+
+class _Respuesta:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture
+def peticiones(monkeypatch):
+    """Sustituye la sesión con plazo: cada llamada consume la siguiente respuesta (o excepción)."""
+    llamadas = []
+
+    def preparar(*respuestas):
+        pendientes = list(respuestas)
+
+        def get(url, timeout=None, **kwargs):
+            llamadas.append(timeout)
+            respuesta = pendientes.pop(0) if len(pendientes) > 1 else pendientes[0]
+            if isinstance(respuesta, Exception):
+                raise respuesta
+            return respuesta
+
+        monkeypatch.setattr(red.session_plazo, "get", get)
+        return llamadas
+
+    return preparar
+
+
+def test_reintenta_y_devuelve_la_respuesta(peticiones, monkeypatch):
+    monkeypatch.setattr(red, "BACKOFF", 0.01)
+    llamadas = peticiones(requests.exceptions.ConnectionError("caído"), _Respuesta(503), _Respuesta(200))
+    assert red.get("http://prueba.local/a", plazo=red.Plazo(5)).status_code == 200
+    assert len(llamadas) == 3
+
+
+def test_los_reintentos_no_pasan_del_plazo(peticiones):
+    llamadas = peticiones(requests.exceptions.ConnectionError("caído"))
+    inicio = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        red.get("http://prueba.local/b", plazo=red.Plazo(1))
+    # La espera del primer reintento (2 s) ya no cabe: un solo intento y sin esperar
+    assert time.monotonic() - inicio < 0.5
+    assert len(llamadas) == 1
+    assert all(conexion <= 1 and lectura <= 1 for conexion, lectura in llamadas)
+
+
+def test_plazo_agotado_no_toma_el_turno_del_host(peticiones):
+    llamadas = peticiones(_Respuesta(200))
+    with pytest.raises(requests.exceptions.Timeout):
+        red.get("http://prueba.local/c", plazo=red.Plazo(0))
+    assert not llamadas
+    semaforo = red._semaforo("prueba.local")
+    # Libres todos los turnos del host
+    assert all(semaforo.acquire(blocking=False) for _ in range(red.LIMITE_POR_DEFECTO))
+    for _ in range(red.LIMITE_POR_DEFECTO):
+        semaforo.release()
+
+
+def test_sin_mas_intentos_devuelve_el_ultimo_estado(peticiones, monkeypatch):
+    monkeypatch.setattr(red, "BACKOFF", 0.01)
+    llamadas = peticiones(_Respuesta(503))
+    assert red.get("http://prueba.local/d", plazo=red.Plazo(5)).status_code == 503
+    assert len(llamadas) == red.REINTENTOS + 1
+
+
+def test_las_peticiones_reutilizan_la_conexion():
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        for _ in range(3):
+            assert red.get(f"http://127.0.0.1:{servidor.server_port}/capa").content == b"ok"
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    metricas = red.metricas()["127.0.0.1"]
+    assert metricas["peticiones"] == 3 and metricas["conexiones_abiertas"] == 1
@@ -0,0 +1,43 @@
+import json
+import time
+
+import numpy as np
+from shapely.geometry import Point, box, mapping
+
+from afecciones import rejilla
+
+
+def _capa(*geoms):
+    return json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": mapping(geom), "properties": {"nombre": f"e{n}"}}
+            for n, geom in enumerate(geoms)
+        ],
+    }).encode()
+
+
+def test_dentro_fuera_y_frontera():
+    rejilla.construir("prueba_celdas", _capa(box(0, 0, 1000, 1000)), tamano=250)
+    assert list(rejilla.consultar_punto("prueba_celdas", Point(500, 500))["nombre"]) == ["e0"]
+    assert rejilla.consultar_punto("prueba_celdas", Point(5000, 5000)).empty
+    assert rejilla.consultar_punto("prueba_celdas", Point(999, 500)) is not None
+
+
+def test_rejilla_construida_por_otro_proceso_se_usa_sin_reiniciar():
+    assert rejilla.consultar_punto("prueba_externa", Point(500, 500)) is None
+    # Otro proceso escribe la rejilla: la caché del módulo no se entera por construir()
+    datos, origen = rejilla.clasificar([box(0, 0, 1000, 1000)], 250)
+    ruta_npy, ruta_json = rejilla._rutas("prueba_externa")
+    np.save(ruta_npy, datos)
+    with open(ruta_json, "w", encoding="utf-8") as f:
+        json.dump({"origen": origen, "tamano": 250, "creado": time.time(), "elementos": [{"nombre": "e0"}]}, f)
+    assert list(rejilla.consultar_punto("prueba_externa", Point(500, 500))["nombre"]) == ["e0"]
+
+
+def test_caducidad_se_comprueba_en_cada_consulta(monkeypatch):
+    rejilla.construir("prueba_ttl", _capa(box(0, 0, 1000, 1000)), tamano=250)
+    assert rejilla.version("prueba_ttl") is not None
+    monkeypatch.setattr(rejilla, "REJILLA_TTL", -1)
+    assert rejilla.consultar_punto("prueba_ttl", Point(500, 500)) is None
+    assert rejilla.version("prueba_ttl") is None
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+from afecciones import red, teselas
+
+
+def test_celdas_cubren_la_envolvente():
+    assert teselas.celdas((4999, 0, 5001, 10), tamano=5000) == [(0, 0), (1, 0)]
+    assert teselas.bbox_celda(1, 2, tamano=5000) == (5000, 10000, 10000, 15000)
+
+
+def test_celda_se_descarga_una_vez(monkeypatch):
+    urls = []
+
+    def get(url, plazo=None):
+        urls.append(url)
+        return SimpleNamespace(content=b'{"type": "FeatureCollection", "features": []}', raise_for_status=lambda: None)
+
+    monkeypatch.setattr(red, "get", get)
+    bounds = (600100, 4200100, 600200, 4200200)
+    assert teselas.version_local("prueba", bounds) is None
+    primera = teselas.descargar("prueba", "http://wfs?x=1", bounds)
+    segunda = teselas.descargar("prueba", "http://wfs?x=1", bounds)
+    assert primera == segunda and len(urls) == 1
+    assert "bbox=600000,4200000,605000,4205000,EPSG:25830" in urls[0]
+    assert teselas.version_local("prueba", bounds) == primera[1]
+    assert teselas.estadisticas()["prueba"] == {"aciertos": 1, "fallos": 1}